@@ -1,6 +1,46 @@
-from .alphametic import Alphametic
-from .kenken import KenKen
-from .magnets import Magnets
-from .sudoku import Sudoku
-from .tents import Tents
-from .z3util import *
+"""
+Solvers for logic puzzles backed by Z3.
+
+The puzzle modules, and Z3 itself, are only imported when one of their names
+is first used, so short-lived programs such as python -m solvers pay only
+for the puzzle types they solve.  Names not listed in _EXPORTS come from
+z3util.
+"""
+import importlib
+
+# Submodule defining each name exported by the package
+_EXPORTS = {
+    'Alphametic': 'alphametic',
+    'SolutionCache': 'cache',
+    'KenKenGenerator': 'generator',
+    'SudokuGenerator': 'generator',
+    'KenKen': 'kenken',
+    'KenKenSession': 'kenken',
+    'Magnets': 'magnets',
+    'AddSolveHook': 'puzzle',
+    'NoSolutionError': 'puzzle',
+    'RemoveSolveHook': 'puzzle',
+    'SolveReport': 'puzzle',
+    'SolveTimeoutError': 'puzzle',
+    'Sudoku': 'sudoku',
+    'SudokuSession': 'sudoku',
+    'Tents': 'tents',
+}
+
+def __getattr__(name):
+    if name == '__all__':
+        # Only computed for "from solvers import *", which needs every module
+        z3util = importlib.import_module('.z3util', __name__)
+        return sorted(set(_EXPORTS) | set(n for n in vars(z3util) if not n.startswith('_')))
+    if name.startswith('__'):
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    module = importlib.import_module('.' + _EXPORTS.get(name, 'z3util'), __name__)
+    try:
+        value = getattr(module, name)
+    except AttributeError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name)) from None
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
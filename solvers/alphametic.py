@@ -1,63 +1,164 @@
 from z3 import *
+from .puzzle import NoSolutionError, Puzzle, Recorded
+from . import bruteforce
+import time
 
-# Future improvements: Chains of addition/subtraction/multiplication
-# to support cases like FOO+BAR+BAZ=DUCK
-
-class Alphametic:
+class Alphametic(Puzzle):
     """Solver for alphametic puzzles, where each letter maps uniquely to a 0-9 digit.  All letters must be in the A-Z range, case insensitive"""
-    def __init__(self, base=10):
-        """Creates empty square puzzle.  size: Size of the square"""
+
+    # Engines used by Solution().  AUTO uses the NumPy brute-force engine when
+    # NumPy is installed and there are at most AUTO_NUMPY_PERMUTATION_LIMIT
+    # digit assignments to try, and Z3 otherwise.
+    ENGINE_AUTO = 'auto'
+    ENGINE_NUMPY = 'numpy'
+    ENGINE_Z3 = 'z3'
+
+    AUTO_NUMPY_PERMUTATION_LIMIT = 3628800 # Ten letters in base 10
+
+    # The recorded method that adds each kind of constraint, used to describe clues
+    __METHODS = {
+        'sum': 'AddSum',
+        'product': 'AddProduct',
+        'subtraction': 'AddSubtraction',
+        'equation': 'AddEquation',
+        'division': 'AddDivision',
+        'known': 'AddKnownLetter',
+    }
+
+    def __init__(self, base=10, engine=ENGINE_AUTO, ctx=None):
+        """
+        Creates empty puzzle.
+
+        base: Number base of the alphametic numbers
+        engine: One of ENGINE_AUTO, ENGINE_NUMPY or ENGINE_Z3
+        ctx: Z3 Context for the puzzle (see Puzzle).  None uses Z3's global context
+        """
+        if engine not in (Alphametic.ENGINE_AUTO, Alphametic.ENGINE_NUMPY, Alphametic.ENGINE_Z3):
+            raise ValueError("Invalid engine: " + str(engine))
+        if engine == Alphametic.ENGINE_NUMPY and bruteforce.np is None:
+            raise ImportError("The numpy engine requires numpy")
         # A map from letter to z3 variable for its value
         self.letters = {}
-        self.solver = Solver()
         if not isinstance(base, int) or base < 2:
             raise ValueError("Invalid base: " + str(base))
         self.base = base
+        self.engine = engine
         self.prefix = "alphametic"
+        # The constraints as tuples (see bruteforce), so that either engine can solve them.
+        # The Z3 solver is only built once something needs it.
+        self.__constraints = []
+        self.__solver = None
+        # Number of letters covered by the constraints from __addNumericConstraints
+        self.__constrainedLetters = 0
+        # Number of equations added by AddEquation, used to name their carries
+        self.__equations = 0
+
+    @property
+    def solver(self):
+        if self.__solver is None:
+            self.__solver = self._newSolver()
+            for c in self.__constraints:
+                self.__addZ3Constraint(c)
+        return self.__solver
 
-    def Solution(self):
-        """Solves the grid and returns a dict of the values"""
+    def _solve(self):
+        """Solves the puzzle and returns a dict of letter to value"""
+        if not self.__usesNumpyEngine():
+            return super()._solve()
+        report = self._startReport(Alphametic.ENGINE_NUMPY)
+        started = time.perf_counter()
+        solutions = self.__solveNumpy(1)
+        report.check = time.perf_counter() - started
+        report.result = 'sat' if solutions else 'unsat'
+        self._finishReport(report)
+        if not solutions:
+            raise NoSolutionError(clues=self.__conflictingConstraints())
+        return solutions[0]
+
+    def Solutions(self, limit=None):
+        """Returns a list of up to limit solutions, or every solution if there is no limit"""
+        if self.__usesNumpyEngine():
+            return self.__solveNumpy(limit)
+        self._prepareSolver()
+        solver = self.solver
+        solutions = []
+        solver.push()
+        try:
+            while (limit is None or len(solutions) < limit) and self._checkDecided(solver) == sat:
+                model = solver.model()
+                solutions.append(self._extractSolution(model))
+                solver.add(Or([Not(l) for l in self._solutionLiterals(model)]))
+        finally:
+            solver.pop()
+        return solutions
+
+    def CountSolutions(self, limit=None):
+        """
+        Returns the number of distinct solutions, stopping as soon as limit have
+        been found.  With no limit every solution is enumerated.
+        """
+        if self.__usesNumpyEngine():
+            return len(self.__solveNumpy(limit))
+        return super().CountSolutions(limit)
+
+    def _prepareSolver(self):
         self.__addNumericConstraints()
-        self.solver.check()
-        m = self.solver.model()
+
+    def _extractSolution(self, m):
+        """Returns a dict of the values in the model"""
         answer = {}
         for letter in self.letters:
-            answer[letter] = int(str(m[self.letters[letter]]))
+            answer[letter] = m.eval(self.letters[letter], model_completion=True).as_long()
         return answer
 
+    def _cells(self):
+        return list(self.letters.values())
+
+    def _solutionLiterals(self, m):
+        return [v == m.eval(v, model_completion=True) for v in self.letters.values()]
+
+    @Recorded
     def AddSum(self, result, initial_value, addition):
         """
         Adds an addition constraint to the grid.
 
         result, initial_value, addition: Strings representing alphametic numbers or integer constants
         """
-        res = self.__parseArgument(result)
-        iv = self.__parseArgument(initial_value)
-        add = self.__parseArgument(addition)
-        self.solver.add(iv + add == res)
+        self.__addConstraint(('sum', result, initial_value, addition))
 
+    @Recorded
+    def AddEquation(self, addends, result):
+        """
+        Adds a constraint that the addends sum to the result, e.g.
+        AddEquation(["SEND", "MORE"], "MONEY").  The sum is encoded column by
+        column with a carry variable per column, which keeps each constraint
+        small however long the words or many the addends.  The leading letter
+        of every word longer than one letter is constrained to be nonzero.
+
+        addends: List of strings representing alphametic numbers or integer constants
+        result: String representing an alphametic number or integer constant
+        """
+        self.__addConstraint(('equation', list(addends), result))
+
+    @Recorded
     def AddProduct(self, result, initial_value, multiplier):
         """
         Adds a multiplication constraint to the grid.
 
         result, initial_value, multiplier: Strings representing alphametic numbers or integer constants
         """
-        res = self.__parseArgument(result)
-        iv = self.__parseArgument(initial_value)
-        mul = self.__parseArgument(multiplier)
-        self.solver.add(iv * mul == res)
+        self.__addConstraint(('product', result, initial_value, multiplier))
 
+    @Recorded
     def AddSubtraction(self, result, initial_value, reduction):
         """
         Adds a subtraction constraint to the grid.
 
         result, initial_value, reduction: Strings representing alphametic numbers or integer constants
         """
-        res = self.__parseArgument(result)
-        iv = self.__parseArgument(initial_value)
-        red = self.__parseArgument(reduction)
-        self.solver.add(iv - red == res)
+        self.__addConstraint(('subtraction', result, initial_value, reduction))
 
+    @Recorded
     def AddDivision(self, dividend, divisor, quotient=None, remainder=None):
         """
         Adds a division constraint.  Can add constraints for either the
@@ -67,25 +168,154 @@ class Alphametic:
         quotient: String representing alphametic numbers or integer constant.  None if no constraint required
         remainder: String representing alphametic numbers or integer constant.  None if no constraint required
         """
+        self.__addConstraint(('division', dividend, divisor, quotient, remainder))
+
+    @Recorded
+    def AddKnownLetter(self, letter, value):
+        """
+        Assigns a known value to a letter
+
+        letter: A single character string representing a letter
+        value: A numeric constant value known
+        """
+        self.__addConstraint(('known', letter, value))
+
+    def __z3Sum(self, result, initial_value, addition):
+        """Returns the Z3 constraints for an addition"""
+        res = self.__parseArgument(result)
+        iv = self.__parseArgument(initial_value)
+        add = self.__parseArgument(addition)
+        return [iv + add == res]
+
+    def __z3Product(self, result, initial_value, multiplier):
+        """Returns the Z3 constraints for a multiplication"""
+        res = self.__parseArgument(result)
+        iv = self.__parseArgument(initial_value)
+        mul = self.__parseArgument(multiplier)
+        return [iv * mul == res]
+
+    def __z3Subtraction(self, result, initial_value, reduction):
+        """Returns the Z3 constraints for a subtraction"""
+        res = self.__parseArgument(result)
+        iv = self.__parseArgument(initial_value)
+        red = self.__parseArgument(reduction)
+        return [iv - red == res]
 
+    def __z3Equation(self, addends, result):
+        """Returns the Z3 constraints for a sum of any number of addends, one column at a time"""
+        addends = [self.__digitsOf(arg) for arg in addends]
+        res = self.__digitsOf(result)
+        constraints = []
+        for digits in addends + [res]:
+            if len(digits) > 1 and not isinstance(digits[-1], int):
+                constraints.append(digits[-1] != 0)
+        # Each column sums to less than len(addends) * base, so carries stay below len(addends)
+        maxCarry = max(len(addends) - 1, 0)
+        columns = max([len(res)] + [len(digits) for digits in addends])
+        carry = 0
+        for i in range(columns):
+            if i == columns - 1:
+                nextCarry = 0
+            else:
+                nextCarry = Int('{}-carry{}-{}'.format(self.prefix, self.__equations, i), self.ctx)
+                constraints += [nextCarry >= 0, nextCarry <= maxCarry]
+            column = [digits[i] for digits in addends if i < len(digits)]
+            digit = res[i] if i < len(res) else 0
+            constraints.append(Sum(column + [carry]) == digit + self.base * nextCarry)
+            carry = nextCarry
+        self.__equations += 1
+        return constraints
+
+    def __z3Division(self, dividend, divisor, quotient=None, remainder=None):
+        """Returns the Z3 constraints for a quotient and/or remainder"""
         divid = self.__parseArgument(dividend)
         divis = self.__parseArgument(divisor)
-
+        constraints = []
         if quotient is not None:
             quot = self.__parseArgument(quotient)
-            self.solver.add(divid / divis == quot)
+            constraints.append(divid / divis == quot)
         if remainder is not None:
             rem = self.__parseArgument(remainder)
-            self.solver.add(divid % divis == rem)
+            constraints.append(divid % divis == rem)
+        return constraints
 
-    def AddKnownLetter(self, letter, value):
+    def __z3KnownLetter(self, letter, value):
+        """Returns the Z3 constraints for a known letter value"""
+        return [self.__variableForChar(letter[0]) == value]
+
+    def __addConstraint(self, constraint):
         """
-        Assigns a known value to a letter
+        Records a constraint, adding it to the Z3 solver if that has been built.
+        Raises ValueError, before anything is recorded, if the constraint
+        brings the number of distinct letters above the base.
+        """
+        # The letters in order of appearance, as the solution lists them
+        letters = dict.fromkeys(self.letters.keys())
+        for arg in bruteforce.ConstraintOperands(constraint):
+            if isinstance(arg, str):
+                letters.update(dict.fromkeys(self.__letterOf(c) for c in arg))
+            elif not isinstance(arg, int):
+                raise TypeError("Not a valid parameter type")
+        if constraint[0] == 'known':
+            letters[self.__letterOf(constraint[1][0])] = None
+        if len(letters) > self.base:
+            raise ValueError("More than {} distinct letters found: {}".format(self.base, ''.join(letters)))
+        for c in letters:
+            self.__variableForChar(c)
+        self.__constraints.append(constraint)
+        if self.__solver is not None:
+            self.__addZ3Constraint(constraint)
 
-        letter: A single character string representing a letter
-        value: A numeric constant value known
+    def __addZ3Constraint(self, constraint):
+        """Adds a recorded constraint to the Z3 solver as a clue"""
+        (kind, args) = (constraint[0], constraint[1:])
+        build = {
+            'sum': self.__z3Sum,
+            'product': self.__z3Product,
+            'subtraction': self.__z3Subtraction,
+            'equation': self.__z3Equation,
+            'division': self.__z3Division,
+            'known': self.__z3KnownLetter,
+        }[kind]
+        self._addClue(build(*args), self.__describe(constraint))
+
+    def __describe(self, constraint):
+        """Describes a recorded constraint as the call that added it"""
+        return '{}({})'.format(Alphametic.__METHODS[constraint[0]], ', '.join(map(repr, constraint[1:])))
+
+    def __usesNumpyEngine(self):
+        """Returns True if the puzzle should be solved with the NumPy brute-force engine"""
+        if self.engine == Alphametic.ENGINE_Z3 or self.__solver is not None:
+            return False
+        letters = list(self.letters.keys())
+        if not bruteforce.BruteForceSupported(letters, self.base, self.__constraints):
+            if self.engine == Alphametic.ENGINE_NUMPY:
+                raise ValueError("Puzzle is not supported by the numpy engine")
+            return False
+        if self.engine == Alphametic.ENGINE_NUMPY:
+            return True
+        return bruteforce.PermutationCount(self.base, len(letters)) <= Alphametic.AUTO_NUMPY_PERMUTATION_LIMIT
+
+    def __solveNumpy(self, limit):
+        """Returns up to limit solutions from the NumPy brute-force engine"""
+        return bruteforce.SolveBruteForce(list(self.letters.keys()), self.base, self.__constraints, limit)
+
+    def __conflictingConstraints(self):
+        """
+        Returns the descriptions of a minimal set of constraints that the NumPy
+        engine finds unsolvable.  Each constraint is dropped in turn and left
+        out if the others still have no solution.
         """
-        self.solver.add(self.__variableForChar(letter[0]) == value)
+        letters = list(self.letters.keys())
+        core = list(self.__constraints)
+        i = 0
+        while i < len(core):
+            rest = core[:i] + core[i + 1:]
+            if bruteforce.SolveBruteForce(letters, self.base, rest, 1):
+                i += 1
+            else:
+                core = rest
+        return [self.__describe(c) for c in core]
 
     def __parseArgument(self, arg):
         """Parses an argument - either an alphametic string or an integer constant - into a form consumable by Z3"""
@@ -95,6 +325,21 @@ class Alphametic:
             return arg      # TODO: I wonder if this will cause issues with non-constant-ness and we'll need to add new functions that take the integers
         raise TypeError("Not a valid parameter type")
 
+    def __digitsOf(self, arg):
+        """Returns the digits of an alphametic string or integer constant, least significant first"""
+        if isinstance(arg, str):
+            return [self.__variableForChar(c) for c in reversed(arg)]
+        if isinstance(arg, int):
+            if arg < 0:
+                raise ValueError("Negative constants are not supported: " + str(arg))
+            digits = []
+            while True:
+                arg, digit = divmod(arg, self.base)
+                digits.append(digit)
+                if arg == 0:
+                    return digits
+        raise TypeError("Not a valid parameter type")
+
     def __numberFromString(self, numStr):
         """Converts a string such as 'ABC' into its value i.e. base^2*A + base*B + C"""
         result = 0
@@ -102,20 +347,26 @@ class Alphametic:
             result = (result * self.base) + self.__variableForChar(numStr[i])
         return result
 
-    def __variableForChar(self, char):
-        """Ensures that the variable for a character exists and returns that variable"""
+    def __letterOf(self, char):
+        """Returns the upper case letter for a character, raising ValueError if it is not a letter"""
         c = str(char).upper()
         if len(c) != 1 or c < 'A' or c > 'Z':
-            raise ValueError("Invalid letter: " + char)
+            raise ValueError("Invalid letter: " + str(char))
+        return c
+
+    def __variableForChar(self, char):
+        """Ensures that the variable for a character exists and returns that variable"""
+        c = self.__letterOf(char)
         if not c in self.letters.keys():
-            self.letters[c] = Int(self.prefix + c)
+            self.letters[c] = Int(self.prefix + c, self.ctx)
         return self.letters[c]
 
     def __addNumericConstraints(self):
-        """Ensures that there are at most letters than the base size and that each is a distinct 0-n value"""
-        if len(self.letters) > self.base:
-            raise ValueError("More than " + self.base + " distinct letters found: " + self.letters.keys())
+        """Ensures that each letter is a distinct 0-n value.  __addConstraint keeps the letters to at most the base size"""
+        if len(self.letters) == self.__constrainedLetters:
+            return
         self.solver.add(Distinct(list(self.letters.values())))
-        for l in self.letters.values():
+        for l in list(self.letters.values())[self.__constrainedLetters:]:
             self.solver.add(Or([l == j for j in range(self.base)]))
+        self.__constrainedLetters = len(self.letters)
 
@@ -0,0 +1,340 @@
+"""
+Benchmark suite for the puzzle solvers.
+
+Run with: python -m solvers.bench [--output results.json] [--baseline old.json]
+
+Puzzles are generated from a fixed seed at increasing sizes.  Each solve is
+timed in three phases: constraint construction, solver.check() and model
+extraction.  Results are written as JSON and can be compared against a saved
+baseline, in which case the exit status is 1 if any case regressed.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from z3 import sat, get_version_string
+
+from .alphametic import Alphametic
+from .generator import LatinSquare, RandomCage
+from .kenken import KenKen
+from .magnets import Magnets
+from .sudoku import SYMBOLS, Sudoku
+from .tents import Tents
+from .z3util import BITVEC_ENCODING, INT_ENCODING, ONEHOT_ENCODING
+
+PUZZLES = ['sudoku', 'sudoku-native', 'kenken', 'kenken-table', 'magnets', 'tents', 'alphametic']
+ENCODINGS = [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]
+
+# Sizes benchmarked for each puzzle type
+SIZES = {
+    'sudoku': [2, 3, 4, 5],
+    'sudoku-native': [2, 3, 4],
+    'kenken': [4, 5, 6, 7, 8, 9],
+    'kenken-table': [4, 5, 6, 7, 8, 9],
+    'magnets': [6, 8, 10, 12],
+    'tents': [8, 10, 15, 20],
+    'alphametic': [3, 4, 5, 6, 7, 8],
+}
+
+# Puzzle types that do not take an encoding
+UNENCODED = {'sudoku-native', 'alphametic'}
+
+
+def SudokuGrid(dimension, rng):
+    """Returns a random solved sudoku grid as a list of rows"""
+    size = dimension * dimension
+
+    def shuffledGroups():
+        groups = list(range(dimension))
+        rng.shuffle(groups)
+        order = []
+        for g in groups:
+            members = list(range(g * dimension, (g + 1) * dimension))
+            rng.shuffle(members)
+            order.extend(members)
+        return order
+
+    digits = list(range(1, size + 1))
+    rng.shuffle(digits)
+    pattern = lambda r, c: (dimension * (r % dimension) + r // dimension + c) % size
+    rows = shuffledGroups()
+    cols = shuffledGroups()
+    return [[digits[pattern(r, c)] for c in cols] for r in rows]
+
+
+def GenerateSudoku(dimension, rng, clueFraction=0.45):
+    """Returns a puzzle string (see Sudoku.FromString) with about clueFraction of the cells given"""
+    grid = SudokuGrid(dimension, rng)
+    return ''.join(SYMBOLS[v - 1] if rng.random() < clueFraction else '.' for row in grid for v in row)
+
+
+def GenerateKenKen(size, rng, maxCage=4):
+    """Returns a list of (operation, target, cells) cages for a random puzzle"""
+    solution = LatinSquare(size, rng)
+    unassigned = set((x, y) for x in range(size) for y in range(size))
+    cages = []
+    for y in range(size):
+        for x in range(size):
+            if (x, y) not in unassigned:
+                continue
+            cells = [(x, y)]
+            unassigned.discard((x, y))
+            target = rng.randint(1, maxCage)
+            while len(cells) < target:
+                options = [(cx + dx, cy + dy) for (cx, cy) in cells
+                           for (dx, dy) in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                           if (cx + dx, cy + dy) in unassigned]
+                if not options:
+                    break
+                c = rng.choice(options)
+                unassigned.discard(c)
+                cells.append(c)
+            cages.append(RandomCage(cells, [solution[cy][cx] for (cx, cy) in cells], rng))
+    return cages
+
+
+def GenerateMagnets(size, rng):
+    """
+    Returns (columnPlus, columnMinus, rowPlus, rowMinus, pairs) for a random
+    size x size magnets puzzle.  size must be even.
+    """
+    # Start from horizontal dominoes and randomise by flipping 2x2 blocks
+    partner = {}
+    for y in range(size):
+        for x in range(0, size, 2):
+            partner[(x, y)] = (x + 1, y)
+            partner[(x + 1, y)] = (x, y)
+    for _ in range(size * size * 4):
+        x = rng.randrange(size - 1)
+        y = rng.randrange(size - 1)
+        a, b, c, d = (x, y), (x + 1, y), (x, y + 1), (x + 1, y + 1)
+        if partner[a] == b and partner[c] == d:
+            partner[a], partner[c] = c, a
+            partner[b], partner[d] = d, b
+        elif partner[a] == c and partner[b] == d:
+            partner[a], partner[b] = b, a
+            partner[c], partner[d] = d, c
+    pairs = sorted(set(tuple(sorted((p, q))) for (p, q) in partner.items()))
+
+    grid = {}
+    for (p, q) in rng.sample(pairs, len(pairs)):
+        for (vp, vq) in rng.sample([(Magnets.PLUS, Magnets.MINUS), (Magnets.MINUS, Magnets.PLUS)], 2):
+            if _magnetFits(grid, p, vp) and _magnetFits(grid, q, vq):
+                grid[p], grid[q] = vp, vq
+                break
+        else:
+            grid[p] = grid[q] = Magnets.EMPTY
+    count = lambda cells, v: sum(1 for c in cells if grid[c] == v)
+    cols = [[(x, y) for y in range(size)] for x in range(size)]
+    rows = [[(x, y) for x in range(size)] for y in range(size)]
+    return ([count(c, Magnets.PLUS) for c in cols], [count(c, Magnets.MINUS) for c in cols],
+            [count(r, Magnets.PLUS) for r in rows], [count(r, Magnets.MINUS) for r in rows], pairs)
+
+
+def _magnetFits(grid, cell, value):
+    """Returns True if no orthogonal neighbour of cell already holds value"""
+    x, y = cell
+    return all(grid.get(n) != value for n in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)))
+
+
+def GenerateTents(size, rng, density=0.2):
+    """Returns (treeGrid, columnCounts, rowCounts) for a random size x size tents puzzle"""
+    tents = set()
+    trees = set()
+    for _ in range(int(size * size * density)):
+        x = rng.randrange(size)
+        y = rng.randrange(size)
+        if (x, y) in trees or any((x + dx, y + dy) in tents for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+            continue
+        options = [(x + dx, y + dy) for (dx, dy) in ((1, 0), (-1, 0), (0, 1), (0, -1))
+                   if 0 <= x + dx < size and 0 <= y + dy < size
+                   and (x + dx, y + dy) not in tents and (x + dx, y + dy) not in trees]
+        if options:
+            tents.add((x, y))
+            trees.add(rng.choice(options))
+    treeGrid = [[(x, y) in trees for x in range(size)] for y in range(size)]
+    columnCounts = [sum(1 for (x, y) in tents if x == c) for c in range(size)]
+    rowCounts = [sum(1 for (x, y) in tents if y == r) for r in range(size)]
+    return treeGrid, columnCounts, rowCounts
+
+
+def GenerateAlphametic(length, rng):
+    """Returns (result, first, second) words for a random addition with length-letter operands"""
+    letters = list('ABCDEFGHIJ')
+    rng.shuffle(letters)
+    low = 10 ** (length - 1)
+    first = rng.randrange(low, 10 * low)
+    second = rng.randrange(low, 10 * low)
+    word = lambda n: ''.join(letters[int(d)] for d in str(n))
+    return word(first + second), word(first), word(second)
+
+
+def Build(puzzle, size, encoding, rng):
+    """Generates a puzzle and returns a solver instance with all of its constraints added"""
+    if puzzle in ('sudoku', 'sudoku-native'):
+        definition = GenerateSudoku(size, rng)
+        engine = Sudoku.ENGINE_NATIVE if puzzle == 'sudoku-native' else Sudoku.ENGINE_Z3
+        s = Sudoku.FromString(definition, engine, encoding)
+        if engine == Sudoku.ENGINE_Z3:
+            s.solver # The Z3 constraints are built on first use; count them as construction
+        return s
+    if puzzle in ('kenken', 'kenken-table'):
+        cages = GenerateKenKen(size, rng)
+        k = KenKen(size, encoding, KenKen.CAGES_TABLE if puzzle == 'kenken-table' else KenKen.CAGES_ARITHMETIC)
+        for (operation, target, cells) in cages:
+            k.AddCage(operation, target, cells)
+        return k
+    if puzzle == 'magnets':
+        columnPlus, columnMinus, rowPlus, rowMinus, pairs = GenerateMagnets(size, rng)
+        m = Magnets(columnPlus, columnMinus, rowPlus, rowMinus, encoding)
+        for (first, second) in pairs:
+            m.AddPair(first, second)
+        return m
+    if puzzle == 'tents':
+        treeGrid, columnCounts, rowCounts = GenerateTents(size, rng)
+        return Tents(treeGrid, columnCounts, rowCounts, encoding)
+    if puzzle == 'alphametic':
+        result, first, second = GenerateAlphametic(size, rng)
+        a = Alphametic()
+        a.AddSum(result=result, initial_value=first, addition=second)
+        return a
+    raise ValueError('Unknown puzzle type: ' + str(puzzle))
+
+
+def RunCase(puzzle, size, encoding, seed, timeout=None):
+    """Generates and solves one puzzle, returning a dict of phase timings in seconds"""
+    rng = random.Random('{}-{}-{}'.format(puzzle, size, seed))
+    start = time.perf_counter()
+    p = Build(puzzle, size, encoding, rng)
+    if puzzle == 'sudoku-native':
+        constructed = time.perf_counter()
+        p.Solution()
+        checked = time.perf_counter()
+        result = 'sat'
+        extracted = checked
+    else:
+        p._prepareSolver()
+        if timeout is not None:
+            p.solver.set('timeout', int(timeout * 1000))
+        constructed = time.perf_counter()
+        result = p.solver.check()
+        checked = time.perf_counter()
+        if result == sat:
+            p._extractSolution(p.solver.model())
+        extracted = time.perf_counter()
+        result = str(result)
+    return {
+        'puzzle': puzzle,
+        'size': size,
+        'encoding': None if puzzle in UNENCODED else encoding,
+        'seed': seed,
+        'result': result,
+        'construct': constructed - start,
+        'check': checked - constructed,
+        'extract': extracted - checked,
+        'total': extracted - start,
+    }
+
+
+def CaseKey(case):
+    """Returns the key identifying a benchmark case across runs"""
+    return (case['puzzle'], case['size'], case['encoding'], case['seed'])
+
+
+def RunSuite(puzzles=PUZZLES, encodings=ENCODINGS, sizes=None, seeds=(0,), repeat=1, timeout=None, log=None):
+    """
+    Runs the benchmark cases and returns a list of result dicts.  When a case
+    is repeated the fastest run is kept.
+
+    sizes: Optional dict of puzzle type to list of sizes, overriding SIZES
+    log: Optional callable taking each result as it completes
+    """
+    results = []
+    for puzzle in puzzles:
+        for size in (sizes or SIZES)[puzzle]:
+            for encoding in ([None] if puzzle in UNENCODED else encodings):
+                for seed in seeds:
+                    runs = [RunCase(puzzle, size, encoding, seed, timeout) for _ in range(repeat)]
+                    best = min(runs, key=lambda r: r['total'])
+                    if log is not None:
+                        log(best)
+                    results.append(best)
+    return results
+
+
+def Compare(results, baseline, threshold=1.25, minimum=0.005):
+    """
+    Compares results against baseline results and returns a list of
+    (result, baselineResult) pairs for cases whose total time grew by more
+    than the threshold ratio.  Cases faster than minimum seconds in both
+    runs are ignored as noise.
+    """
+    old = dict((CaseKey(b), b) for b in baseline)
+    regressions = []
+    for r in results:
+        b = old.get(CaseKey(r))
+        if b is None or max(r['total'], b['total']) < minimum:
+            continue
+        if r['total'] > b['total'] * threshold or (b['result'] == 'sat' and r['result'] != 'sat'):
+            regressions.append((r, b))
+    return regressions
+
+
+def _label(case):
+    return '{:<14} {:>3} {:<7} seed {:<3}'.format(case['puzzle'], case['size'], case['encoding'] or '-', case['seed'])
+
+
+def _format(case):
+    return '{} {:>8} construct {:9.4f}s  check {:9.4f}s  extract {:9.4f}s'.format(
+        _label(case), case['result'], case['construct'], case['check'], case['extract'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m solvers.bench', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--puzzles', default=','.join(PUZZLES), help='Comma separated puzzle types')
+    parser.add_argument('--encodings', default=','.join(ENCODINGS), help='Comma separated Z3 encodings')
+    parser.add_argument('--max-size', type=int, help='Skip sizes above this value')
+    parser.add_argument('--seeds', type=int, default=1, help='Number of puzzles per size')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per puzzle; the fastest is kept')
+    parser.add_argument('--timeout', type=float, default=60, help='Z3 timeout per check in seconds')
+    parser.add_argument('--output', help='Write JSON results to this file')
+    parser.add_argument('--baseline', help='Compare against JSON results from an earlier run')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Slowdown ratio counted as a regression')
+    args = parser.parse_args(argv)
+
+    puzzles = args.puzzles.split(',')
+    for puzzle in puzzles:
+        if puzzle not in SIZES:
+            parser.error('Unknown puzzle type: ' + puzzle)
+    sizes = dict((p, [s for s in SIZES[p] if args.max_size is None or s <= args.max_size]) for p in SIZES)
+    log = lambda case: print(_format(case), flush=True)
+    results = RunSuite(puzzles, args.encodings.split(','), sizes, range(args.seeds), args.repeat, args.timeout, log)
+
+    if args.output:
+        report = {
+            'python': platform.python_version(),
+            'z3': get_version_string(),
+            'platform': platform.platform(),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = Compare(results, baseline, args.threshold)
+        for (r, b) in regressions:
+            print('REGRESSION {} {:.4f}s -> {:.4f}s ({} -> {})'.format(
+                _label(r), b['total'], r['total'], b['result'], r['result']))
+        if regressions:
+            return 1
+        print('No regressions against ' + args.baseline)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+"""
+Pure-Python Sudoku engine using per-row, column and box candidate bitmasks.
+
+Digit v is represented by the bit 1 << (v - 1).  Cells are indexed y*size+x.
+The search always branches on the empty cell with the fewest candidates, which
+also performs naked-single propagation for free.
+"""
+from functools import lru_cache
+
+if hasattr(int, 'bit_count'):
+    def _popcount(mask):
+        return mask.bit_count()
+else:
+    def _popcount(mask):
+        return bin(mask).count('1')
+
+
+@lru_cache(maxsize=None)
+def _unitTables(dimension):
+    """
+    Returns (rowOf, colOf, boxOf, units) where the first three map a cell index
+    to its units and units lists the cells of every row, column and box
+    """
+    size = dimension * dimension
+    rowOf = []
+    colOf = []
+    boxOf = []
+    for i in range(size * size):
+        y, x = divmod(i, size)
+        rowOf.append(y)
+        colOf.append(x)
+        boxOf.append((y // dimension) * dimension + x // dimension)
+    units = []
+    for table in (rowOf, colOf, boxOf):
+        for u in range(size):
+            units.append([i for i in range(size * size) if table[i] == u])
+    return rowOf, colOf, boxOf, units
+
+
+def SolveBitmask(dimension, clues, limit=1, maxNodes=None):
+    """
+    Searches for solutions of a classic sudoku.
+
+    dimension: Size of each sub-square.  For a standard sudoku the dimension is 3
+    clues: Iterable of (x, y, value) tuples
+    limit: Stop after this many solutions have been found.  None finds them all
+    maxNodes: Give up after this many search steps.  None searches exhaustively
+
+    Returns a list of at most limit solutions, each a flat list indexed y*size+x,
+    or None if maxNodes was reached first
+    """
+    if limit is not None and limit < 1:
+        return []
+    size = dimension * dimension
+    full = (1 << size) - 1
+    rowOf, colOf, boxOf, units = _unitTables(dimension)
+    rows = [0] * size
+    cols = [0] * size
+    boxes = [0] * size
+    grid = [0] * (size * size)
+
+    for (x, y, val) in clues:
+        if not (0 <= x < size and 0 <= y < size and 1 <= val <= size):
+            return []
+        i = y * size + x
+        if grid[i] == val:
+            continue
+        bit = 1 << (val - 1)
+        r, c, b = rowOf[i], colOf[i], boxOf[i]
+        if grid[i] or (rows[r] | cols[c] | boxes[b]) & bit:
+            return []
+        grid[i] = val
+        rows[r] |= bit
+        cols[c] |= bit
+        boxes[b] |= bit
+
+    # Placed digits of each unit, in the same order as units
+    placed = [rows, cols, boxes]
+    candidates = [0] * (size * size)
+    empties = [i for i in range(size * size) if grid[i] == 0]
+    remaining = len(empties)
+    solutions = []
+    # Each stack entry is (cell index, candidates not yet tried for that cell)
+    stack = []
+    depth = 0
+    nodes = 0
+
+    while True:
+        choice = None
+        if depth == remaining:
+            solutions.append(grid.copy())
+            if limit is not None and len(solutions) >= limit:
+                return solutions
+        else:
+            choice = _chooseCell(grid, empties, depth, remaining, candidates, full,
+                                 rows, cols, boxes, rowOf, colOf, boxOf, units, placed, size)
+        if choice:
+            nodes += 1
+            if maxNodes is not None and nodes > maxNodes:
+                return None
+            bestPos, mask = choice
+            empties[depth], empties[bestPos] = empties[bestPos], empties[depth]
+            i = empties[depth]
+            bit = mask & -mask
+            stack.append((i, mask & ~bit))
+            grid[i] = bit.bit_length()
+            rows[rowOf[i]] |= bit
+            cols[colOf[i]] |= bit
+            boxes[boxOf[i]] |= bit
+            depth += 1
+            continue
+
+        # Backtrack to the most recent cell that still has untried candidates
+        while stack:
+            i, untried = stack.pop()
+            depth -= 1
+            bit = 1 << (grid[i] - 1)
+            rows[rowOf[i]] &= ~bit
+            cols[colOf[i]] &= ~bit
+            boxes[boxOf[i]] &= ~bit
+            grid[i] = 0
+            if untried:
+                bit = untried & -untried
+                stack.append((i, untried & ~bit))
+                grid[i] = bit.bit_length()
+                rows[rowOf[i]] |= bit
+                cols[colOf[i]] |= bit
+                boxes[boxOf[i]] |= bit
+                depth += 1
+                break
+        else:
+            return solutions
+
+
+def _chooseCell(grid, empties, depth, remaining, candidates, full,
+                rows, cols, boxes, rowOf, colOf, boxOf, units, placed, size):
+    """
+    Picks the next cell to branch on.  Returns (position in empties, candidate
+    mask to try), or None if some cell or digit has no remaining place.
+
+    Naked singles and the cell with the fewest candidates come from one scan of
+    the empty cells.  If every cell has at least two candidates, the units are
+    scanned for hidden singles: digits that fit in only one cell of a unit.
+    """
+    bestPos = depth
+    bestMask = 0
+    bestCount = size + 1
+    for pos in range(depth, remaining):
+        i = empties[pos]
+        mask = full & ~(rows[rowOf[i]] | cols[colOf[i]] | boxes[boxOf[i]])
+        candidates[i] = mask
+        count = _popcount(mask)
+        if count < bestCount:
+            if count <= 1:
+                return (pos, mask) if count else None
+            bestPos, bestMask, bestCount = pos, mask, count
+
+    for u, cells in enumerate(units):
+        unitPlaced = placed[u // size][u % size]
+        if unitPlaced == full:
+            continue
+        once = 0
+        twice = 0
+        for i in cells:
+            if not grid[i]:
+                mask = candidates[i]
+                twice |= once & mask
+                once |= mask
+        if (once | unitPlaced) != full:
+            return None
+        single = once & ~twice
+        if single:
+            bit = single & -single
+            for i in cells:
+                if not grid[i] and candidates[i] & bit:
+                    return (empties.index(i, depth), bit)
+    return (bestPos, bestMask)
+
+
+def Deduce(dimension, clues):
+    """
+    Applies logical deductions to a classic sudoku until none makes progress:
+    naked singles, hidden singles, pointing pairs and box/line reduction.
+
+    dimension: Size of each sub-square.  For a standard sudoku the dimension is 3
+    clues: Iterable of (x, y, value) tuples
+
+    Returns a flat list indexed y*size+x of each cell's candidate mask, where
+    a single bit means the cell is solved, or None if the clues contradict
+    each other
+    """
+    size = dimension * dimension
+    full = (1 << size) - 1
+    rowOf, colOf, boxOf, units = _unitTables(dimension)
+    peers = _peerTables(dimension)
+    candidates = [full] * (size * size)
+    solved = [False] * (size * size)
+    # Cells whose single candidate still has to be removed from their peers
+    pending = []
+    for (x, y, val) in clues:
+        if not (0 <= x < size and 0 <= y < size and 1 <= val <= size):
+            return None
+        i = y * size + x
+        bit = 1 << (val - 1)
+        if not candidates[i] & bit:
+            return None
+        candidates[i] = bit
+        pending.append(i)
+    # For each box, its cells grouped by row and by column, and the reverse
+    lines = _boxLineTables(dimension)
+
+    def eliminate(cells, mask):
+        """Removes mask from the candidates of cells.  Returns False on a contradiction"""
+        for j in cells:
+            c = candidates[j]
+            if c & mask:
+                c &= ~mask
+                if not c:
+                    return False
+                candidates[j] = c
+                if not c & (c - 1):
+                    pending.append(j)
+        return True
+
+    while True:
+        # Naked singles: a solved cell's digit leaves all of its peers
+        while pending:
+            i = pending.pop()
+            if solved[i]:
+                continue
+            solved[i] = True
+            if not eliminate(peers[i], candidates[i]):
+                return None
+        # Hidden singles: a digit with one place left in a unit goes there
+        for cells in units:
+            once = 0
+            twice = 0
+            for i in cells:
+                c = candidates[i]
+                twice |= once & c
+                once |= c
+            if once != full:
+                return None
+            single = once & ~twice
+            while single:
+                bit = single & -single
+                single &= ~bit
+                for i in cells:
+                    if candidates[i] & bit and candidates[i] != bit:
+                        candidates[i] = bit
+                        pending.append(i)
+        if pending:
+            continue
+        # Pointing pairs: a digit confined to one line of a box leaves the
+        # rest of that line.  Box/line reduction: a digit confined to one box
+        # of a line leaves the rest of that box.
+        for (inner, outer) in lines:
+            masks = []
+            for segment in inner:
+                m = 0
+                for i in segment:
+                    m |= candidates[i]
+                masks.append(m)
+            for (k, segment) in enumerate(inner):
+                others = 0
+                for (l, m) in enumerate(masks):
+                    if l != k:
+                        others |= m
+                confined = masks[k] & ~others
+                if confined and not eliminate(outer[k], confined):
+                    return None
+        if not pending:
+            return candidates
+
+
+@lru_cache(maxsize=None)
+def _peerTables(dimension):
+    """Returns, for each cell index, the other cells sharing its row, column or box"""
+    rowOf, colOf, boxOf, units = _unitTables(dimension)
+    size = dimension * dimension
+    peers = []
+    for i in range(size * size):
+        cells = set(units[rowOf[i]]) | set(units[size + colOf[i]]) | set(units[2 * size + boxOf[i]])
+        cells.discard(i)
+        peers.append(sorted(cells))
+    return peers
+
+
+@lru_cache(maxsize=None)
+def _boxLineTables(dimension):
+    """
+    Returns a list of (inner, outer) pairs, one per box and direction and one
+    per line and direction.  inner splits a box into its row (or column)
+    segments, or a line into its box segments; outer[k] lists the cells that
+    lose the digits confined to inner[k]: the rest of that line, or the rest
+    of that box.
+    """
+    rowOf, colOf, boxOf, units = _unitTables(dimension)
+    size = dimension * dimension
+    tables = []
+    for (lineOf, offset) in ((rowOf, 0), (colOf, size)):
+        for b in range(size):
+            box = units[2 * size + b]
+            keys = sorted(set(lineOf[i] for i in box))
+            inner = [[i for i in box if lineOf[i] == k] for k in keys]
+            outer = [[i for i in units[offset + k] if boxOf[i] != b] for k in keys]
+            tables.append((inner, outer))
+        for line in range(size):
+            cells = units[offset + line]
+            keys = sorted(set(boxOf[i] for i in cells))
+            inner = [[i for i in cells if boxOf[i] == k] for k in keys]
+            outer = [[i for i in units[2 * size + k] if lineOf[i] != line] for k in keys]
+            tables.append((inner, outer))
+    return tables
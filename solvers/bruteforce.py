@@ -0,0 +1,235 @@
+"""
+Vectorised brute-force engine for alphametics using NumPy.
+
+Candidate assignments of distinct digits to letters are generated as blocks of
+rows, one column per letter.  The value of every word is a matrix product of
+a block with the words' place-value weights, and each constraint becomes a
+boolean mask over the rows of the block.
+
+Constraints are the tuples recorded by Alphametic:
+    ('sum', result, first, second)           first + second == result
+    ('subtraction', result, first, second)   first - second == result
+    ('product', result, first, second)       first * second == result
+    ('division', dividend, divisor, quotient, remainder)
+    ('known', letter, value)
+    ('equation', addends, result)            sum(addends) == result, leading letters nonzero
+where each operand is an alphametic string or an integer constant.  quotient
+and remainder may be None.
+"""
+from functools import lru_cache
+from itertools import combinations
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Upper bound on the rows of each block of assignments
+CHUNK_SIZE = 1 << 18
+
+# Largest intermediate value that can be held without overflowing int64
+_MAX_VALUE = (1 << 63) - 1
+
+
+def PermutationCount(base, letters):
+    """Returns the number of ways to assign distinct digits in [0, base) to the letters"""
+    count = 1
+    for i in range(letters):
+        count *= max(base - i, 0)
+    return count
+
+
+def BruteForceSupported(letters, base, constraints):
+    """
+    Returns True if NumPy is available and every value the constraints need
+    fits in an int64
+    """
+    if np is None or len(letters) > base:
+        return False
+    bound = lambda arg: base ** len(arg) - 1 if isinstance(arg, str) else abs(arg)
+    for c in constraints:
+        kind = c[0]
+        if kind in ('sum', 'subtraction'):
+            largest = max(bound(c[1]), bound(c[2]) + bound(c[3]))
+        elif kind == 'product':
+            largest = max(bound(c[1]), bound(c[2]) * bound(c[3]))
+        elif kind == 'division':
+            largest = max(bound(c[1]), bound(c[2]) * max(bound(c[3] or 0), 1) + bound(c[4] or 0))
+        elif kind == 'equation':
+            largest = max(bound(c[2]), sum(bound(arg) for arg in c[1]))
+        else:
+            continue
+        if largest > _MAX_VALUE:
+            return False
+    return True
+
+
+def SolveBruteForce(letters, base, constraints, limit=None, chunkSize=CHUNK_SIZE):
+    """
+    Searches every assignment of distinct digits to the letters.
+
+    letters: List of upper case letters
+    base: Number base of the puzzle
+    constraints: List of constraint tuples, see the module documentation
+    limit: Stop after this many solutions have been found.  None finds them all
+
+    Returns a list of at most limit solutions, each a dict of letter to digit
+    """
+    if limit is not None and limit < 1:
+        return []
+    index = dict((letter, i) for (i, letter) in enumerate(letters))
+    allowed = np.ones((len(letters), base), dtype=bool)
+    for c in constraints:
+        if c[0] == 'known':
+            allowed[index[c[1][0].upper()]] &= np.arange(base) == c[2]
+        elif c[0] == 'equation':
+            for arg in list(c[1]) + [c[2]]:
+                if isinstance(arg, str) and len(arg) > 1:
+                    allowed[index[arg[0].upper()], 0] = False
+
+    # Linear constraints fold into a single row of weights w with w.x == constant.
+    # The others need the values of their words, so those get a column each.
+    linear = []
+    checks = []
+    columns = {}
+    coefficients = lambda arg: _coefficients(arg, index, base)
+    for c in constraints:
+        kind = c[0]
+        if kind in ('sum', 'subtraction', 'equation'):
+            if kind == 'sum':
+                terms = [(1, c[2]), (1, c[3]), (-1, c[1])]
+            elif kind == 'subtraction':
+                terms = [(1, c[2]), (-1, c[3]), (-1, c[1])]
+            else:
+                terms = [(1, arg) for arg in c[1]] + [(-1, c[2])]
+            w = np.zeros(len(letters), dtype=np.int64)
+            constant = 0
+            for (sign, arg) in terms:
+                if isinstance(arg, str):
+                    w += sign * coefficients(arg)
+                else:
+                    constant -= sign * arg
+            linear.append((w, constant))
+        elif kind in ('product', 'division'):
+            checks.append(c)
+            for arg in ConstraintOperands(c):
+                if isinstance(arg, str):
+                    columns.setdefault(arg.upper(), len(columns))
+    weights = np.zeros((len(letters), len(columns)), dtype=np.int64)
+    for (word, column) in columns.items():
+        weights[:, column] = coefficients(word)
+
+    solutions = []
+    for block in _assignments(allowed, base, chunkSize):
+        for (w, constant) in linear:
+            block = block[block @ w == constant]
+        if checks and len(block):
+            values = block @ weights
+            value = lambda arg: values[:, columns[arg.upper()]] if isinstance(arg, str) else arg
+            mask = np.ones(len(block), dtype=bool)
+            for c in checks:
+                mask &= _constraintMask(c, value)
+            block = block[mask]
+        for row in block:
+            solutions.append(dict(zip(letters, row.tolist())))
+            if limit is not None and len(solutions) >= limit:
+                return solutions
+    return solutions
+
+
+def ConstraintOperands(constraint):
+    """Returns the alphametic strings and constants a constraint refers to"""
+    kind = constraint[0]
+    if kind == 'known':
+        return []
+    if kind == 'equation':
+        return list(constraint[1]) + [constraint[2]]
+    return [arg for arg in constraint[1:] if arg is not None]
+
+
+def _coefficients(word, index, base):
+    """Returns the place-value weight of each letter in a word"""
+    w = np.zeros(len(index), dtype=np.int64)
+    for (power, char) in enumerate(reversed(word.upper())):
+        w[index[char]] += base ** power
+    return w
+
+
+def _constraintMask(constraint, value):
+    """Returns a boolean mask of the rows that satisfy a product or division constraint"""
+    kind = constraint[0]
+    if kind == 'product':
+        return value(constraint[2]) * value(constraint[3]) == value(constraint[1])
+    dividend, divisor, quotient, remainder = constraint[1:]
+    divid = value(dividend)
+    divis = value(divisor)
+    nonzero = divis != 0
+    # Divide by 1 where the divisor is zero; those rows are masked out anyway
+    safe = np.where(nonzero, divis, 1)
+    mask = nonzero
+    if quotient is not None:
+        mask = mask & (divid // safe == value(quotient))
+    if remainder is not None:
+        mask = mask & (divid % safe == value(remainder))
+    return mask
+
+
+@lru_cache(maxsize=None)
+def _permutationTable(size):
+    """Returns every permutation of range(size) as the rows of an int8 array, in lexicographic order"""
+    table = np.zeros((1, 0), dtype=np.int8)
+    for m in range(1, size + 1):
+        previous = table
+        count = len(previous)
+        table = np.empty((m * count, m), dtype=np.int8)
+        for first in range(m):
+            rows = table[first * count:(first + 1) * count]
+            rows[:, 0] = first
+            rows[:, 1:] = previous + (previous >= first)
+    table.flags.writeable = False
+    return table
+
+
+def _digitType(base):
+    """Returns the smallest signed integer dtype that holds every digit of the base"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if base - 1 <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _assignments(allowed, base, chunkSize):
+    """
+    Yields arrays of shape (rows, letters) holding every assignment of distinct
+    digits where letter i only takes the digits marked in allowed[i].  Letters
+    with a single allowed digit are fixed up front; each choice of digits for
+    the other letters is combined with a cached table of their orderings.
+    """
+    letters = len(allowed)
+    fixed = {}
+    for i in range(letters):
+        candidates = np.flatnonzero(allowed[i])
+        if len(candidates) == 0:
+            return
+        if len(candidates) == 1:
+            fixed[i] = int(candidates[0])
+    if len(set(fixed.values())) < len(fixed):
+        return
+    free = [i for i in range(letters) if i not in fixed]
+    pool = [d for d in range(base) if d not in fixed.values()]
+    restricted = [(column, allowed[i]) for (column, i) in enumerate(free) if not allowed[i].all()]
+    table = _permutationTable(len(free))
+    dtype = _digitType(base)
+    for digits in combinations(pool, len(free)):
+        digits = np.array(digits, dtype=dtype)
+        # Skip digit sets that leave some restricted letter without a value
+        if any(not mask[digits].any() for (column, mask) in restricted):
+            continue
+        for start in range(0, len(table), chunkSize):
+            choice = digits[table[start:start + chunkSize]]
+            for (column, mask) in restricted:
+                choice = choice[mask[choice[:, column]]]
+            block = np.empty((len(choice), letters), dtype=dtype)
+            block[:, free] = choice
+            for (i, digit) in fixed.items():
+                block[:, i] = digit
+            yield block
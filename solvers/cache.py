@@ -0,0 +1,96 @@
+"""On-disk cache of puzzle solutions, shared between processes through SQLite"""
+import json
+import sqlite3
+import threading
+import time
+
+
+class SolutionCache:
+    """
+    Maps puzzle keys (see puzzle.CacheKey) to JSON-serialisable solutions.
+    Each entry's size is its key and JSON solution in bytes.  Once the entries
+    add up to more than maxBytes the least recently used ones are evicted.  A
+    cache can be shared by threads, and by processes that open the same file.
+    """
+
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, path, maxBytes=DEFAULT_MAX_BYTES):
+        """
+        path: SQLite database file, created if necessary.  ':memory:' keeps
+            the cache in this process only
+        maxBytes: Total size of the entries kept before evicting
+        """
+        if maxBytes < 1:
+            raise ValueError('Invalid maxBytes: ' + str(maxBytes))
+        self.path = path
+        self.maxBytes = maxBytes
+        self.__lock = threading.Lock()
+        self.__connection = connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(solutions)')]
+        if columns and 'size' not in columns:
+            # A cache from before entries had sizes: start it afresh
+            connection.execute('DROP TABLE solutions')
+        connection.execute('CREATE TABLE IF NOT EXISTS solutions '
+                           '(key TEXT PRIMARY KEY, solution TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)')
+        # The running total of the entries' sizes, kept up to date by triggers so
+        # that every process sharing the file sees the same total
+        connection.execute('CREATE TABLE IF NOT EXISTS usage (total INTEGER NOT NULL)')
+        connection.execute('INSERT INTO usage SELECT COALESCE(SUM(size), 0) FROM solutions '
+                           'WHERE NOT EXISTS (SELECT 1 FROM usage)')
+        connection.execute('CREATE TRIGGER IF NOT EXISTS solutions_insert AFTER INSERT ON solutions '
+                           'BEGIN UPDATE usage SET total = total + NEW.size; END')
+        connection.execute('CREATE TRIGGER IF NOT EXISTS solutions_update AFTER UPDATE OF size ON solutions '
+                           'BEGIN UPDATE usage SET total = total - OLD.size + NEW.size; END')
+        connection.execute('CREATE TRIGGER IF NOT EXISTS solutions_delete AFTER DELETE ON solutions '
+                           'BEGIN UPDATE usage SET total = total - OLD.size; END')
+
+    def Get(self, key):
+        """Returns the solution stored for key, or None"""
+        with self.__lock:
+            row = self.__connection.execute('SELECT solution FROM solutions WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.__connection.execute('UPDATE solutions SET used = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def Put(self, key, solution):
+        """Stores a solution, evicting the least recently used ones if the cache is full"""
+        value = json.dumps(solution, separators=(',', ':'))
+        size = len(key.encode('utf-8')) + len(value.encode('utf-8'))
+        with self.__lock:
+            connection = self.__connection
+            connection.execute('INSERT INTO solutions (key, solution, size, used) VALUES (?, ?, ?, ?) '
+                               'ON CONFLICT (key) DO UPDATE SET solution = excluded.solution, '
+                               'size = excluded.size, used = excluded.used', (key, value, size, time.time()))
+            excess = connection.execute('SELECT total FROM usage').fetchone()[0] - self.maxBytes
+            if excess > 0:
+                evicted = []
+                for (oldKey, oldSize) in connection.execute('SELECT key, size FROM solutions ORDER BY used'):
+                    evicted.append((oldKey,))
+                    excess -= oldSize
+                    if excess <= 0:
+                        break
+                connection.executemany('DELETE FROM solutions WHERE key = ?', evicted)
+
+    def Clear(self):
+        """Removes every stored solution"""
+        with self.__lock:
+            self.__connection.execute('DELETE FROM solutions')
+
+    def StoredBytes(self):
+        """Returns the total size of the stored entries"""
+        with self.__lock:
+            return self.__connection.execute('SELECT total FROM usage').fetchone()[0]
+
+    def __len__(self):
+        with self.__lock:
+            return self.__connection.execute('SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def Close(self):
+        """Closes the database connection"""
+        with self.__lock:
+            self.__connection.close()
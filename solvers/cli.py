@@ -0,0 +1,155 @@
+"""
+Solves puzzles read as JSON Lines and writes one line of JSON per puzzle.
+
+Run with: python -m solvers [--cache cache.db] [--report] [FILE ...]
+
+Each input line is an object with a "type" (one of TYPES) and:
+    "puzzle": A sudoku string, as read by Sudoku.FromString, or
+    "gameId": A KenKen, Magnets or Tents game ID (see gameid), or
+    "arguments": Constructor arguments by name, such as {"size": 4}
+"arguments" may also be given with "puzzle" or "gameId", for example to pick
+an "encoding".  "recipe" is an optional list of [method, args, kwargs] calls
+made on the puzzle afterwards, such as [["AddCage", ["+", 3, [[0,0],[1,0]]]]];
+two-number arrays in it are passed as (x,y) tuples.
+
+Each output line has the input's "id" (by default the line number), then
+"solution", "engine" and "seconds" (see SolveReport.Total) for a solved
+puzzle or "error" if it could not be solved.  Lines are written as soon as
+each puzzle is solved.  Only the modules for the puzzle types in the input
+are imported.  The exit status is 1 if any puzzle failed.
+"""
+import argparse
+import importlib
+import json
+import sys
+import time
+
+# Module and class for each puzzle type
+TYPES = {
+    'alphametic': ('alphametic', 'Alphametic'),
+    'kenken': ('kenken', 'KenKen'),
+    'magnets': ('magnets', 'Magnets'),
+    'sudoku': ('sudoku', 'Sudoku'),
+    'tents': ('tents', 'Tents'),
+}
+
+
+def BuildPuzzle(definition):
+    """Constructs a puzzle from a decoded input line (see the module documentation)"""
+    kind = definition.get('type')
+    if kind not in TYPES:
+        raise ValueError('Unknown puzzle type: ' + str(kind))
+    (module, name) = TYPES[kind]
+    cls = getattr(importlib.import_module('.' + module, __package__), name)
+    arguments = definition.get('arguments', {})
+    if 'puzzle' in definition:
+        if kind != 'sudoku':
+            raise ValueError('"puzzle" is only read for sudoku, use "gameId" or "arguments"')
+        puzzle = cls.FromString(definition['puzzle'], **arguments)
+    elif 'gameId' in definition:
+        if not hasattr(cls, 'FromGameId'):
+            raise ValueError('There are no game IDs for ' + kind)
+        puzzle = cls.FromGameId(definition['gameId'], **arguments)
+    else:
+        puzzle = cls(**arguments)
+    for call in definition.get('recipe', []):
+        if not isinstance(call, list) or not 1 <= len(call) <= 3:
+            raise ValueError('Invalid recipe call: ' + json.dumps(call))
+        (method, args, kwargs) = (call + [[], {}][len(call) - 1:])
+        if not isinstance(method, str) or method.startswith('_') or not callable(getattr(puzzle, method, None)):
+            raise ValueError('Invalid recipe call: ' + json.dumps(call))
+        getattr(puzzle, method)(*_coordinates(args), **_coordinates(kwargs))
+    return puzzle
+
+
+def SolveLines(lines, cache=None, report=False):
+    """
+    Solves each JSON line and yields the output objects.  Blank lines are
+    skipped but counted for the default ids.
+
+    cache: Optional SolutionCache passed to Solution()
+    report: Add each puzzle's SolveReport to the output
+    """
+    for (number, line) in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            definition = json.loads(line)
+            if not isinstance(definition, dict):
+                raise ValueError('Expected a JSON object')
+        except ValueError as e:
+            yield {'id': number, 'error': '{}: {}'.format(type(e).__name__, e)}
+            continue
+        definition.setdefault('id', number)
+        yield SolveDefinition(definition, cache, report)
+
+
+def SolveDefinition(definition, cache=None, report=False, solve=None):
+    """
+    Solves one decoded input line and returns its output object.  cache and
+    report are as for SolveLines.
+
+    solve: Optional callable returning (solution, engine), used instead of
+        building the puzzle with BuildPuzzle
+    """
+    output = {'id': definition.get('id')}
+    try:
+        if solve is not None:
+            started = time.perf_counter()
+            (output['solution'], output['engine']) = solve()
+            output['seconds'] = time.perf_counter() - started
+        else:
+            puzzle = BuildPuzzle(definition)
+            output['solution'] = puzzle.Solution(cache=cache)
+            output['engine'] = puzzle.lastReport.engine
+            output['seconds'] = puzzle.lastReport.Total()
+            if report:
+                output['report'] = puzzle.lastReport.AsDict()
+    except Exception as e:
+        output = {'id': output['id'], 'error': '{}: {}'.format(type(e).__name__, e)}
+    return output
+
+
+def _coordinates(value):
+    """Turns the two-number arrays of a decoded recipe into (x,y) tuples"""
+    if isinstance(value, list):
+        if len(value) == 2 and all(type(v) is int for v in value):
+            return tuple(value)
+        return [_coordinates(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _coordinates(v)) for (k, v) in value.items())
+    return value
+
+
+def _readLines(paths):
+    """Yields the lines of each file in turn, reading stdin for '-' or when there are no files"""
+    for path in paths or ['-']:
+        if path == '-':
+            yield from sys.stdin
+        else:
+            with open(path) as f:
+                yield from f
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m solvers', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('files', nargs='*', metavar='FILE', help="JSON Lines files of puzzles.  Defaults to stdin ('-')")
+    parser.add_argument('--cache', help='SQLite solution cache file (see SolutionCache)')
+    parser.add_argument('--report', action='store_true', help='Include the full SolveReport of each puzzle')
+    args = parser.parse_args(argv)
+
+    cache = None
+    if args.cache:
+        from .cache import SolutionCache
+        cache = SolutionCache(args.cache)
+    failed = False
+    try:
+        for output in SolveLines(_readLines(args.files), cache, args.report):
+            failed = failed or 'error' in output
+            sys.stdout.write(json.dumps(output, separators=(',', ':')) + '\n')
+            sys.stdout.flush()
+    finally:
+        if cache is not None:
+            cache.Close()
+    return 1 if failed else 0
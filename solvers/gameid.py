@@ -0,0 +1,252 @@
+"""
+Parsers for the game IDs of Simon Tatham's Puzzles and readers for files of
+puzzles, one per line.
+
+A game ID is the parameters, a colon and the game description, for example
+"5:_a__a_4a__b_ba__a__c__a_3,d2s3s2a5m12m12d2a9m5d2s1a5" for Keen.  Only
+descriptive IDs are understood; random seed IDs ("5#12345") have to be
+turned into descriptions by the game first.
+
+The parsers return plain values; KenKen.FromGameId, Tents.FromGameId and
+Magnets.FromGameId build the puzzles from them.
+"""
+
+# Bytes read at a time by ReadLines
+CHUNK_SIZE = 1 << 20
+
+_KEEN_OPERATIONS = {'a': '+', 'm': '*', 's': '-', 'd': '/'}
+
+
+def ParseKeen(gameId):
+    """
+    Parses a Keen game ID.  Returns (size, cages) where cages is a list of
+    (operation, target, cells) tuples as taken by KenKen.AddCage, in the
+    order of their first cell
+    """
+    (params, desc) = _split(gameId)
+    size = _leadingInt(params, gameId)
+    parent = list(range(size * size))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # The block structure lists the internal cell edges, first the vertical
+    # ones in reading order and then the horizontal ones in transposed order.
+    # Each letter stands for that many edges that are not cage walls followed
+    # by one that is; '_' is a lone wall and 'z' stands for 26 non-walls, the
+    # 25 of a 'y' plus the edge where its wall would have been.
+    # A letter may be followed by a repeat count.
+    edges = 2 * size * (size - 1)
+    position = 0
+    i = 0
+    while i < len(desc) and desc[i] != ',':
+        c = desc[i]
+        i += 1
+        if c == '_':
+            skip = 0
+        elif 'a' <= c <= 'z':
+            skip = ord(c) - ord('a') + 1
+        else:
+            raise ValueError('Invalid character in block structure: ' + c)
+        start = i
+        while i < len(desc) and desc[i].isdigit():
+            i += 1
+        for repeat in range(int(desc[start:i]) if i > start else 1):
+            if position + skip > edges:
+                raise ValueError('Too much data in block structure: ' + gameId)
+            for e in range(position, position + skip):
+                if e < size * (size - 1):
+                    (y, x) = divmod(e, size - 1)
+                    (p0, p1) = (y * size + x, y * size + x + 1)
+                else:
+                    (x, y) = divmod(e - size * (size - 1), size - 1)
+                    (p0, p1) = (y * size + x, (y + 1) * size + x)
+                (r0, r1) = (find(p0), find(p1))
+                # Keep the lowest cell as the representative, as Keen does
+                parent[max(r0, r1)] = min(r0, r1)
+            position += skip + (c != 'z')
+    if position != edges + 1:
+        raise ValueError('Wrong amount of data in block structure: ' + gameId)
+
+    clues = desc[i + 1:]
+    cages = {}
+    j = 0
+    for cell in range(size * size):
+        root = find(cell)
+        if root == cell:
+            if j >= len(clues) or clues[j] not in _KEEN_OPERATIONS:
+                raise ValueError('Invalid clue in game description: ' + gameId)
+            operation = _KEEN_OPERATIONS[clues[j]]
+            (target, j) = _readInt(clues, j + 1, gameId)
+            cages[cell] = (operation, target, [])
+        cages[root][2].append(divmod(cell, size)[::-1])
+    if j != len(clues):
+        raise ValueError('Too many clues in game description: ' + gameId)
+    return (size, list(cages.values()))
+
+
+def ParseTents(gameId):
+    """
+    Parses a Tents game ID.  Returns (treeGrid, columnCounts, rowCounts) as
+    taken by the Tents constructor
+    """
+    (params, desc) = _split(gameId)
+    (width, height) = _dimensions(params, gameId)
+    area = width * height
+    (grid, counts) = desc.split(',', 1) if ',' in desc else (desc, '')
+    # Each letter is a run of that many empty squares followed by a tree and
+    # '_' a tree on its own; 'z' is 25 empty squares without a tree.  A
+    # final tree just past the end of the grid closes the description.
+    trees = bytearray(area + 1)
+    position = 0
+    for c in grid:
+        if c == '_':
+            skip = 0
+        elif c == 'z':
+            skip = 25
+        elif 'a' <= c < 'z':
+            skip = ord(c) - ord('a') + 1
+        elif c in '!-':
+            # Legacy edge markers
+            continue
+        else:
+            raise ValueError('Invalid character in tree grid: ' + c)
+        position += skip
+        if c != 'z':
+            if position > area:
+                raise ValueError('Too much data in tree grid: ' + gameId)
+            trees[position] = 1
+            position += 1
+    if position != area + 1:
+        raise ValueError('Wrong amount of data in tree grid: ' + gameId)
+    try:
+        numbers = [int(n) for n in counts.split(',')] if counts else []
+    except ValueError:
+        raise ValueError('Invalid tent counts: ' + gameId) from None
+    if len(numbers) != width + height:
+        raise ValueError('Wrong number of tent counts: ' + gameId)
+    treeGrid = [[trees[y * width + x] == 1 for x in range(width)] for y in range(height)]
+    return (treeGrid, numbers[:width], numbers[width:])
+
+
+def ParseMagnets(gameId):
+    """
+    Parses a Magnets game ID.  Returns (columnPlusCounts, columnMinusCounts,
+    rowPlusCounts, rowMinusCounts, pairs, blanks) where the counts are as
+    taken by the Magnets constructor, pairs lists the ((x,y), (x,y)) cells of
+    each domino and blanks the cells that belong to no domino
+    """
+    (params, desc) = _split(gameId)
+    (width, height) = _dimensions(params, gameId)
+    parts = desc.split(',')
+    if len(parts) != 5:
+        raise ValueError('Invalid game description: ' + gameId)
+    # Clues around the grid: top (column +), left (row +), bottom (column -)
+    # and right (row -).  '.' is an unknown count, letters count from 10.
+    (columnPlus, rowPlus, columnMinus, rowMinus) = [_magnetCounts(p, n, gameId) for (p, n) in
+                                                    zip(parts[:4], (width, height, width, height))]
+    layout = parts[4]
+    if len(layout) != width * height:
+        raise ValueError('Wrong amount of data in domino layout: ' + gameId)
+    pairs = []
+    blanks = []
+    for (i, c) in enumerate(layout):
+        (y, x) = divmod(i, width)
+        if c == 'L' and x + 1 < width and layout[i + 1] == 'R':
+            pairs.append(((x, y), (x + 1, y)))
+        elif c == 'T' and y + 1 < height and layout[i + width] == 'B':
+            pairs.append(((x, y), (x, y + 1)))
+        elif c == '*':
+            blanks.append((x, y))
+        elif c not in 'RB' or (c == 'R' and (x == 0 or layout[i - 1] != 'L')) or \
+                (c == 'B' and (y == 0 or layout[i - width] != 'T')):
+            raise ValueError('Invalid domino layout: ' + gameId)
+    return (columnPlus, columnMinus, rowPlus, rowMinus, pairs, blanks)
+
+
+def ReadLines(path, chunkSize=CHUNK_SIZE):
+    """
+    Yields the lines of a text file without their line endings, skipping
+    blank lines and lines starting with '#'.  The file is read in chunks of
+    chunkSize bytes, so files much larger than memory can be streamed, for
+    example into sudoku.SolveMany.
+    """
+    with open(path, 'rb') as f:
+        rest = b''
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                break
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+            for line in lines:
+                line = line.strip()
+                if line and not line.startswith(b'#'):
+                    yield line.decode('ascii')
+        rest = rest.strip()
+        if rest and not rest.startswith(b'#'):
+            yield rest.decode('ascii')
+
+
+def ReadPuzzles(path, parse, chunkSize=CHUNK_SIZE):
+    """
+    Yields a puzzle for each line of a file (see ReadLines).
+
+    parse: Builds a puzzle from one line, for example Sudoku.FromString or
+        KenKen.FromGameId
+    """
+    for line in ReadLines(path, chunkSize):
+        yield parse(line)
+
+
+def _split(gameId):
+    """Splits a game ID into its parameters and description"""
+    (params, colon, desc) = gameId.strip().partition(':')
+    if not colon:
+        raise ValueError('Not a descriptive game ID: ' + gameId)
+    return (params, desc)
+
+
+def _leadingInt(text, gameId):
+    """Returns the number at the start of text"""
+    (value, end) = _readInt(text, 0, gameId)
+    return value
+
+
+def _readInt(text, start, gameId):
+    """Reads the decimal number starting at text[start] and returns (value, end)"""
+    end = start
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    if end == start:
+        raise ValueError('Expected a number in game ID: ' + gameId)
+    return (int(text[start:end]), end)
+
+
+def _dimensions(params, gameId):
+    """Returns (width, height) from parameters such as '8x8de'"""
+    (width, end) = _readInt(params, 0, gameId)
+    if end >= len(params) or params[end] != 'x':
+        raise ValueError('Expected WxH parameters in game ID: ' + gameId)
+    (height, end) = _readInt(params, end + 1, gameId)
+    return (width, height)
+
+
+def _magnetCounts(text, length, gameId):
+    """Decodes a line of Magnets clues"""
+    if len(text) != length:
+        raise ValueError('Wrong number of clues in game ID: ' + gameId)
+    counts = []
+    for c in text:
+        if c == '.':
+            counts.append(None)
+        elif c.isdigit():
+            counts.append(int(c))
+        elif 'a' <= c <= 'z':
+            counts.append(ord(c) - ord('a') + 10)
+        else:
+            raise ValueError('Invalid clue in game ID: ' + gameId)
+    return counts
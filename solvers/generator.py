@@ -0,0 +1,251 @@
+"""
+Generators for Sudoku and KenKen puzzles with a unique solution.
+
+Each generator keeps one Z3 solver for its lifetime.  A puzzle starts from a
+random full solution with a constraint blocking that solution, and its clues
+(or cages) are assumption literals, so a candidate puzzle is unique exactly
+when check() under its literals is unsat.  Every candidate costs one check()
+and Z3 keeps what it learns about the rules between candidates and puzzles.
+"""
+import random
+
+from z3 import *
+
+from .bitmask import SolveBitmask
+from .kenken import KenKen
+from .z3util import ONEHOT_ENCODING
+from .puzzle import SolveTimeoutError
+from .sudoku import SYMBOLS, Sudoku, SudokuSession
+
+
+def LatinSquare(size, rng):
+    """Returns a random size x size latin square as a list of rows"""
+    rows = [[(r + c) % size + 1 for c in range(size)] for r in range(size)]
+    rng.shuffle(rows)
+    cols = list(range(size))
+    rng.shuffle(cols)
+    return [[row[c] for c in cols] for row in rows]
+
+
+def RandomCage(cells, values, rng):
+    """Picks a random operation for a cage and returns its (operation, target, cells) tuple"""
+    if len(values) == 2:
+        low, high = sorted(values)
+        operations = ['+', '*', '-']
+        if high % low == 0:
+            operations.append('/')
+    else:
+        operations = ['+'] if len(values) == 1 else ['+', '*']
+    operation = rng.choice(operations)
+    if operation == '+':
+        target = sum(values)
+    elif operation == '*':
+        target = 1
+        for v in values:
+            target *= v
+    elif operation == '-':
+        target = high - low
+    else:
+        target = high // low
+    return (operation, target, cells)
+
+
+class SudokuGenerator:
+    """Generates classic sudokus with a unique solution by removing clues from a random full grid"""
+
+    # Used when no encoding is passed to the constructor.  Clue literals are
+    # then the cells' own Bools, which makes each check several times cheaper
+    DEFAULT_ENCODING = ONEHOT_ENCODING
+
+    def __init__(self, dimension=3, encoding=None, seed=None, ctx=None):
+        """
+        dimension: Size of each sub-square.  For a standard sudoku the dimension is 3
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding).  Defaults to DEFAULT_ENCODING
+        seed: Seed for the random choices, so that runs can be repeated
+        ctx: Z3 Context for the generator's solver (see Puzzle)
+        """
+        self.dimension = dimension
+        self.size = dimension * dimension
+        self.rng = random.Random(seed)
+        self.session = SudokuSession(dimension, encoding or SudokuGenerator.DEFAULT_ENCODING, ctx)
+        self.solver = self.session.solver
+        # Negated cell values for blocking full solutions, keyed on (x, y, value)
+        self.__differs = {}
+
+    def Generate(self):
+        """
+        Returns (puzzle, solution) where puzzle is a string in the format read
+        by Sudoku.FromString and solution is a 2D array of the values.  No
+        clue can be removed from the puzzle without losing uniqueness.
+        """
+        solution = self.__fullGrid()
+        cells = [(x, y) for y in range(self.size) for x in range(self.size)]
+        literals = dict(((x, y), self.session.Literal(x, y, solution[y][x])) for (x, y) in cells)
+        self.rng.shuffle(cells)
+        self.solver.push()
+        try:
+            self.solver.add(_anyOf([self.__differ(x, y, solution[y][x]) for (x, y) in cells]))
+            clues = self.__removeClues(cells, literals)
+        finally:
+            self.solver.pop()
+        text = ''.join(SYMBOLS[solution[y][x] - 1] if (x, y) in clues else '.'
+                       for y in range(self.size) for x in range(self.size))
+        return (text, solution)
+
+    def __removeClues(self, order, literals):
+        """
+        Removes clues in the given order while the puzzle stays unique and
+        returns the set of cells left.  Clues are tried in batches that grow
+        while removals succeed and shrink when they fail, since most of the
+        early removals keep the puzzle unique.
+        """
+        clues = set(order)
+        pending = list(order)
+        batch = 1
+        while pending:
+            candidates = pending[:batch]
+            remaining = [literals[c] for c in order if c in clues and c not in candidates]
+            if _isUnique(self.solver, remaining):
+                clues.difference_update(candidates)
+                del pending[:batch]
+                batch *= 2
+            elif batch > 1:
+                batch //= 2
+            else:
+                del pending[0]
+        return clues
+
+    def __differ(self, x, y, val):
+        """Returns a condition that holds when the cell at (x,y) is not val"""
+        key = (x, y, val)
+        if key not in self.__differs:
+            puzzle = self.session.puzzle
+            self.__differs[key] = Not(puzzle.encoding.Equals(puzzle.grid[(x,y)], val))
+        return self.__differs[key]
+
+    def __fullGrid(self):
+        """
+        Returns a random solved grid.  The diagonal boxes are filled at random
+        and the rest solved, trying again if that leaves no solution.
+        """
+        dimension = self.dimension
+        while True:
+            clues = []
+            for box in range(dimension):
+                digits = list(range(1, self.size + 1))
+                self.rng.shuffle(digits)
+                for (i, val) in enumerate(digits):
+                    clues.append((box * dimension + i % dimension, box * dimension + i // dimension, val))
+            found = SolveBitmask(dimension, clues, limit=1, maxNodes=Sudoku.AUTO_NATIVE_NODE_LIMIT)
+            if found:
+                return [found[0][y * self.size:(y + 1) * self.size] for y in range(self.size)]
+            if found is None:
+                # The native search gave up, so hand the grid to Z3 as Sudoku does
+                try:
+                    return self.session.Solve(clues)
+                except ValueError:
+                    pass
+
+
+class KenKenGenerator:
+    """
+    Generates KenKen puzzles with a unique solution.  Starting from a random
+    latin square where every cell is its own cage, random neighbouring cages
+    are merged under a random operation as long as the solution stays unique.
+    """
+
+    # Used when no encoding or cage mode is passed to the constructor
+    DEFAULT_ENCODING = ONEHOT_ENCODING
+    DEFAULT_CAGES = KenKen.CAGES_TABLE
+
+    def __init__(self, size, encoding=None, cages=None, seed=None, maxCage=4, attempts=None, ctx=None):
+        """
+        size: Size of the square
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding).  Defaults to DEFAULT_ENCODING
+        cages: KenKen.CAGES_ARITHMETIC or KenKen.CAGES_TABLE.  Defaults to DEFAULT_CAGES
+        seed: Seed for the random choices, so that runs can be repeated
+        maxCage: Largest number of cells in a cage
+        attempts: Stop merging after this many merges in a row fail.  Defaults to the number of cells
+        ctx: Z3 Context for the generator's solver (see Puzzle)
+        """
+        self.size = size
+        self.maxCage = maxCage
+        self.attempts = attempts if attempts is not None else size * size
+        self.rng = random.Random(seed)
+        self.puzzle = KenKen(size, encoding or KenKenGenerator.DEFAULT_ENCODING, cages or KenKenGenerator.DEFAULT_CAGES, ctx)
+        self.solver = self.puzzle.solver
+        self.__literals = 0
+
+    def Generate(self):
+        """
+        Returns (cages, solution) where cages is a list of (operation, target,
+        cells) tuples as taken by KenKen.AddCage and solution is a 2D array of
+        the values
+        """
+        solution = LatinSquare(self.size, self.rng)
+        value = lambda c: solution[c[1]][c[0]]
+        grid = self.puzzle.grid
+        encoding = self.puzzle.encoding
+        self.solver.push()
+        try:
+            self.solver.add(_anyOf([Not(encoding.Equals(grid[c], value(c))) for c in grid]))
+            # Cage number of each cell, and the cage tuple and literal of each cage number
+            owner = dict((c, i) for (i, c) in enumerate(grid))
+            cages = dict((i, self.__guarded(('+', value(c), [c]))) for (c, i) in owner.items())
+            failures = 0
+            while failures < self.attempts:
+                if not self.__merge(owner, cages, value):
+                    failures += 1
+                else:
+                    failures = 0
+        finally:
+            self.solver.pop()
+        return ([cage for (cage, literal) in cages.values()], solution)
+
+    def __merge(self, owner, cages, value):
+        """Merges a random pair of neighbouring cages if the puzzle stays unique and returns whether it did"""
+        first = self.rng.choice(list(cages))
+        cells = cages[first][0][2]
+        neighbours = set(owner.get((x + dx, y + dy)) for (x, y) in cells
+                         for (dx, dy) in ((1, 0), (-1, 0), (0, 1), (0, -1)))
+        neighbours = sorted(n for n in neighbours.difference([None, first])
+                            if len(cells) + len(cages[n][0][2]) <= self.maxCage)
+        if not neighbours:
+            return False
+        second = self.rng.choice(neighbours)
+        merged = cells + cages[second][0][2]
+        (cage, literal) = self.__guarded(RandomCage(merged, [value(c) for c in merged], self.rng))
+        others = [l for (i, (c, l)) in cages.items() if i != first and i != second]
+        if not _isUnique(self.solver, others + [literal]):
+            return False
+        del cages[second]
+        cages[first] = (cage, literal)
+        for c in merged:
+            owner[c] = first
+        return True
+
+    def __guarded(self, cage):
+        """Adds a cage's constraint behind a new literal and returns (cage, literal)"""
+        self.__literals += 1
+        literal = Bool('kenken-cage-{}'.format(self.__literals), self.puzzle.ctx)
+        (operation, target, cells) = cage
+        self.solver.add(Implies(literal, self.puzzle.CageConstraint(operation, target, cells)))
+        return (cage, literal)
+
+
+def _isUnique(solver, assumptions):
+    """Returns True if no solution other than the blocked one satisfies the assumptions"""
+    # Solver.check() casts every assumption to Bool first, which costs more
+    # than the check itself for a sudoku's worth of clues
+    array = (Ast * len(assumptions))(*[a.as_ast() for a in assumptions])
+    result = CheckSatResult(Z3_solver_check_assumptions(solver.ctx.ref(), solver.solver, len(assumptions), array))
+    if result == unknown:
+        raise SolveTimeoutError('Solve stopped without an answer: ' + solver.reason_unknown())
+    return result == unsat
+
+
+def _anyOf(conditions):
+    """Returns Or(conditions), building it directly from the already Boolean conditions"""
+    ctx = conditions[0].ctx
+    array = (Ast * len(conditions))(*[c.as_ast() for c in conditions])
+    return BoolRef(Z3_mk_or(ctx.ref(), len(conditions), array), ctx)
@@ -1,31 +1,74 @@
+from functools import lru_cache
 from z3 import *
 from .z3util import *
+from .gameid import ParseKeen
+from .puzzle import GridPuzzle, NoSolutionError, Recorded
 
-# Future improvements:
-# Assert that each square is added to only a single constraint
-# Assert that every square is added to a constraint
-
-class KenKen:
+class KenKen(GridPuzzle):
     """Solver for the KenKen logic puzzle: https://www.chiark.greenend.org.uk/~sgtatham/puzzles/js/keen.html"""
-    def __init__(self, size):
-        """Creates empty square puzzle.  size: Size of the square"""
+
+    DEFAULT_ENCODING = INT_ENCODING # Used when no encoding is passed to the constructor
+
+    # How cage constraints are given to Z3.  Arithmetic cages state the sum or
+    # product directly; table cages list every digit tuple that satisfies the
+    # cage, which avoids nonlinear integer arithmetic on larger grids.
+    CAGES_ARITHMETIC = 'arithmetic'
+    CAGES_TABLE = 'table'
+    DEFAULT_CAGES = CAGES_ARITHMETIC
+
+    CONFIGURATION_ARGUMENTS = GridPuzzle.CONFIGURATION_ARGUMENTS + ('cages',)
+
+    def __init__(self, size, encoding=None, cages=None, ctx=None):
+        """
+        Creates empty square puzzle.
+
+        size: Size of the square
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding).  Defaults to DEFAULT_ENCODING
+        cages: CAGES_ARITHMETIC or CAGES_TABLE.  Defaults to DEFAULT_CAGES
+        ctx: Z3 Context for the puzzle (see Puzzle).  None uses Z3's global context
+        """
         self.__prefix = 'kenken'
         self.size = size
-        self.grid = Z3IntDict2D(size, size, self.__prefix)
-        self.solver = Solver()
+        self.cages = cages or KenKen.DEFAULT_CAGES
+        if self.cages not in (KenKen.CAGES_ARITHMETIC, KenKen.CAGES_TABLE):
+            raise ValueError('Invalid cage mode: ' + str(self.cages))
+        self.encoding = MakeEncoding(encoding or KenKen.DEFAULT_ENCODING, 1, size, ctx)
+        self.grid = Z3EncodedDict2D(size, size, self.__prefix, self.encoding)
+        # Cells already in a cage.  Each cell belongs to exactly one cage
+        self._caged = set()
+        self.solver = self._newSolver()
         self.__addNumericRangeConstraints()
         self.__addUniquenessConstraints()
 
-    def Solution(self):
-        """Solves the grid and returns a 2D array of the values"""
-        self.solver.check()
-        m = self.solver.model()
-        answer = [[0] * self.size for i in range(self.size)]
-        for y in range(self.size):
-            for x in range(self.size):
-                answer[y][x] = int(str(m[self.grid[(x,y)]]))
-        return answer
+    @classmethod
+    def FromGameId(cls, gameId, encoding=None, cages=None, ctx=None):
+        """
+        Creates a puzzle from a Keen game ID (see gameid.ParseKeen).  encoding,
+        cages and ctx are as for the constructor.
+        """
+        (size, puzzleCages) = ParseKeen(gameId)
+        k = cls(size, encoding, cages, ctx)
+        for (operation, target, cells) in puzzleCages:
+            k.AddCage(operation, target, cells)
+        return k
 
+    def _extractSolution(self, m):
+        """Returns a 2D array of the values in the model"""
+        return [[self.encoding.Decode(m, g) for g in self.grid.Row(y)] for y in range(self.size)]
+
+    def _cells(self):
+        return list(self.grid.values())
+
+    def _prepareSolver(self):
+        self._checkCovered()
+
+    def _checkCovered(self):
+        """Raises ValueError unless every cell is in a cage"""
+        if len(self._caged) != self.size * self.size:
+            missing = sorted(set(self.grid.keys()) - self._caged, key=lambda c: (c[1], c[0]))
+            raise ValueError('Cells not in any cage: ' + ', '.join(map(str, missing)))
+
+    @Recorded
     def AddSum(self, target, *coordinatesList):
         """
         Adds a sum constraint to the grid.
@@ -33,8 +76,9 @@ class KenKen:
         squares: List of (x,y) tuples
         target: The sum of those squares
         """
-        self.solver.add(Sum(self.__squares(coordinatesList)) == target)
+        self.__addCage('+', target, coordinatesList)
 
+    @Recorded
     def AddProduct(self, target, *coordinatesList):
         """
         Adds a product constraint to the grid.
@@ -42,37 +86,206 @@ class KenKen:
         squares: List of (x,y) tuples
         target: The sum of those squares
         """
-        self.solver.add(Product(self.__squares(coordinatesList)) == target)
+        self.__addCage('*', target, coordinatesList)
 
+    @Recorded
     def AddDifference(self, target, first, second):
         """
         Adds a subtraction constraint to the grid.
 
         first, second: (x,y) tuples containing coordinates of the squares
         """
-        sq = self.__squares([first, second])
-        self.solver.add(Or(sq[0]-sq[1] == target, sq[1]-sq[0] == target))
+        self.__addCage('-', target, [first, second])
 
+    @Recorded
     def AddDivision(self, target, first, second):
         """
         Adds a division constraint to the grid.
 
         first, second: (x,y) tuples containing coordinates of the squares
         """
-        sq = self.__squares([first, second])
-        self.solver.add(Or(sq[0]*target == sq[1], sq[1]*target == sq[0]))
+        self.__addCage('/', target, [first, second])
+
+    @Recorded
+    def AddCage(self, operation, target, cells):
+        """
+        Adds a cage constraint given its operation as a string.  Every cell
+        must end up in exactly one cage: adding a cell a second time raises
+        ValueError at once and Solution() raises it for cells left out.
+
+        operation: One of '+', '*', '-' or '/'
+        target: The result of applying the operation to the squares
+        cells: List of (x,y) tuples.  Subtraction and division take exactly two
+        """
+        self.__addCage(operation, target, cells)
+
+    def CageConstraint(self, operation, target, cells):
+        """
+        Returns the constraint for a cage without adding it to the solver, for
+        example to guard it with an assumption literal.  Arguments are as for
+        AddCage.
+        """
+        if operation in ('-', '/') and len(cells) != 2:
+            raise ValueError('Cage operation ' + operation + ' requires exactly two squares')
+        if operation not in ('+', '*', '-', '/'):
+            raise ValueError('Invalid cage operation: ' + str(operation))
+        if self.cages == KenKen.CAGES_TABLE:
+            return self.__tableConstraint(operation, target, cells)
+        if operation == '+':
+            maxValue = max(target, self.size * len(cells))
+            return Sum(self.__terms(cells, maxValue)) == target
+        if operation == '*':
+            maxValue = max(target, self.size ** len(cells))
+            return Product(self.__terms(cells, maxValue)) == target
+        if operation == '-':
+            sq = self.__terms(cells, max(target, self.size))
+            return Or(sq[0]-sq[1] == target, sq[1]-sq[0] == target)
+        sq = self.__terms(cells, self.size * max(target, 1))
+        return Or(sq[0]*target == sq[1], sq[1]*target == sq[0])
+
+    def __addCage(self, operation, target, cells):
+        """Adds a cage as a clue, checking that its cells are on the grid and in no other cage"""
+        cells = list(cells)
+        for c in cells:
+            if c not in self.grid:
+                raise ValueError('Invalid cell: ' + str(c))
+        repeated = self._caged.intersection(cells).union(c for c in cells if cells.count(c) > 1)
+        if repeated:
+            raise ValueError('Cells already in a cage: ' + ', '.join(map(str, sorted(repeated))))
+        self._addClue(self.CageConstraint(operation, target, cells))
+        self._caged.update(cells)
 
     def __squares(self, coordinatesList):
         """Given a list of (x,y) tuples, returns the grid squares corresponding to them"""
         return list(map(lambda c: self.grid[c], coordinatesList))
 
+    def __terms(self, coordinatesList, maxValue):
+        """Returns arithmetic terms for the squares able to hold intermediate values up to maxValue"""
+        return [self.encoding.Term(sq, maxValue) for sq in self.__squares(coordinatesList)]
+
+    def __tableConstraint(self, operation, target, coordinatesList):
+        """Returns a cage constraint as the disjunction of the digit tuples that satisfy it"""
+        cells = sorted(set(coordinatesList))
+        minX = min(x for (x, y) in cells)
+        minY = min(y for (x, y) in cells)
+        shape = tuple((x - minX, y - minY) for (x, y) in cells)
+        tuples = _cageTuples(operation, target, self.size, shape)
+        squares = self.__squares(cells)
+        eq = self.encoding.Equals
+        # Restricting each cell to the digits it takes in some tuple is implied
+        # by the disjunction, but lets Z3 prune the domains up front
+        parts = [self.encoding.DomainConstraint(sq, sorted(set(t[i] for t in tuples))) for (i, sq) in enumerate(squares)]
+        if len(squares) > 1:
+            parts.append(Or([And([eq(sq, v) for (sq, v) in zip(squares, t)]) for t in tuples], self.encoding.ctx))
+        return And(parts)
+
     def __addNumericRangeConstraints(self):
         """Ensures that all grid squares are in the range [1,size]"""
-        for key in self.grid.keys():
-            self.solver.add(Or([self.grid[key] == j for j in range(1, self.size + 1)]))
+        for g in self.grid.values():
+            self.solver.add(self.encoding.DomainConstraint(g))
 
     def __addUniquenessConstraints(self):
         """Ensures that all rows and columns contain distinct values"""
-        row_c = [Distinct([self.grid[(j,i)] for j in range(self.size)]) for i in range(self.size)]
-        col_c = [Distinct([self.grid[(i,j)] for j in range(self.size)]) for i in range(self.size)]
+        row_c = [self.encoding.AllDifferent(list(self.grid.Row(i))) for i in range(self.size)]
+        col_c = [self.encoding.AllDifferent(list(self.grid.Column(i))) for i in range(self.size)]
         self.solver.add(row_c + col_c)
+
+@lru_cache(maxsize=4096)
+def _cageTuples(operation, target, size, shape):
+    """
+    Returns every tuple of digits in [1,size] that satisfies a cage.  Cells of
+    the cage that share a row or column hold different digits.  The result is
+    cached since the same cages recur across puzzles.
+
+    operation: One of '+', '*', '-' or '/'
+    target: The result of applying the operation to the squares
+    size: Size of the square
+    shape: Tuple of (x,y) offsets of the cage's cells; the digits in each
+        returned tuple follow the same order
+    """
+    if operation in ('-', '/'):
+        if len(shape) != 2:
+            raise ValueError('Cage operation ' + operation + ' requires exactly two squares')
+    elif operation not in ('+', '*'):
+        raise ValueError('Invalid cage operation: ' + str(operation))
+    # Earlier cells of the cage that each cell must differ from
+    conflicts = [[j for j in range(i) if shape[j][0] == shape[i][0] or shape[j][1] == shape[i][1]]
+                 for i in range(len(shape))]
+    tuples = []
+    digits = []
+
+    def extend(total):
+        i = len(digits)
+        if i == len(shape):
+            if _cageHolds(operation, target, digits, total):
+                tuples.append(tuple(digits))
+            return
+        for v in range(1, size + 1):
+            if any(digits[j] == v for j in conflicts[i]):
+                continue
+            if operation == '+':
+                nextTotal = total + v
+                # Every remaining cell adds at least 1
+                if nextTotal + len(shape) - i - 1 > target:
+                    break
+            elif operation == '*':
+                nextTotal = total * v
+                if target % nextTotal != 0:
+                    continue
+            else:
+                nextTotal = total
+            digits.append(v)
+            extend(nextTotal)
+            digits.pop()
+
+    extend(0 if operation == '+' else 1)
+    return tuple(tuples)
+
+def _cageHolds(operation, target, digits, total):
+    """Returns True if a complete tuple of digits satisfies the cage"""
+    if operation in ('+', '*'):
+        return total == target
+    a, b = digits
+    if operation == '-':
+        return abs(a - b) == target
+    return a * target == b or b * target == a
+
+class KenKenSession:
+    """
+    Solves many KenKen puzzles of the same size against one Z3 solver.  The
+    range and row/column uniqueness constraints are built once and each
+    puzzle's cages are scoped with push()/pop().
+    """
+
+    def __init__(self, size, encoding=None, cages=None, ctx=None):
+        """
+        size: Size of the square
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding)
+        cages: KenKen.CAGES_ARITHMETIC or KenKen.CAGES_TABLE
+        ctx: Z3 Context for the session (see Puzzle)
+        """
+        self.puzzle = KenKen(size, encoding, cages, ctx)
+        self.solver = self.puzzle.solver
+
+    def Solve(self, cages):
+        """
+        Solves one puzzle and returns a 2D array of the values.
+
+        cages: Iterable of (operation, target, cells) tuples as taken by KenKen.AddCage
+        """
+        self.solver.push()
+        try:
+            for (operation, target, cells) in cages:
+                self.puzzle.AddCage(operation, target, cells)
+            self.puzzle._checkCovered()
+            result = self.solver.check()
+            if result != sat:
+                raise NoSolutionError(clues=self.puzzle._conflictingClues(self.solver) if result == unsat else None)
+            return self.puzzle._extractSolution(self.solver.model())
+        finally:
+            self.solver.pop()
+            # The cages were scoped to this puzzle, so drop them from the recipe too
+            del self.puzzle._recipe[:]
+            self.puzzle._caged.clear()
+            self.puzzle._clues.clear()
+            self.puzzle._clueChanges += 1
@@ -1,16 +1,19 @@
 from z3 import *
 from .z3util import *
-from enum import Enum
+from .gameid import ParseMagnets
+from .puzzle import GridPuzzle, Recorded
 
 
-class Magnets:
+class Magnets(GridPuzzle):
     EMPTY = 0
     PLUS = 1
     MINUS = 2
 
+    DEFAULT_ENCODING = INT_ENCODING # Used when no encoding is passed to the constructor
+
     """Solver for the Magnets logic puzzle: https://www.chiark.greenend.org.uk/~sgtatham/puzzles/js/magnets.html"""
 
-    def __init__(self, columnPlusCounts, columnMinusCounts, rowPlusCounts, rowMinusCounts):
+    def __init__(self, columnPlusCounts, columnMinusCounts, rowPlusCounts, rowMinusCounts, encoding=None, ctx=None):
         """
         Creates empty rectangular magnets puzzle.
 
@@ -18,6 +21,8 @@ class Magnets:
         columnMinusCounts: List of count of how many minus signs are in each column (None if unknown)
         rowPlusCounts: List of count of how many plus signs are in each row. (None if unknown)
         rowMinusCounts: List of count of how many plus signs are in each row. (None if unknown)
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding).  Defaults to DEFAULT_ENCODING
+        ctx: Z3 Context for the puzzle (see Puzzle).  None uses Z3's global context
         """
         self.__prefix = 'tents'
         if len(columnPlusCounts) != len(columnMinusCounts) or len(rowPlusCounts) != len(rowMinusCounts):
@@ -29,21 +34,31 @@ class Magnets:
         self.columnMinusCounts = columnMinusCounts.copy()
         self.rowPlusCounts = rowPlusCounts.copy()
         self.rowMinusCounts = rowMinusCounts.copy()
-        self.grid = Z3IntDict2D(self.width, self.height, self.__prefix)
-        self.solver = Solver()
+        self.__checkCounts()
+        self.encoding = MakeEncoding(encoding or Magnets.DEFAULT_ENCODING, Magnets.EMPTY, Magnets.MINUS, ctx)
+        self.grid = Z3EncodedDict2D(self.width, self.height, self.__prefix, self.encoding)
+        self.solver = self._newSolver()
         self.__addValueConstraints()
         self.__addRowConstraints()
         self.__addColumnConstraints()
 
-    def Solution(self):
-        """Solves the grid and returns a 2D array of the values"""
-        self.solver.check()
-        m = self.solver.model()
-        answer = [[0] * self.width for i in range(self.height)]
-        for y in range(self.height):
-            for x in range(self.width):
-                answer[y][x] = int(str(m[self.grid[(x, y)]]))
-        return answer
+    @classmethod
+    def FromGameId(cls, gameId, encoding=None, ctx=None):
+        """Creates a puzzle from a Magnets game ID (see gameid.ParseMagnets)"""
+        (columnPlus, columnMinus, rowPlus, rowMinus, pairs, blanks) = ParseMagnets(gameId)
+        m = cls(columnPlus, columnMinus, rowPlus, rowMinus, encoding, ctx)
+        for (first, second) in pairs:
+            m.AddPair(first, second)
+        for cell in blanks:
+            m.AddBlank(cell)
+        return m
+
+    def _extractSolution(self, m):
+        """Returns a 2D array of the values in the model"""
+        return [[self.encoding.Decode(m, g) for g in self.grid.Row(y)] for y in range(self.height)]
+
+    def _cells(self):
+        return list(self.grid.values())
 
     def PrintSolution(self):
         """Returns a printable version of the solution."""
@@ -59,57 +74,74 @@ class Magnets:
             sol = sol + '\n'
         return sol
 
+    @Recorded
     def AddPair(self, first, second):
         """Requires that the two coordinates correspond to a magnet"""
         a = self.grid[first]
         b = self.grid[second]
-        self.solver.add(Or([
-            And([a == Magnets.PLUS, b == Magnets.MINUS]),
-            And([a == Magnets.MINUS, b == Magnets.PLUS]),
-            And([a == Magnets.EMPTY, b == Magnets.EMPTY])]))
+        eq = self.encoding.Equals
+        self._addClue(Or([
+            And([eq(a, Magnets.PLUS), eq(b, Magnets.MINUS)]),
+            And([eq(a, Magnets.MINUS), eq(b, Magnets.PLUS)]),
+            And([eq(a, Magnets.EMPTY), eq(b, Magnets.EMPTY)])]))
+
+    @Recorded
+    def AddBlank(self, cell):
+        """Requires that the coordinate is a neutral square that holds no magnet"""
+        self._addClue(self.encoding.Equals(self.grid[cell], Magnets.EMPTY))
+
+    def __checkCounts(self):
+        """
+        Raises ValueError for counts that no grid can meet: a line with more
+        signs than cells, or rows and columns fully counted to different totals
+        """
+        lines = [('row', self.rowPlusCounts, self.rowMinusCounts, self.width),
+                 ('column', self.columnPlusCounts, self.columnMinusCounts, self.height)]
+        for (name, plusCounts, minusCounts, length) in lines:
+            for (i, counts) in enumerate(zip(plusCounts, minusCounts)):
+                known = [n for n in counts if n is not None]
+                if any(n < 0 for n in known) or sum(known) > length:
+                    raise ValueError('Invalid counts for {} {}: {} plus, {} minus'.format(name, i, *counts))
+        for (sign, rows, columns) in [('plus', self.rowPlusCounts, self.columnPlusCounts),
+                                      ('minus', self.rowMinusCounts, self.columnMinusCounts)]:
+            if None not in rows and None not in columns and sum(rows) != sum(columns):
+                raise ValueError('The {} counts of the rows ({}) and columns ({}) do not agree'.format(
+                    sign, sum(rows), sum(columns)))
 
     def __addValueConstraints(self):
         """Adds constraints that the no two cells are adjacent"""
         for x in range(self.width):
             for y in range(self.height):
                 g = self.grid[(x, y)]
-                self.solver.add(
-                    Or([g == Magnets.EMPTY, g == Magnets.PLUS, g == Magnets.MINUS]))
+                isEmpty = self.encoding.Equals(g, Magnets.EMPTY)
+                self.solver.add(self.encoding.DomainConstraint(g))
                 if x > 0:
                     left = self.grid[(x-1, y)]
-                    self.solver.add(Or([g != left, g == Magnets.EMPTY]))
+                    self.solver.add(Or([Not(self.encoding.SameValue(g, left)), isEmpty]))
                 if y > 0:
                     up = self.grid[(x, y-1)]
-                    self.solver.add(Or([g != up, g == Magnets.EMPTY]))
+                    self.solver.add(Or([Not(self.encoding.SameValue(g, up)), isEmpty]))
 
     def __addRowConstraints(self):
         """Adds constraints that the total number of plus and minus signs in each row is correct"""
         for y in range(self.height):
-            plusTarget = self.rowPlusCounts[y]
-            minusTarget = self.rowMinusCounts[y]
-            plusTotal = 0
-            minusTotal = 0
-            for x in range(self.width):
-                g = self.grid[(x, y)]
-                plusTotal = plusTotal + If(g == Magnets.PLUS, 1, 0)
-                minusTotal = minusTotal + If(g == Magnets.MINUS, 1, 0)
-            if plusTarget != None:
-                self.solver.add(plusTotal == plusTarget)
-            if minusTarget != None:
-                self.solver.add(minusTotal == minusTarget)
+            cells = list(self.grid.Row(y))
+            self.__addLineCounts(cells, 'row', y, self.rowPlusCounts[y], self.rowMinusCounts[y])
 
     def __addColumnConstraints(self):
         """Adds constraints that the total number of plus and minus signs in each column is correct"""
         for x in range(self.width):
-            plusTarget = self.columnPlusCounts[x]
-            minusTarget = self.columnMinusCounts[x]
-            plusTotal = 0
-            minusTotal = 0
-            for y in range(self.height):
-                g = self.grid[(x, y)]
-                plusTotal = plusTotal + If(g == Magnets.PLUS, 1, 0)
-                minusTotal = minusTotal + If(g == Magnets.MINUS, 1, 0)
-            if plusTarget != None:
-                self.solver.add(plusTotal == plusTarget)
-            if minusTarget != None:
-                self.solver.add(minusTotal == minusTarget)
+            cells = list(self.grid.Column(x))
+            self.__addLineCounts(cells, 'column', x, self.columnPlusCounts[x], self.columnMinusCounts[x])
+
+    def __addLineCounts(self, cells, line, index, plusTarget, minusTarget):
+        """
+        Adds pseudo-boolean counts of the plus and minus signs in a line of
+        cells as clues, such as rowPlusCounts[index] when line is 'row'
+        """
+        if plusTarget != None:
+            self._addClue(ExactlyCount([self.encoding.Equals(g, Magnets.PLUS) for g in cells], plusTarget, self.ctx),
+                          '{}PlusCounts[{}] = {}'.format(line, index, plusTarget))
+        if minusTarget != None:
+            self._addClue(ExactlyCount([self.encoding.Equals(g, Magnets.MINUS) for g in cells], minusTarget, self.ctx),
+                          '{}MinusCounts[{}] = {}'.format(line, index, minusTarget))
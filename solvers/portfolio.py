@@ -0,0 +1,116 @@
+"""
+Races one puzzle under several solver configurations in separate processes.
+The first configuration to reach a definite answer wins and the processes
+still running are terminated.
+"""
+from .puzzle import NoSolutionError
+from collections import deque
+import multiprocessing
+import os
+import queue
+import time
+
+# Keys of a portfolio configuration that set up the Z3 solver.  Every other
+# key is passed to the puzzle's constructor.
+SOLVER_OPTIONS = ('logic', 'seed')
+
+# Seconds between checks for worker processes that died without reporting
+_POLL_INTERVAL = 0.1
+
+
+def Rebuild(cls, arguments, recipe, configuration=None):
+    """
+    Constructs a puzzle from its constructor arguments and recipe (see
+    Puzzle), optionally under a portfolio configuration
+    """
+    configuration = configuration or {}
+    arguments = dict(arguments)
+    arguments.update((k, v) for (k, v) in configuration.items() if k not in SOLVER_OPTIONS)
+    puzzle = cls.__new__(cls, **arguments)
+    puzzle._logic = configuration.get('logic')
+    puzzle.__init__(**arguments)
+    for (name, args, kwargs) in recipe:
+        getattr(puzzle, name)(*args, **kwargs)
+    if configuration.get('seed') is not None:
+        puzzle.solver.set('random_seed', configuration['seed'])
+    return puzzle
+
+
+def SolvePortfolio(puzzle, portfolio, workers=None):
+    """
+    Solves a puzzle under each configuration of portfolio in its own process
+    and returns the first answer.  Raises NoSolutionError if a configuration
+    proves the puzzle has no solution and RuntimeError if every configuration
+    fails.
+    The puzzle's lastReport records the winning configuration.
+    """
+    configurations = [dict(c) for c in portfolio]
+    if not configurations:
+        raise ValueError('The portfolio is empty')
+    if workers is None:
+        workers = min(len(configurations), os.cpu_count() or 1)
+    workers = max(workers, 1)
+    report = puzzle._startReport('portfolio')
+    started = time.perf_counter()
+    results = multiprocessing.Queue()
+    pending = deque(enumerate(configurations))
+    running = {}
+    failures = []
+    try:
+        while pending or running:
+            while pending and len(running) < workers:
+                (index, configuration) = pending.popleft()
+                process = multiprocessing.Process(target=_solveConfiguration, daemon=True,
+                    args=(index, type(puzzle), puzzle._arguments, puzzle._recipe, configuration, results))
+                process.start()
+                running[index] = process
+            try:
+                (index, status, payload, childReport) = results.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                for (index, process) in list(running.items()):
+                    if process.exitcode not in (None, 0):
+                        del running[index]
+                        failures.append('{}: exited with code {}'.format(configurations[index], process.exitcode))
+                continue
+            running.pop(index).join()
+            if status not in ('sat', 'unsat'):
+                failures.append('{}: {}'.format(configurations[index], payload))
+                continue
+            report.result = status
+            report.configuration = configurations[index]
+            if childReport is not None:
+                report.assertions = childReport['assertions']
+                report.statistics = childReport['statistics']
+            if status == 'unsat':
+                raise NoSolutionError(clues=payload)
+            return payload
+        raise RuntimeError('No portfolio configuration solved the puzzle: ' + '; '.join(failures))
+    finally:
+        for process in running.values():
+            process.terminate()
+        for process in running.values():
+            process.join()
+        results.close()
+        report.check = time.perf_counter() - started
+        puzzle._finishReport(report)
+
+
+def _solveConfiguration(index, cls, arguments, recipe, configuration, results):
+    """
+    Worker process: solves one configuration and puts (index, status, payload,
+    report) on results.  The payload is the answer, the conflicting clues of
+    an unsolvable puzzle or a description of the error.
+    """
+    puzzle = None
+    try:
+        puzzle = Rebuild(cls, arguments, recipe, configuration)
+        answer = puzzle.Solution()
+        results.put((index, 'sat', answer, puzzle.lastReport.AsDict()))
+    except Exception as e:
+        report = puzzle.lastReport if puzzle is not None else None
+        # Only send plain values back: Z3 exceptions and objects may not pickle
+        if isinstance(e, NoSolutionError):
+            (status, payload) = ('unsat', e.clues)
+        else:
+            (status, payload) = ('error', '{}: {}'.format(type(e).__name__, e))
+        results.put((index, status, payload, report.AsDict() if report else None))
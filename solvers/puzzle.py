@@ -0,0 +1,528 @@
+"""Common behaviour shared by the Z3 backed puzzle solvers"""
+from z3 import *
+import functools
+import hashlib
+import inspect
+import json
+import threading
+import time
+
+# Callables invoked with every SolveReport (see AddSolveHook)
+_solveHooks = []
+
+def AddSolveHook(hook):
+    """
+    Registers a callable that receives the SolveReport of every solve, for
+    example to export the numbers to a metrics pipeline.  Exceptions raised
+    by a hook propagate to the caller of Solution().
+    """
+    _solveHooks.append(hook)
+
+def RemoveSolveHook(hook):
+    """Unregisters a hook added by AddSolveHook"""
+    _solveHooks.remove(hook)
+
+
+def Recorded(method):
+    """
+    Decorator for the public methods that add clues or constraints to a
+    puzzle.  Each outermost call is appended to the puzzle's recipe so that
+    the same puzzle can be rebuilt in another process (see Puzzle.Solution).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._recording == 0:
+            self._currentCall = (method.__name__, args, kwargs)
+        self._recording += 1
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            self._recording -= 1
+            if self._recording == 0:
+                self._clueChanges += 1
+        if self._recording == 0:
+            self._recipe.append((method.__name__, args, kwargs))
+        return result
+    return wrapper
+
+
+class SolveTimeoutError(TimeoutError):
+    """Raised when a solve is interrupted or times out before Z3 reaches an answer"""
+    pass
+
+
+class NoSolutionError(ValueError):
+    """
+    Raised when a puzzle has no solution.  clues lists the descriptions of a
+    minimal set of the puzzle's clues that cannot all hold together (see
+    Puzzle._addClue), in the order they were added.  It is empty when the
+    conflict involves no clues and None when the engine that found no
+    solution cannot tell which clues conflict.
+    """
+
+    def __init__(self, message='Puzzle has no solution', clues=None):
+        if clues:
+            message += '; conflicting clues: ' + ', '.join(clues)
+        super().__init__(message)
+        self.clues = clues
+
+
+class SolveReport:
+    """
+    Timings and solver statistics for one call to Solution().
+
+    puzzle: Name of the puzzle class
+    engine: 'z3', or the name of the native engine that produced the answer
+    result: 'sat', 'unsat' or 'unknown'
+    construction: Seconds from creating the puzzle (or the end of its previous
+        solve) until check() was called.  This includes constraints built
+        lazily at solve time and any time the caller spent in between.
+    check: Seconds spent searching for a solution
+    extraction: Seconds spent converting the model into the returned value
+    variables: Number of Z3 variables backing the solution cells
+    assertions: Number of assertions in the solver
+    statistics: Dict of the Z3 solver statistics, such as conflicts,
+        decisions and memory
+    configuration: The portfolio configuration that produced the answer, or
+        None when the puzzle was not solved by a portfolio
+    resolved: Number of cells solved by logical preprocessing before the
+        check (see Sudoku.Preprocess)
+    """
+
+    def __init__(self, puzzle, engine='z3'):
+        self.puzzle = puzzle
+        self.engine = engine
+        self.result = 'unknown'
+        self.construction = 0.0
+        self.check = 0.0
+        self.extraction = 0.0
+        self.variables = 0
+        self.assertions = 0
+        self.statistics = {}
+        self.configuration = None
+        self.resolved = 0
+
+    def Total(self):
+        """Returns the wall time of all three phases in seconds"""
+        return self.construction + self.check + self.extraction
+
+    def AsDict(self):
+        """Returns the report as a dict suitable for JSON serialisation"""
+        return dict(vars(self))
+
+    def __repr__(self):
+        return 'SolveReport({})'.format(', '.join('{}={!r}'.format(k, v) for (k, v) in vars(self).items()))
+
+
+class Puzzle:
+    """
+    Base class for the puzzle solvers.  Subclasses provide a Z3 solver in
+    self.solver and implement _extractSolution().  Grid puzzles derive from
+    GridPuzzle, set self.grid and self.encoding and implement _cells() so
+    that solutions can be blocked.
+
+    After each call to Solution(), lastReport holds its SolveReport.
+
+    Constructor arguments and the calls to methods marked @Recorded make up
+    the puzzle's recipe, from which Solution(portfolio=...) rebuilds it in
+    worker processes.  Constraints added to the solver directly are not part
+    of the recipe.
+
+    Every puzzle constructor takes an optional ctx, a z3.Context that the
+    puzzle's variables and solver are created in.  Puzzles in different
+    contexts can be built and solved from different threads at once (see
+    threads.SolveThreaded); with no ctx they share Z3's global context.
+    """
+
+    # Constructor arguments that change how a puzzle is solved but not its answer
+    CONFIGURATION_ARGUMENTS = ('encoding', 'engine')
+
+    def __new__(cls, *args, **kwargs):
+        puzzle = super().__new__(cls)
+        puzzle._constructionStart = time.perf_counter()
+        puzzle.lastReport = None
+        # Constructor arguments by name, then (method, args, kwargs) for each recorded call
+        arguments = inspect.signature(cls.__init__).bind(None, *args, **kwargs).arguments
+        puzzle._arguments = dict(list(arguments.items())[1:])
+        # A Context cannot leave the process, so it is not one of the recorded arguments
+        puzzle.ctx = puzzle._arguments.pop('ctx', None)
+        puzzle._recipe = []
+        puzzle._recording = 0
+        # Number of recorded calls made or undone, so that results derived from
+        # the clues can tell when they are out of date
+        puzzle._clueChanges = 0
+        # The outermost recorded call in progress, which describes the clues it adds
+        puzzle._currentCall = None
+        # Description of each clue added by _addClue(), keyed on the name of its tracking literal
+        puzzle._clues = {}
+        # Logic passed to SolverFor() by _newSolver(), e.g. 'QF_FD'.  None uses Solver()
+        puzzle._logic = None
+        # The solver whose check() is in flight, and the Event that cancels the
+        # SolveAsync() call running it
+        puzzle._activeSolver = None
+        puzzle._cancel = None
+        return puzzle
+
+    def Solution(self, portfolio=None, workers=None, cache=None):
+        """
+        Solves the puzzle and returns the values.
+
+        portfolio: Optional list of configurations to race in separate
+            processes; the first answer wins and the other processes are
+            terminated.  Each configuration is a dict that may hold 'logic'
+            (passed to SolverFor), 'seed' (Z3's random seed) and any
+            constructor argument such as 'encoding'
+        workers: Number of configurations to run at once.  Defaults to one per
+            configuration, up to the number of CPUs
+        cache: Optional SolutionCache consulted before solving and updated
+            afterwards, keyed on the canonical definition of the puzzle
+        """
+        if cache is not None:
+            (definition, toCanonical, fromCanonical) = self._canonicalForm()
+            key = CacheKey(definition)
+            cached = cache.Get(key)
+            if cached is not None:
+                report = self._startReport('cache')
+                report.result = 'sat'
+                self._finishReport(report)
+                return fromCanonical(cached)
+        if portfolio is not None:
+            from .portfolio import SolvePortfolio
+            answer = SolvePortfolio(self, portfolio, workers)
+        else:
+            answer = self._solve()
+        if cache is not None:
+            cache.Put(key, toCanonical(answer))
+        return answer
+
+    def _solve(self):
+        """Solves the puzzle with its own engine, recording a SolveReport"""
+        report = self._startReport()
+        self._prepareSolver()
+        solver = self.solver
+        started = time.perf_counter()
+        report.construction += started - self._constructionStart
+        result = self._check(solver)
+        checked = time.perf_counter()
+        report.check = checked - started
+        report.result = str(result)
+        try:
+            if result == sat:
+                answer = self._extractSolution(solver.model())
+        finally:
+            report.extraction = time.perf_counter() - checked
+            report.assertions = len(solver.assertions())
+            report.statistics = _statisticsDict(solver.statistics())
+            self._finishReport(report)
+        if result == unsat:
+            raise NoSolutionError(clues=self._conflictingClues(solver))
+        if result != sat:
+            raise SolveTimeoutError('Solve stopped without an answer: ' + solver.reason_unknown())
+        return answer
+
+    def _addClue(self, constraints, description=None):
+        """
+        Adds the constraints stated by one clue to the solver, tracked so that
+        an unsolvable puzzle reports which clues conflict (see NoSolutionError).
+
+        constraints: A Z3 constraint or a list of them
+        description: How the clue is reported.  Defaults to the recorded call
+            in progress, such as "AddSquare(0, 0, 5)"
+
+        Returns the literal that tracks the clue, or None if there were no
+        constraints to add.
+        """
+        if isinstance(constraints, list):
+            if not constraints:
+                return None
+            constraints = constraints[0] if len(constraints) == 1 else And(constraints)
+        if description is None:
+            (name, args, kwargs) = self._currentCall
+            description = '{}({})'.format(name, ', '.join([repr(a) for a in args] +
+                                                          ['{}={!r}'.format(k, v) for (k, v) in kwargs.items()]))
+        literal = FreshBool('clue', self.ctx)
+        self._clues[literal.decl().name()] = description
+        self.solver.assert_and_track(constraints, literal)
+        return literal
+
+    def _conflictingClues(self, solver, assumptions=()):
+        """
+        Returns the descriptions of a minimal set of conflicting clues once
+        check() has found the solver unsat.  Each clue of Z3's unsat core is
+        dropped in turn and left out if the others still conflict.  Any
+        assumptions the check was made under are kept throughout.
+        """
+        core = [l for l in solver.unsat_core() if l.decl().name() in self._clues]
+        if len(core) > 1:
+            # A solver assumes its tracked clues in every check, so the core is
+            # shrunk against a copy of the assertions where they are optional
+            relaxed = self._newSolver()
+            relaxed.add(solver.assertions())
+            i = 0
+            while i < len(core):
+                rest = core[:i] + core[i + 1:]
+                if self._check(relaxed, rest + list(assumptions)) == unsat:
+                    names = set(l.decl().name() for l in relaxed.unsat_core())
+                    core = [l for l in rest if l.decl().name() in names]
+                else:
+                    i += 1
+        names = set(l.decl().name() for l in core)
+        return [d for (name, d) in self._clues.items() if name in names]
+
+    def CountSolutions(self, limit=None):
+        """
+        Returns the number of distinct solutions, stopping as soon as limit have
+        been found.  With no limit every solution is enumerated.  The solver is
+        reused and left unchanged afterwards.
+        """
+        self._prepareSolver()
+        solver = self.solver
+        count = 0
+        solver.push()
+        try:
+            while (limit is None or count < limit) and self._checkDecided(solver) == sat:
+                count += 1
+                literals = self._solutionLiterals(solver.model())
+                solver.add(Or([Not(l) for l in literals]))
+        finally:
+            solver.pop()
+        return count
+
+    def IsUnique(self):
+        """Returns True if the puzzle has exactly one solution"""
+        return self.CountSolutions(limit=2) == 1
+
+    async def SolveAsync(self, timeout=None, cache=None):
+        """
+        Solves the puzzle in the event loop's default executor and returns the
+        same values as Solution().  If timeout seconds pass first, or the
+        awaiting task is cancelled, the in-flight Z3 check is interrupted and
+        SolveTimeoutError (or CancelledError) is raised; lastReport then has
+        the result 'unknown'.  Native engines run to completion in the
+        background but their answer is discarded.
+
+        timeout: Seconds to wait for an answer.  None waits indefinitely
+        cache: Optional SolutionCache, as for Solution()
+        """
+        import asyncio
+        cancel = threading.Event()
+        future = asyncio.get_running_loop().run_in_executor(None, self.__solveCancellable, cancel, cache)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self._interrupt(cancel)
+            # The interrupted Solution() raises in the executor; nobody is waiting for it any more
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise SolveTimeoutError('No solution found within {} seconds'.format(timeout)) from None
+
+    def __solveCancellable(self, cancel, cache):
+        """Runs Solution() in an executor thread, stopping its Z3 checks once cancel is set"""
+        self._cancel = cancel
+        try:
+            return self.Solution(cache=cache)
+        finally:
+            self._cancel = None
+
+    def _check(self, solver, assumptions=()):
+        """Runs solver.check() so that _interrupt() can stop it from another thread"""
+        self._activeSolver = solver
+        try:
+            cancel = self._cancel
+            if cancel is not None and cancel.is_set():
+                return unknown
+            return solver.check(*assumptions)
+        finally:
+            self._activeSolver = None
+
+    def _checkDecided(self, solver, assumptions=()):
+        """Like _check(), but raises SolveTimeoutError instead of returning unknown"""
+        result = self._check(solver, assumptions)
+        if result != sat and result != unsat:
+            raise SolveTimeoutError('Solve stopped without an answer: ' + solver.reason_unknown())
+        return result
+
+    def _interrupt(self, cancel):
+        """Cancels the SolveAsync() call owning cancel, stopping its in-flight Z3 check"""
+        cancel.set()
+        solver = self._activeSolver
+        if solver is not None and self._cancel is cancel:
+            Z3_solver_interrupt(solver.ctx.ref(), solver.solver)
+
+    def _startReport(self, engine='z3'):
+        """Returns a new SolveReport whose construction time runs up to now"""
+        now = time.perf_counter()
+        report = SolveReport(type(self).__name__, engine)
+        report.construction = now - self._constructionStart
+        self._constructionStart = now
+        return report
+
+    def _finishReport(self, report):
+        """Records a completed report and passes it to the solve hooks"""
+        if report.engine == 'z3':
+            report.variables = sum(len(c) if isinstance(c, tuple) else 1 for c in self._cells())
+        self._constructionStart = time.perf_counter()
+        self.lastReport = report
+        for hook in list(_solveHooks):
+            hook(report)
+
+    def _canonicalForm(self):
+        """
+        Returns (definition, toCanonical, fromCanonical) for the solution cache.
+        definition is a JSON-serialisable description of the puzzle that
+        equivalent puzzles share, and the two functions map answers between
+        this puzzle and that shared form.  By default the definition is the
+        recipe, ignoring arguments listed in CONFIGURATION_ARGUMENTS and the
+        order of the recorded calls.
+        """
+        arguments = dict((k, v) for (k, v) in self._arguments.items() if k not in self.CONFIGURATION_ARGUMENTS)
+        recipe = sorted(_canonicalJson([name, args, kwargs]) for (name, args, kwargs) in self._recipe)
+        definition = {'puzzle': type(self).__name__, 'arguments': arguments, 'recipe': recipe}
+        identity = lambda answer: answer
+        return (definition, identity, identity)
+
+    def _newSolver(self):
+        """Returns a new Z3 solver for the puzzle's constraints"""
+        return SolverFor(self._logic, ctx=self.ctx) if self._logic else Solver(ctx=self.ctx)
+
+    def _prepareSolver(self):
+        """Adds any constraints that can only be built once the puzzle is complete"""
+        pass
+
+    def _extractSolution(self, model):
+        """Converts a model of the solver into the value returned by Solution()"""
+        raise NotImplementedError()
+
+    def _cells(self):
+        """Returns the cells that make up a solution, excluding auxiliary variables"""
+        raise NotImplementedError()
+
+    def _solutionLiterals(self, model):
+        """Returns conditions that together pin every solution cell to its value in the model"""
+        return [self.encoding.Equals(c, self.encoding.Decode(model, c)) for c in self._cells()]
+
+
+
+class GridPuzzle(Puzzle):
+    """
+    Base class for the puzzles played on a grid of cells, which adds hints
+    for a player's partial solution (see ForcedCells).  Subclasses provide
+    self.grid, a Z3EncodedDict2D of the cells in self.encoding.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        puzzle = super().__new__(cls, *args, **kwargs)
+        # Assumption literal for each (cell index, value) tested by ForcedCells(),
+        # and (assignment, clue changes, forced cells) from its last call
+        puzzle._hintLiterals = {}
+        puzzle._lastForced = None
+        return puzzle
+
+    def ForcedCells(self, assignment=None):
+        """
+        Returns a dict of (x,y) to value for the cells that hold the same value
+        in every solution agreeing with assignment (the backbone), leaving out
+        the assigned cells and those the puzzle itself fixes, such as sudoku
+        clues.  Raises NoSolutionError if no solution agrees with the
+        assignment.
+
+        The assignment is passed to one persistent solver as assumptions:
+        after one check, each remaining cell is tested by assuming it differs
+        from the value found, and every model found rules out further cells.
+        The result is kept until the assignment or puzzle changes, and cells
+        forced by a smaller assignment are not tested again.  The tests are
+        cheapest under ONEHOT_ENCODING, where cell values are plain Bools.
+
+        The first call builds the Z3 solver and tests every open cell.  On a
+        9x9 sudoku solved with Z3 this took 80-150ms under ONEHOT_ENCODING,
+        but 1.6s under INT_ENCODING and 8s under BITVEC_ENCODING for a hard
+        puzzle.  Later calls take a few milliseconds.  Classic sudokus on the
+        native engine are faster still (see Sudoku.ForcedCells).
+
+        assignment: Dict of (x,y) to value, such as a player's entries
+        """
+        assignment = dict(assignment or {})
+        version = self._clueChanges
+        last = self._lastForced
+        if last is not None and last[0] == assignment and last[1] == version:
+            return dict(last[2])
+        self._prepareSolver()
+        solver = self.solver
+        cells = self.grid
+        literal = self.__hintLiteral
+        assumptions = []
+        for (cell, value) in assignment.items():
+            if cell not in cells or not (self.encoding.low <= value <= self.encoding.high):
+                raise ValueError('Invalid assignment: {} = {}'.format(cell, value))
+            assumptions.append(literal(cells.Index(cell), value))
+        if self._checkDecided(solver, assumptions) == unsat:
+            message = 'Puzzle has no solution with this assignment' if assignment else 'Puzzle has no solution'
+            raise NoSolutionError(message, self._conflictingClues(solver, assumptions))
+        model = solver.model()
+        skipped = set(assignment) | self._givenCells()
+        known = {}
+        if last is not None and last[1] == version and all(assignment.get(c) == v for (c, v) in last[0].items()):
+            # Adding entries only removes solutions, so these cells stay forced
+            known = dict((c, v) for (c, v) in last[2].items() if c not in skipped)
+        candidates = dict((cells.Index(c), self.encoding.Decode(model, g)) for (c, g) in cells.items()
+                          if c not in skipped and c not in known)
+        forced = {}
+        while candidates:
+            (index, value) = candidates.popitem()
+            if self._checkDecided(solver, assumptions + [Not(literal(index, value))]) == unsat:
+                forced[index] = value
+                continue
+            model = solver.model()
+            for (other, otherValue) in list(candidates.items()):
+                if self.encoding.Decode(model, cells.cells[other]) != otherValue:
+                    del candidates[other]
+        width = cells.width
+        known.update(((i % width, i // width), v) for (i, v) in forced.items())
+        self._lastForced = (assignment, version, known)
+        return dict(known)
+
+    def NextHint(self, assignment=None):
+        """
+        Returns ((x,y), value) for a cell forced by assignment (see
+        ForcedCells), the first in reading order, or None if no unassigned
+        cell is forced.  With no assignment the last one passed to
+        ForcedCells() is used.
+        """
+        if assignment is None and self._lastForced is not None:
+            assignment = self._lastForced[0]
+        forced = self.ForcedCells(assignment)
+        if not forced:
+            return None
+        cell = min(forced, key=lambda c: (c[1], c[0]))
+        return (cell, forced[cell])
+
+    def __hintLiteral(self, index, value):
+        """Returns a Bool equivalent to the cell at index holding value, for use as an assumption"""
+        key = (index, value)
+        if key not in self._hintLiterals:
+            condition = self.encoding.Equals(self.grid.cells[index], value)
+            if is_const(condition):
+                self._hintLiterals[key] = condition
+            else:
+                literal = FreshBool('hint', self.ctx)
+                self.solver.add(literal == condition)
+                self._hintLiterals[key] = literal
+        return self._hintLiterals[key]
+
+    def _givenCells(self):
+        """Returns the (x,y) cells whose values the puzzle itself states, which ForcedCells() leaves out"""
+        return set()
+
+
+def CacheKey(definition):
+    """Returns the SolutionCache key for a puzzle definition from _canonicalForm()"""
+    return hashlib.sha256(_canonicalJson(definition).encode('utf-8')).hexdigest()
+
+def _canonicalJson(value):
+    """Serialises a value to JSON with a stable key order"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+def _statisticsDict(statistics):
+    """Converts Z3 solver statistics into a dict"""
+    return dict((k, statistics.get_key_value(k)) for k in statistics.keys())
@@ -0,0 +1,401 @@
+"""
+Long-running solve server with a pool of warm worker processes.
+
+Run with: python -m solvers.server [--port 8765] [--workers N] [--warm sudoku:3,kenken:6]
+
+Each worker process imports Z3 and the puzzle modules once and keeps a
+SudokuSession or KenKenSession for every size it has seen (plus the --warm
+sizes, built at start-up), so a request only pays for its own solve.  Plain
+sudoku strings and Keen game IDs use the sessions; anything else is built
+from scratch as by python -m solvers.
+
+POST /solve takes one puzzle in the JSON format read by python -m solvers
+(see cli), optionally with a "timeout" in seconds, and answers with the same
+JSON that python -m solvers writes for it.  A request that runs out of time
+answers 504 and its worker is replaced; 503 means the queue is full and 400
+that the request is not a JSON object or its timeout is not a positive number.  GET
+/stats returns the counters from SolvePool.Stats().
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .puzzle import SolveTimeoutError
+
+# Puzzle types that workers keep sessions for, as used in --warm
+SESSION_TYPES = ('sudoku', 'kenken')
+
+# Keys a request may have and still be solved by a session
+_PLAIN_KEYS = {'id', 'type', 'puzzle', 'gameId', 'timeout'}
+
+
+class SolvePool:
+    """
+    Solves puzzle requests (see cli) on a pool of warm worker processes.
+    Requests wait in a queue of at most maxQueue entries for the next free
+    worker.  Submit() may be called from many threads at once.
+    """
+
+    DEFAULT_MAX_SOLVES = 1000
+    DEFAULT_MAX_QUEUE = 1000
+    DEFAULT_TIMEOUT = 60
+
+    def __init__(self, workers=None, warm=(), maxSolves=DEFAULT_MAX_SOLVES, maxQueue=DEFAULT_MAX_QUEUE,
+                 timeout=DEFAULT_TIMEOUT):
+        """
+        workers: Number of worker processes.  Defaults to the CPU count
+        warm: (type, size) pairs of SESSION_TYPES whose sessions every worker
+            builds before taking requests; the size of a sudoku is its dimension
+        maxSolves: Requests a worker solves before it is replaced, to cap its memory
+        maxQueue: Requests that may wait for a worker before Submit() raises queue.Full
+        timeout: Default seconds a worker may spend on a request
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1 or maxSolves < 1:
+            raise ValueError('Invalid pool size: {} workers, {} solves'.format(workers, maxSolves))
+        for (kind, size) in warm:
+            if kind not in SESSION_TYPES or not isinstance(size, int) or size < 1:
+                raise ValueError('Invalid warm session: {}:{}'.format(kind, size))
+        self.workers = workers
+        self.warm = list(warm)
+        self.maxSolves = maxSolves
+        self.timeout = _checkTimeout(timeout)
+        self.__queue = queue.Queue(maxQueue)
+        self.__lock = threading.Lock()
+        self.__started = time.monotonic()
+        self.__counters = dict.fromkeys(
+            ['submitted', 'solved', 'failed', 'timeouts', 'rejected', 'recycled', 'restarts', 'busy', 'maxQueued'], 0)
+        self.__solveSeconds = 0.0
+        self.__threads = [threading.Thread(target=self.__dispatch, daemon=True) for i in range(workers)]
+        for thread in self.__threads:
+            thread.start()
+
+    def Submit(self, definition, timeout=None):
+        """
+        Solves one decoded puzzle request and returns the output object (see
+        cli).  Raises ValueError for a timeout that is not a positive number
+        of seconds, queue.Full if too many requests are waiting and
+        SolveTimeoutError if the worker runs out of time.
+
+        timeout: Seconds the worker may spend on the request.  Defaults to the
+            request's "timeout", then the pool's
+        """
+        if timeout is None:
+            timeout = definition.get('timeout', self.timeout)
+        timeout = _checkTimeout(timeout)
+        future = Future()
+        try:
+            self.__queue.put_nowait((definition, timeout, future))
+        except queue.Full:
+            self.__count('rejected')
+            raise
+        with self.__lock:
+            self.__counters['submitted'] += 1
+            self.__counters['maxQueued'] = max(self.__counters['maxQueued'], self.__queue.qsize())
+        return future.result()
+
+    def Stats(self):
+        """
+        Returns a dict of counters: requests submitted, solved, failed (an
+        error answer), timed out and rejected because the queue was full,
+        workers recycled after maxSolves and restarted after a timeout or
+        crash, workers busy now, requests queued now and at most, and the
+        throughput and mean solve time since the pool started
+        """
+        with self.__lock:
+            stats = dict(self.__counters)
+            solveSeconds = self.__solveSeconds
+        uptime = time.monotonic() - self.__started
+        completed = stats['solved'] + stats['failed']
+        stats.update(workers=self.workers, queued=self.__queue.qsize(), uptime=uptime,
+                     throughput=completed / uptime if uptime > 0 else 0.0,
+                     meanSeconds=solveSeconds / completed if completed else 0.0)
+        return stats
+
+    def Close(self):
+        """Stops the workers once the queued requests have been solved"""
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+
+    def __run(self, worker, solves, definition, timeout, future):
+        """
+        Solves one job on worker and resolves its future.  Returns the worker
+        to use next, or None if it has to be replaced, and its solve count
+        """
+        self.__count('busy')
+        started = time.perf_counter()
+        (process, connection) = worker
+        try:
+            connection.send(definition)
+            if connection.poll(timeout):
+                output = connection.recv()
+            else:
+                output = None
+        except (EOFError, OSError):
+            output = {'id': definition.get('id'), 'error': 'RuntimeError: Worker process exited'}
+            _stopWorker(worker)
+            worker = None
+            self.__count('restarts')
+        finally:
+            with self.__lock:
+                self.__counters['busy'] -= 1
+                self.__solveSeconds += time.perf_counter() - started
+        if output is None:
+            _stopWorker(worker)
+            self.__count('timeouts')
+            self.__count('restarts')
+            future.set_exception(SolveTimeoutError('No solution found within {} seconds'.format(timeout)))
+            return (None, solves)
+        self.__count('failed' if 'error' in output else 'solved')
+        future.set_result(output)
+        solves += 1
+        if worker is not None and solves >= self.maxSolves:
+            _stopWorker(worker, graceful=True)
+            worker = None
+            self.__count('recycled')
+        return (worker, solves)
+
+    def __count(self, name, amount=1):
+        with self.__lock:
+            self.__counters[name] += amount
+
+    def __dispatch(self):
+        """Feeds queued requests to one worker process, replacing it when it is recycled, times out or dies"""
+        worker = None
+        while True:
+            if worker is None:
+                solves = 0
+                try:
+                    worker = _startWorker(self.warm)
+                except (EOFError, OSError):
+                    worker = None
+            job = self.__queue.get()
+            if job is None:
+                break
+            (definition, timeout, future) = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            if worker is None:
+                # Answer rather than leave the request waiting, then try starting a worker again
+                self.__count('failed')
+                future.set_result({'id': definition.get('id'), 'error': 'RuntimeError: Worker process failed to start'})
+                continue
+            try:
+                (worker, solves) = self.__run(worker, solves, definition, timeout, future)
+            except Exception as e:
+                # One bad job must not stop the dispatcher and strand the requests
+                # behind it.  The worker may be left mid-message, so replace it
+                _stopWorker(worker)
+                worker = None
+                self.__count('restarts')
+                if not future.done():
+                    self.__count('failed')
+                    future.set_exception(e)
+        if worker is not None:
+            _stopWorker(worker, graceful=True)
+
+
+def _checkTimeout(timeout):
+    """Returns a timeout in seconds as a float, raising ValueError unless it is a finite positive number"""
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not 0 < timeout < math.inf:
+        raise ValueError('Invalid timeout: {!r}'.format(timeout))
+    return float(timeout)
+
+
+def _startWorker(warm):
+    """Starts a worker process and waits until its sessions are built.  Returns (process, connection)"""
+    # Spawned rather than forked, since the server process runs many threads
+    context = multiprocessing.get_context('spawn')
+    (connection, child) = context.Pipe()
+    process = context.Process(target=_workerMain, args=(child, warm), daemon=True)
+    process.start()
+    child.close()
+    connection.recv()
+    return (process, connection)
+
+
+def _stopWorker(worker, graceful=False):
+    """Stops a worker process, letting it finish cleanly if graceful"""
+    (process, connection) = worker
+    if graceful:
+        try:
+            connection.send(None)
+        except OSError:
+            pass
+        process.join(1)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    connection.close()
+
+
+def _workerMain(connection, warm):
+    """Worker process: builds the warm sessions, then answers requests until sent None"""
+    sessions = {}
+    for (kind, size) in warm:
+        _session(sessions, kind, size)
+    connection.send('ready')
+    while True:
+        try:
+            definition = connection.recv()
+        except EOFError:
+            return
+        if definition is None:
+            return
+        connection.send(_solveRequest(definition, sessions))
+
+
+def _solveRequest(definition, sessions):
+    """Solves one request in a worker, returning the output object that python -m solvers writes"""
+    from .cli import SolveDefinition
+    if set(definition) <= _PLAIN_KEYS:
+        kind = definition.get('type')
+        if kind == 'sudoku' and isinstance(definition.get('puzzle'), str):
+            return SolveDefinition(definition, solve=lambda: _solveSudoku(definition['puzzle'], sessions))
+        if kind == 'kenken' and isinstance(definition.get('gameId'), str):
+            return SolveDefinition(definition, solve=lambda: _solveKenKen(definition['gameId'], sessions))
+    return SolveDefinition(definition)
+
+
+def _solveSudoku(puzzle, sessions):
+    """Solves a sudoku string natively, falling back to the warm session as Sudoku does.  Returns (solution, engine)"""
+    from .bitmask import SolveBitmask
+    from .sudoku import Sudoku, _parsePuzzleString
+    (dimension, clues) = _parsePuzzleString(puzzle)
+    found = SolveBitmask(dimension, clues, 1, Sudoku.AUTO_NATIVE_NODE_LIMIT)
+    if found is None:
+        return (_session(sessions, 'sudoku', dimension).Solve(clues), 'z3')
+    if not found:
+        raise ValueError('Puzzle has no solution')
+    size = dimension * dimension
+    return ([found[0][y * size:(y + 1) * size] for y in range(size)], Sudoku.ENGINE_NATIVE)
+
+
+def _solveKenKen(gameId, sessions):
+    """Solves a Keen game ID with the warm session for its size.  Returns (solution, engine)"""
+    from .gameid import ParseKeen
+    (size, cages) = ParseKeen(gameId)
+    return (_session(sessions, 'kenken', size).Solve(cages), 'z3')
+
+
+def _session(sessions, kind, size):
+    """Returns the worker's session for a puzzle type and size, building it on first use"""
+    key = (kind, size)
+    if key not in sessions:
+        if kind == 'sudoku':
+            from .sudoku import SudokuSession
+            sessions[key] = SudokuSession(size)
+        else:
+            from .kenken import KenKenSession
+            sessions[key] = KenKenSession(size)
+    return sessions[key]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers /solve and /stats for the SolvePool in server.pool"""
+
+    # Keep connections open between requests, which saves a round trip per solve
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path != '/solve':
+            return self.__reply(404, {'error': 'Not found: ' + self.path})
+        try:
+            definition = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            if not isinstance(definition, dict):
+                raise ValueError('Expected a JSON object')
+        except ValueError as e:
+            return self.__reply(400, {'error': '{}: {}'.format(type(e).__name__, e)})
+        try:
+            self.__reply(200, self.server.pool.Submit(definition))
+        except ValueError as e:
+            self.__reply(400, {'id': definition.get('id'), 'error': '{}: {}'.format(type(e).__name__, e)})
+        except queue.Full:
+            self.__reply(503, {'id': definition.get('id'), 'error': 'The solve queue is full'})
+        except SolveTimeoutError as e:
+            self.__reply(504, {'id': definition.get('id'), 'error': '{}: {}'.format(type(e).__name__, e)})
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self.__reply(404, {'error': 'Not found: ' + self.path})
+        self.__reply(200, self.server.pool.Stats())
+
+    def __reply(self, status, body):
+        data = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def Serve(pool, host='127.0.0.1', port=8765, verbose=False):
+    """Returns an HTTP server answering requests with pool; call serve_forever() on it"""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.pool = pool
+    server.verbose = verbose
+    return server
+
+
+def _parseWarm(text):
+    """Parses --warm, a comma separated list of type:size"""
+    warm = []
+    for item in filter(None, text.split(',')):
+        (kind, colon, size) = item.partition(':')
+        if not colon or not size.isdigit():
+            raise ValueError('Expected type:size, got ' + item)
+        warm.append((kind, int(size)))
+    return warm
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m solvers.server', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--workers', type=int, help='Number of worker processes.  Defaults to the CPU count')
+    parser.add_argument('--warm', default='sudoku:3,kenken:4,kenken:5,kenken:6,kenken:7,kenken:8,kenken:9',
+                        help='Comma separated type:size sessions each worker builds at start-up')
+    parser.add_argument('--max-solves', type=int, default=SolvePool.DEFAULT_MAX_SOLVES,
+                        help='Requests a worker solves before it is replaced')
+    parser.add_argument('--max-queue', type=int, default=SolvePool.DEFAULT_MAX_QUEUE,
+                        help='Requests that may wait for a worker')
+    parser.add_argument('--timeout', type=float, default=SolvePool.DEFAULT_TIMEOUT,
+                        help='Default seconds a request may take')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args(argv)
+    try:
+        warm = _parseWarm(args.warm)
+        pool = SolvePool(args.workers, warm, args.max_solves, args.max_queue, args.timeout)
+    except ValueError as e:
+        parser.error(str(e))
+    server = Serve(pool, args.host, args.port, args.verbose)
+    print('Serving on http://{}:{}/ with {} workers'.format(args.host, server.server_address[1], pool.workers),
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.Close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
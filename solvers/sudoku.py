@@ -1,47 +1,279 @@
 from z3 import *
 from .z3util import *
+from .puzzle import GridPuzzle, NoSolutionError, Recorded
+from .bitmask import Deduce, SolveBitmask
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
 from enum import Enum
+from functools import lru_cache
+from itertools import islice
+import os
+import time
 
+# Characters used by FromString and SolutionString.  '.' and '0' are empty cells.
+SYMBOLS = '123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
 
-class Sudoku:
+
+class Sudoku(GridPuzzle):
     EMPTY = 0
     PLUS = 1
     MINUS = 2
 
-    """Solver for Sudoku Logic Puzzle"""
+    # Engines used by Solution().  AUTO uses the native bitmask engine when the
+    # puzzle only contains AddSquare clues and Z3 otherwise.
+    ENGINE_AUTO = 'auto'
+    ENGINE_NATIVE = 'native'
+    ENGINE_Z3 = 'z3'
+
+    # Search steps the native engine may take under ENGINE_AUTO before handing
+    # the puzzle to Z3.  Backtracking without learning is heavy-tailed on some
+    # large grids that Z3 solves easily.
+    AUTO_NATIVE_NODE_LIMIT = 20000
 
-    # TODO: Constructor that takes string or array input
+    DEFAULT_ENCODING = INT_ENCODING # Used when no encoding is passed to the constructor
+
+    CONFIGURATION_ARGUMENTS = GridPuzzle.CONFIGURATION_ARGUMENTS + ('preprocess',)
+
+    """Solver for Sudoku Logic Puzzle"""
 
-    def __init__(self, dimension=3):
+    def __init__(self, dimension=3, engine=ENGINE_AUTO, encoding=None, preprocess=False, ctx=None):
         """
         Creates empty sudoku puzzle.
 
         Dimension: Size of each sub-square.  For a standard sudoku the dimension is 3
+        engine: One of ENGINE_AUTO, ENGINE_NATIVE or ENGINE_Z3
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding).  Defaults to DEFAULT_ENCODING
+        preprocess: Apply logical deductions to the clues before each Z3 solve (see Preprocess)
+        ctx: Z3 Context for the puzzle (see Puzzle).  None uses Z3's global context
         """
+        if engine not in (Sudoku.ENGINE_AUTO, Sudoku.ENGINE_NATIVE, Sudoku.ENGINE_Z3):
+            raise ValueError('Invalid engine: ' + str(engine))
         self.__prefix = 'sudoku'
         self.dimension = dimension
         self.size = dimension * dimension
-        self.grid = Z3IntDict2D(self.size, self.size, self.__prefix)
-        self.solver = Solver()
+        self.engine = engine
+        self.encoding = MakeEncoding(encoding or Sudoku.DEFAULT_ENCODING, 1, self.size, ctx)
+        self.preprocess = preprocess
+        # Cells that the last call to Preprocess() solved beyond the clues
+        self.resolvedCells = 0
         self.debugPrint = False
-        self.__addValueConstraints()
-        self.__addRowConstraints()
-        self.__addColumnConstraints()
-        self.__addSubsquareConstraints()
+        # The Z3 grid and solver are only built once something needs them, so
+        # puzzles solved by the native engine never pay for constraint construction
+        self.__grid = None
+        self.__solver = None
+        self.__clues = []
+        # Tracking literals of the clues in the Z3 solver, in the order of __clues
+        self.__clueLiterals = []
+        self.__hasVariants = False
+        # Number of clues the constraints from Preprocess() were deduced from
+        self.__preprocessed = None
+        # (clue changes, Z3 copy of the puzzle) that ForcedCells() works on while
+        # Solution() uses the native engine
+        self.__hintPuzzle = None
 
-    def Solution(self):
+    @classmethod
+    def FromString(cls, puzzle, engine=ENGINE_AUTO, encoding=None, preprocess=False, ctx=None):
+        """
+        Creates a puzzle from a string of cells in reading order, such as the
+        common 81-character format.  Whitespace is ignored, '.' and '0' are
+        empty cells and values above 9 are written as letters starting at 'A'.
+        """
+        dimension, clues = _parsePuzzleString(puzzle)
+        s = cls(dimension, engine, encoding, preprocess, ctx)
+        for (x, y, val) in clues:
+            s.AddSquare(x, y, val)
+        return s
+
+    def SolutionString(self):
+        """Solves the grid and returns the values in the format read by FromString"""
+        return ''.join(SYMBOLS[val - 1] for row in self.Solution() for val in row)
+
+    @property
+    def grid(self):
+        """Dict keyed on (x,y) tuples of the Z3 variable(s) for each cell"""
+        if self.__grid is None:
+            self.__grid = Z3EncodedDict2D(self.size, self.size, self.__prefix, self.encoding)
+        return self.__grid
+
+    @property
+    def solver(self):
+        """
+        The Z3 solver for the puzzle, built with all clues added so far.  Once
+        it has been requested, Solution() always uses Z3 so that any constraints
+        added to it directly are respected.
+        """
+        if self.__solver is None:
+            self.__solver = self._newSolver()
+            self.__addValueConstraints()
+            self.__addRowConstraints()
+            self.__addColumnConstraints()
+            self.__addSubsquareConstraints()
+            for (x, y, val) in self.__clues:
+                self.__clueLiterals.append(self._addClue(self.encoding.Equals(self.grid[(x,y)], val),
+                                                         _describeSquare(x, y, val)))
+        return self.__solver
+
+    def _solve(self):
         """Solves the grid and returns a 2D array of the values"""
-        self.solver.check()
-        m = self.solver.model()
-        answer = [[0] * self.size for i in range(self.size)]
-        for y in range(self.size):
-            for x in range(self.size):
-                answer[y][x] = int(str(m[self.grid[(x,y)]]))
-        return answer
+        conflict = _conflictingSquares(self.dimension, self.__clues)
+        if conflict is not None:
+            raise NoSolutionError(clues=[_describeSquare(*clue) for clue in conflict])
+        if not self.__usesNativeEngine():
+            return super()._solve()
+        report = self._startReport(Sudoku.ENGINE_NATIVE)
+        started = time.perf_counter()
+        solutions = self.__solveNative(1)
+        report.check = time.perf_counter() - started
+        if solutions is None:
+            # The native engine gave up: report that, then solve again with Z3
+            self._finishReport(report)
+            return super()._solve()
+        report.result = 'sat' if solutions else 'unsat'
+        self._finishReport(report)
+        if not solutions:
+            raise NoSolutionError()
+        flat = solutions[0]
+        return [flat[y * self.size:(y + 1) * self.size] for y in range(self.size)]
+
+    def CountSolutions(self, limit=None):
+        """
+        Returns the number of distinct solutions, stopping as soon as limit have
+        been found.  With no limit every solution is enumerated.
+        """
+        solutions = self.__solveNative(limit)
+        if solutions is None:
+            return super().CountSolutions(limit)
+        return len(solutions)
+
+    def Preprocess(self):
+        """
+        Applies naked singles, hidden singles, pointing pairs and box/line
+        reduction to the clues.  Each cell's domain in the Z3 solver is
+        tightened to the candidates left and solved cells are fixed, which
+        shrinks the search for large grids considerably.  Variant constraints
+        are not used in the deductions.  Returns the number of cells solved
+        beyond the clues.
+
+        The deductions only hold while every clue does, so they are added
+        under the clues' tracking literals and an unsolvable puzzle still
+        reports its conflicting clues.
+        """
+        candidates = Deduce(self.dimension, self.__clues)
+        self.__preprocessed = len(self.__clues)
+        solver = self.solver
+        given = And(self.__clueLiterals) if self.__clueLiterals else BoolVal(True, self.ctx)
+        if candidates is None:
+            self.resolvedCells = 0
+            solver.add(Not(given))
+            return 0
+        full = (1 << self.size) - 1
+        clued = set(y * self.size + x for (x, y, val) in self.__clues)
+        resolved = 0
+        deductions = []
+        for (i, mask) in enumerate(candidates):
+            if mask == full or i in clued:
+                continue
+            g = self.grid.cells[i]
+            values = [v for v in range(1, self.size + 1) if mask >> (v - 1) & 1]
+            if len(values) == 1:
+                resolved += 1
+                deductions.append(self.encoding.Equals(g, values[0]))
+            else:
+                deductions.append(self.encoding.DomainConstraint(g, values))
+        if deductions:
+            solver.add(Implies(given, And(deductions)))
+        self.resolvedCells = resolved
+        return resolved
+
+    def _prepareSolver(self):
+        if self.preprocess and self.__preprocessed != len(self.__clues):
+            self.Preprocess()
 
+    def _finishReport(self, report):
+        if report.engine == 'z3' and self.preprocess:
+            report.resolved = self.resolvedCells
+        super()._finishReport(report)
+
+    def _extractSolution(self, m):
+        """Returns a 2D array of the values in the model"""
+        return [[self.encoding.Decode(m, g) for g in self.grid.Row(y)] for y in range(self.size)]
+
+    def ForcedCells(self, assignment=None):
+        """
+        Returns the cells forced by assignment (see GridPuzzle.ForcedCells).
+
+        While Solution() uses the native engine, the native search looks for
+        two solutions agreeing with assignment.  If there is only one, every
+        open cell is forced, which takes a few milliseconds on a 9x9.
+        Otherwise the cells are found on a Z3 copy of the puzzle under
+        ONEHOT_ENCODING, so that building a solver here does not switch later
+        solves to Z3.
+        """
+        if not self.__usesNativeEngine():
+            return super().ForcedCells(assignment)
+        assignment = dict(assignment or {})
+        last = self._lastForced
+        if last is not None and last[0] == assignment and last[1] == self._clueChanges:
+            return dict(last[2])
+        for ((x, y), val) in assignment.items():
+            if not _isSquare(self.size, x, y, val):
+                raise ValueError('Invalid assignment: {} = {}'.format((x, y), val))
+        given = self._givenCells()
+        clues = self.__clues + [(x, y, val) for ((x, y), val) in assignment.items()]
+        maxNodes = Sudoku.AUTO_NATIVE_NODE_LIMIT if self.engine == Sudoku.ENGINE_AUTO else None
+        solutions = SolveBitmask(self.dimension, clues, 2, maxNodes)
+        if solutions is not None and len(solutions) == 1:
+            flat = solutions[0]
+            forced = dict(((x, y), flat[y * self.size + x]) for y in range(self.size) for x in range(self.size)
+                          if (x, y) not in given and (x, y) not in assignment)
+        else:
+            from .portfolio import Rebuild
+            if self.__hintPuzzle is None or self.__hintPuzzle[0] != self._clueChanges:
+                configuration = {'engine': Sudoku.ENGINE_Z3, 'encoding': ONEHOT_ENCODING, 'logic': self._logic}
+                copy = Rebuild(type(self), dict(self._arguments, ctx=self.ctx), self._recipe, configuration)
+                self.__hintPuzzle = (self._clueChanges, copy)
+            forced = self.__hintPuzzle[1].ForcedCells(assignment)
+        self._lastForced = (assignment, self._clueChanges, forced)
+        return dict(forced)
+
+    def _cells(self):
+        return list(self.grid.values())
+
+    def _givenCells(self):
+        return set((x, y) for (x, y, val) in self.__clues)
+
+    def _canonicalForm(self):
+        """
+        Classic puzzles are cached under a canonical relabelling of the digits
+        and reordering of the bands, stacks, rows and columns, so that puzzles
+        that only differ by those symmetries share a cache entry
+        """
+        if self.__hasVariants:
+            return super()._canonicalForm()
+        (rows, columns, relabel) = _canonicalTransform(self.dimension, self.__clues)
+        clues = sorted((columns.index(x), rows.index(y), relabel[val]) for (x, y, val) in self.__clues)
+        definition = {'puzzle': 'Sudoku', 'dimension': self.dimension, 'clues': clues}
+        inverse = dict((label, val) for (val, label) in relabel.items())
+        def toCanonical(answer):
+            return [[relabel[answer[y][x]] for x in columns] for y in rows]
+        def fromCanonical(canonical):
+            answer = [[0] * self.size for i in range(self.size)]
+            for (r, y) in enumerate(rows):
+                for (c, x) in enumerate(columns):
+                    answer[y][x] = inverse[canonical[r][c]]
+            return answer
+        return (definition, toCanonical, fromCanonical)
+
+    @Recorded
     def AddSquare(self, x, y, val):
-        self.solver.add(self.grid[(x,y)] == val)
+        """Adds a clue that the cell at (x,y) contains val, raising ValueError unless both are on the grid"""
+        if not _isSquare(self.size, x, y, val):
+            raise ValueError('Invalid square: {} = {}'.format((x, y), val))
+        self.__clues.append((x, y, val))
+        if self.__solver is not None:
+            self.__clueLiterals.append(self._addClue(self.encoding.Equals(self.grid[(x,y)], val)))
 
+    @Recorded
     def AddThermometer(self, bulbToTip, thermoclines=-1, thermoclineDelta=3):
         """
         Adds an ascending thermometer constraint
@@ -50,17 +282,22 @@ class Sudoku:
         thermoclines: The number of thermoclines
         thermoclineDelta: the jump in value to be considered a thermocline
         """
+        self.__requireZ3()
+        constraints = []
         tcl = 0
         for n in range(1, len(bulbToTip)):
             second = self.__gridFromTuple(bulbToTip[n])
             first = self.__gridFromTuple(bulbToTip[n-1])
-            self.solver.add(second > first)
+            constraints.append(second > first)
             tcl = tcl + If((second - first) >= thermoclineDelta, 1, 0)
+        constraints += self.__thermometerDomains(bulbToTip)
 
         if thermoclines >= 0:
-            self.solver.add(tcl == thermoclines)
+            constraints.append(tcl == thermoclines)
+        self._addClue(constraints)
 
 
+    @Recorded
     def AddMultiThermometer(self, bulbsToTip, thermoclines=-1, thermoclineDelta=3):
         """
         Adds an ascending thermometer constraint
@@ -69,32 +306,125 @@ class Sudoku:
         thermoclines: The number of thermoclines
         thermoclineDelta: the jump in value to be considered a thermocline
         """
+        self.__requireZ3()
+        constraints = []
         tcl = 0
         for bulbToTip in bulbsToTip:
             for n in range(1, len(bulbToTip)):
                 second = self.__gridFromTuple(bulbToTip[n])
                 first = self.__gridFromTuple(bulbToTip[n-1])
                 tcl = tcl + If(second - first >= thermoclineDelta, 1, 0)
-                self.solver.add(second > first)
+                constraints.append(second > first)
+            constraints += self.__thermometerDomains(bulbToTip)
         if thermoclines >= 0:
-            self.solver.add(tcl == thermoclines)       
+            constraints.append(tcl == thermoclines)
+        self._addClue(constraints)
+
+    @Recorded
+    def AddCage(self, total, cells):
+        """
+        Adds a killer cage: the cells hold different values that add up to total
+
+        cells: a list of tuples [(x1,y1), (x2,y2)]
+        """
+        self.__requireZ3()
+        squares = [self.grid[(x, y)] for (x, y) in cells]
+        combinations = _cageCombinations(total, len(cells), self.size)
+        if not combinations:
+            self._addClue(BoolVal(False, self.ctx))
+            return
+        constraints = [self.encoding.AllDifferent(squares)]
+        constraints.append(Sum([self.encoding.Term(g, total) for g in squares]) == total)
+        # Each cell holds a digit of some combination, and a digit used by
+        # every combination has to appear somewhere in the cage
+        used = sorted(set().union(*combinations))
+        for g in squares:
+            constraints.append(self.encoding.DomainConstraint(g, used))
+        for val in sorted(set.intersection(*map(set, combinations))):
+            constraints.append(Or([self.encoding.Equals(g, val) for g in squares]))
+        self._addClue(constraints)
+
+    @Recorded
+    def AddArrow(self, circle, arrow):
+        """
+        Adds an arrow: the value in the circle is the sum of the values along the arrow
+
+        circle: (x,y) tuple of the circle
+        arrow: a list of tuples [(x1,y1), (x2,y2)] of the cells along the arrow
+        """
+        self.__requireZ3()
+        cells = [(x, y) for (x, y) in arrow]
+        # Cells that all share a row, column or subsquare hold different digits
+        distinct = all(self.__sharesUnit(a, b) for (i, a) in enumerate(cells) for b in cells[i + 1:])
+        table = _arrowTable(len(cells), self.size, distinct)
+        if not table:
+            self._addClue(BoolVal(False, self.ctx))
+            return
+        head = self.grid[(circle[0], circle[1])]
+        squares = [self.grid[c] for c in cells]
+        constraints = [self.encoding.DomainConstraint(head, sorted(table))]
+        # Each cell holds a digit of some combination, and of one adding up to
+        # the circle's value in particular
+        digits = dict((total, sorted(set().union(*combinations))) for (total, combinations) in table.items())
+        used = sorted(set().union(*digits.values()))
+        for g in squares:
+            constraints.append(self.encoding.DomainConstraint(g, used))
+        for (total, values) in digits.items():
+            if values != used:
+                constraints.append(Implies(self.encoding.Equals(head, total),
+                                           And([self.encoding.DomainConstraint(g, values) for g in squares])))
+        maxValue = self.size * max(len(arrow), 1)
+        constraints.append(Sum([self.encoding.Term(g, maxValue) for g in squares]) == self.encoding.Term(head, maxValue))
+        self._addClue(constraints)
+
+    def __sharesUnit(self, first, second):
+        """Returns True if two cells are in the same row, column or subsquare"""
+        d = self.dimension
+        return (first[0] == second[0] or first[1] == second[1] or
+                (first[0] // d, first[1] // d) == (second[0] // d, second[1] // d))
+
+    def __thermometerDomains(self, bulbToTip):
+        """Returns constraints restricting the k-th cell of a thermometer of length L to [k+1, size-L+k+1]"""
+        length = len(bulbToTip)
+        return [self.encoding.DomainConstraint(self.grid[(x, y)], range(k + 1, self.size - length + k + 2))
+                for (k, (x, y)) in enumerate(bulbToTip)]
+
+    def __usesNativeEngine(self):
+        """Returns True if Solution() should use the native bitmask engine"""
+        if self.engine == Sudoku.ENGINE_Z3:
+            return False
+        return not self.__hasVariants and self.__solver is None
+
+    def __solveNative(self, limit):
+        """
+        Returns up to limit solutions from the native engine, or None if the
+        puzzle should be solved with Z3 instead
+        """
+        if not self.__usesNativeEngine():
+            return None
+        maxNodes = Sudoku.AUTO_NATIVE_NODE_LIMIT if self.engine == Sudoku.ENGINE_AUTO else None
+        return SolveBitmask(self.dimension, self.__clues, limit, maxNodes)
+
+    def __requireZ3(self):
+        """Marks the puzzle as using constraints that only the Z3 engine supports"""
+        if self.engine == Sudoku.ENGINE_NATIVE:
+            raise ValueError('The native engine only supports AddSquare clues')
+        self.__hasVariants = True
 
     def __gridFromTuple(self, t):
-        return self.grid[(t[0], t[1])]
+        return self.encoding.Term(self.grid[(t[0], t[1])])
 
     def __addValueConstraints(self):
         """Adds constraints that each cell is between one and the size of the grid"""
-        for x in range(self.size):
-            for y in range(self.size):
-                g = self.grid[(x, y)]
-                self.solver.add(Or([g == i for i in range(1, self.size + 1)]))
+        for g in self.grid.values():
+            self.solver.add(self.encoding.DomainConstraint(g))
 
 
     def __addRowConstraints(self):
         """Adds constraints that the total number of plus and minus signs in each row is correct"""
         for y in range(self.size):
-            row = [self.grid[(x,y)] for x in range(self.size)]
-            self.solver.add(Distinct(row))
+            row = list(self.grid.Row(y))
+            self.solver.add(self.encoding.AllDifferent(row))
             rawRow = [(x,y) for x in range(self.size)]
             if self.debugPrint:
                 print("Row Constraint: ")
@@ -104,8 +434,8 @@ class Sudoku:
     def __addColumnConstraints(self):
         """Adds constraints that the total number of plus and minus signs in each column is correct"""
         for x in range(self.size):
-            col = [self.grid[(x,y)] for y in range(self.size)]
-            self.solver.add(Distinct(col))
+            col = list(self.grid.Column(x))
+            self.solver.add(self.encoding.AllDifferent(col))
             rawCol = [(x,y) for y in range(self.size)]
             if self.debugPrint:
                 print("Col Constraint: ")
@@ -116,11 +446,314 @@ class Sudoku:
             for ySquare in range(self.dimension):
                 left = xSquare * self.dimension
                 top = ySquare * self.dimension
-                subsquare = [self.grid[(left + x, top + y)] for x in range(self.dimension) for y in range(self.dimension)]
-                self.solver.add(Distinct(subsquare))
+                subsquare = list(self.grid.Box(left, top, self.dimension, self.dimension))
+                self.solver.add(self.encoding.AllDifferent(subsquare))
                 rawSubsquare = [(x,y) for x in range(self.dimension) for y in range(self.dimension)]
                 if self.debugPrint:
                     print("Subsquare constraint: ")
                     print(rawSubsquare)
 
-    
+
+@lru_cache(maxsize=None)
+def _cageCombinations(total, count, size):
+    """Returns every set of count different digits from 1 to size adding up to total, as sorted tuples"""
+    def extend(start, remaining, left):
+        if left == 0:
+            return [()] if remaining == 0 else []
+        found = []
+        for d in range(start, size + 1):
+            # The smallest digits still to come already overshoot the total
+            if d * left + left * (left - 1) // 2 > remaining:
+                break
+            found.extend((d,) + rest for rest in extend(d + 1, remaining - d, left - 1))
+        return found
+    return tuple(extend(1, total, count))
+
+
+def _digitMultisets(total, count, size):
+    """Returns every multiset of count digits from 1 to size adding up to total, as sorted tuples"""
+    def extend(start, remaining, left):
+        if left == 0:
+            return [()] if remaining == 0 else []
+        found = []
+        for d in range(start, size + 1):
+            # The rest of the digits are at least d, so they already overshoot
+            if d * left > remaining:
+                break
+            found.extend((d,) + rest for rest in extend(d, remaining - d, left - 1))
+        return found
+    return tuple(extend(1, total, count))
+
+
+@lru_cache(maxsize=None)
+def _arrowTable(length, size, distinct=False):
+    """
+    Returns a dict of each value the circle of an arrow of length cells can
+    take to the feasible digit combinations along the arrow, as sorted
+    tuples.  Digits may repeat unless distinct is set.
+    """
+    combinations = _cageCombinations if distinct else _digitMultisets
+    table = {}
+    for total in range(1, size + 1):
+        found = combinations(total, length, size)
+        if found:
+            table[total] = found
+    return table
+
+
+class SudokuSession:
+    """
+    Solves many classic sudokus of the same size against one Z3 solver.  The
+    value, row, column and subsquare constraints are built once, and each
+    puzzle's clues are passed as assumptions to check() so that everything Z3
+    learns about the shared constraints is kept between puzzles.
+    """
+
+    def __init__(self, dimension=3, encoding=None, ctx=None):
+        """
+        dimension: Size of each sub-square.  For a standard sudoku the dimension is 3
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding)
+        ctx: Z3 Context for the session (see Puzzle)
+        """
+        self.puzzle = Sudoku(dimension, Sudoku.ENGINE_Z3, encoding, ctx=ctx)
+        self.solver = self.puzzle.solver
+        # Assumption literal for each (x, y, value) clue used so far
+        self.__literals = {}
+
+    def Solve(self, clues):
+        """
+        Solves one puzzle and returns a 2D array of the values.
+
+        clues: A puzzle string (see Sudoku.FromString) or an iterable of (x, y, value) tuples
+        """
+        if isinstance(clues, str):
+            dimension, clues = _parsePuzzleString(clues)
+            if dimension != self.puzzle.dimension:
+                raise ValueError('Puzzle dimension does not match the session: ' + str(dimension))
+        clues = list(clues)
+        for (x, y, val) in clues:
+            if not _isSquare(self.puzzle.size, x, y, val):
+                raise ValueError('Invalid square: {} = {}'.format((x, y), val))
+        conflict = _conflictingSquares(self.puzzle.dimension, clues)
+        if conflict is not None:
+            raise NoSolutionError(clues=[_describeSquare(*clue) for clue in conflict])
+        assumptions = [self.Literal(x, y, val) for (x, y, val) in clues]
+        if self.puzzle._checkDecided(self.solver, assumptions) == unsat:
+            raise NoSolutionError(clues=self.__conflictingClues(clues, assumptions))
+        return self.puzzle._extractSolution(self.solver.model())
+
+    def __conflictingClues(self, clues, assumptions):
+        """
+        Returns the descriptions of a minimal set of conflicting clues once
+        check() has found the clues unsat.  Each clue of Z3's unsat core is
+        dropped in turn and left out if the others still conflict.
+        """
+        names = set(str(l) for l in self.solver.unsat_core())
+        core = [(clue, l) for (clue, l) in zip(clues, assumptions) if str(l) in names]
+        i = 0
+        while i < len(core):
+            rest = core[:i] + core[i + 1:]
+            if self.puzzle._checkDecided(self.solver, [l for (clue, l) in rest]) == unsat:
+                names = set(str(l) for l in self.solver.unsat_core())
+                core = [(clue, l) for (clue, l) in rest if str(l) in names]
+            else:
+                i += 1
+        return [_describeSquare(*clue) for (clue, l) in core]
+
+    def Literal(self, x, y, val):
+        """Returns a Bool that forces the cell at (x,y) to val when assumed"""
+        key = (x, y, val)
+        if key not in self.__literals:
+            if not (0 <= x < self.puzzle.size and 0 <= y < self.puzzle.size):
+                raise ValueError('Invalid cell: ' + str((x, y)))
+            condition = self.puzzle.encoding.Equals(self.puzzle.grid[(x,y)], val)
+            if is_const(condition):
+                self.__literals[key] = condition
+            else:
+                literal = Bool('sudoku-clue-{}-{}-{}'.format(x, y, val), self.puzzle.ctx)
+                self.solver.add(Implies(literal, condition))
+                self.__literals[key] = literal
+        return self.__literals[key]
+
+
+def _conflictingSquares(dimension, clues):
+    """
+    Returns the (x, y, value) clues that rule each other out by filling a cell
+    twice or repeating a value in a row, column or subsquare.  Returns None if
+    there are no such clues.
+    """
+    seen = {}
+    for clue in clues:
+        (x, y, val) = clue
+        for key in ((x, y), ('row', y, val), ('column', x, val), ('box', x // dimension, y // dimension, val)):
+            other = seen.setdefault(key, clue)
+            if other != clue:
+                return (other, clue)
+    return None
+
+def _isSquare(size, x, y, val):
+    """Returns True if (x, y) is a cell of a size x size grid and val a digit it can hold"""
+    return 0 <= x < size and 0 <= y < size and 1 <= val <= size
+
+def _describeSquare(x, y, val):
+    """Describes an (x, y, value) clue as the AddSquare call that adds it"""
+    return 'AddSquare({}, {}, {})'.format(x, y, val)
+
+
+def _canonicalTransform(dimension, clues, rounds=3):
+    """
+    Returns (rows, columns, relabel) putting a classic sudoku into a canonical
+    form: canonical row r is row rows[r], canonical column c is column
+    columns[c] and digit v becomes relabel[v].
+
+    Bands and stacks, and the rows and columns inside them, are sorted first
+    by invariants of their clues (how many clues share each clue's column or
+    row, box and digit), then by the pattern of clue positions, alternating
+    between rows and columns for a few rounds.  Digits are then numbered in
+    order of first appearance.  The form is exact for any transform, but
+    puzzles whose lines tie on every key may not all reach the same form.
+    """
+    size = dimension * dimension
+    values = dict(((x, y), val) for (x, y, val) in clues)
+    filled = set(values.keys())
+    rows = list(range(size))
+    columns = list(range(size))
+    rowCounts = [0] * size
+    columnCounts = [0] * size
+    boxCounts = [0] * size
+    digitCounts = {}
+    for (x, y) in filled:
+        rowCounts[y] += 1
+        columnCounts[x] += 1
+        boxCounts[(y // dimension) * dimension + x // dimension] += 1
+        digitCounts[values[(x, y)]] = digitCounts.get(values[(x, y)], 0) + 1
+    cellKey = lambda x, y, crossCount: (crossCount, boxCounts[(y // dimension) * dimension + x // dimension],
+                                        digitCounts[values[(x, y)]])
+    rowKeys = [tuple(sorted(cellKey(x, y, columnCounts[x]) for x in range(size) if (x, y) in filled)) for y in range(size)]
+    columnKeys = [tuple(sorted(cellKey(x, y, rowCounts[y]) for y in range(size) if (x, y) in filled)) for x in range(size)]
+
+    # Clue positions by row and by column
+    rowFilled = [[(x, y) in filled for x in range(size)] for y in range(size)]
+    columnFilled = [[(x, y) in filled for y in range(size)] for x in range(size)]
+
+    def arrange(invariants, cross, lineFilled):
+        """Orders the lines by their invariants and clue pattern along the cross lines, keeping lines within their band"""
+        keys = [(invariants[line], [lineFilled[line][other] for other in cross]) for line in range(size)]
+        bands = []
+        for band in range(dimension):
+            lines = sorted(range(band * dimension, (band + 1) * dimension), key=keys.__getitem__, reverse=True)
+            bands.append(([keys[line] for line in lines], lines))
+        bands.sort(reverse=True)
+        return [line for (bandKeys, lines) in bands for line in lines]
+
+    for i in range(rounds):
+        previous = (rows, columns)
+        rows = arrange(rowKeys, columns, rowFilled)
+        columns = arrange(columnKeys, rows, columnFilled)
+        if (rows, columns) == previous:
+            break
+
+    relabel = {}
+    for y in rows:
+        for x in columns:
+            val = values.get((x, y))
+            if val is not None and val not in relabel:
+                relabel[val] = len(relabel) + 1
+    for val in range(1, size + 1):
+        if val not in relabel:
+            relabel[val] = len(relabel) + 1
+    return (rows, columns, relabel)
+
+def _parsePuzzleString(puzzle):
+    """
+    Parses a puzzle string (see Sudoku.FromString) and returns its dimension
+    and a list of (x, y, value) clues
+    """
+    cells = ''.join(puzzle.split()).upper()
+    dimension = int(round(len(cells) ** 0.25))
+    if dimension < 1 or dimension ** 4 != len(cells) or dimension * dimension > len(SYMBOLS):
+        raise ValueError('Invalid puzzle length: ' + str(len(cells)))
+    size = dimension * dimension
+    clues = []
+    for i, c in enumerate(cells):
+        if c == '.' or c == '0':
+            continue
+        val = SYMBOLS.find(c) + 1
+        if val < 1 or val > size:
+            raise ValueError('Invalid cell value: ' + c)
+        y, x = divmod(i, size)
+        clues.append((x, y, val))
+    return dimension, clues
+
+
+def _solveChunk(chunk):
+    """Solves a list of (index, puzzle string) pairs in a worker process"""
+    results = []
+    for (index, puzzle) in chunk:
+        try:
+            solution = Sudoku.FromString(puzzle).SolutionString()
+        except ValueError:
+            solution = None
+        results.append((index, solution))
+    return results
+
+
+def SolveMany(puzzles, workers=None, ordered=True, chunksize=64):
+    """
+    Solves a stream of puzzle strings (see Sudoku.FromString) across a process
+    pool, yielding (index, solution string) pairs.  Blank lines are skipped and
+    do not count towards the index.  The solution is None if the puzzle is
+    malformed or has no solution.
+
+    The input is consumed lazily and at most a couple of chunks per worker are
+    in flight at once, so memory stays bounded however long the stream is.
+
+    puzzles: Iterable of puzzle strings, such as a generator or an open file
+    workers: Number of worker processes.  Defaults to the CPU count.  With 0 or
+        1 the puzzles are solved in the calling process.
+    ordered: If True, results are yielded in input order, otherwise in
+        completion order
+    chunksize: Number of puzzles sent to a worker at a time
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize < 1:
+        raise ValueError('Invalid chunksize: ' + str(chunksize))
+    chunks = _chunked(puzzles, chunksize)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _solveChunk(chunk)
+        return
+
+    # Loading the process pool machinery is a noticeable share of start-up time
+    from concurrent.futures import ProcessPoolExecutor
+    maxPending = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_solveChunk, chunk))
+                if len(pending) >= maxPending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(_solveChunk, chunk))
+                if len(pending) >= maxPending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in as_completed(pending):
+                yield from future.result()
+
+
+def _chunked(puzzles, chunksize):
+    """Lazily groups non-blank puzzle strings into lists of (index, puzzle) pairs"""
+    numbered = enumerate(p for p in map(str.strip, puzzles) if p)
+    while True:
+        chunk = list(islice(numbered, chunksize))
+        if not chunk:
+            return
+        yield chunk
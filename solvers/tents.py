@@ -1,46 +1,64 @@
 from z3 import *
 from .z3util import *
-from enum import Enum
+from .gameid import ParseTents
+from .puzzle import GridPuzzle
 
-class Tents:
+class Tents(GridPuzzle):
     EMPTY = 0
     TENT = 1
     TREE = 2
 
-    __NO_NEIGHBOR = 0
-    __MAX_TREES = 50 # If you increase this, you have to add more lines to __addTreeNeighborConstraint
+    DEFAULT_ENCODING = INT_ENCODING # Used when no encoding is passed to the constructor
 
-    """Solver for the Keen logic puzzle: https://www.chiark.greenend.org.uk/~sgtatham/puzzles/js/keen.html"""
-    def __init__(self, treeGrid, columnCounts, rowCounts):
+    """Solver for the Tents logic puzzle: https://www.chiark.greenend.org.uk/~sgtatham/puzzles/js/tents.html"""
+    def __init__(self, treeGrid, columnCounts, rowCounts, encoding=None, ctx=None):
         """
         Creates empty rectangular tree puzzle.
 
         treeGrid: A 2D list of boolean.  True indicates a tree.  Must be of
             dimensions len(columnCounts) x len(rowCounts)
-        columnCounts: List of count of how many tents are in each puzzle
-        rowCounts: List of count of how many tents are in each row.
+        columnCounts: List of count of how many tents are in each column (None if unknown)
+        rowCounts: List of count of how many tents are in each row (None if unknown)
+        encoding: Z3 variable encoding for the cells (see z3util.MakeEncoding).  Defaults to DEFAULT_ENCODING
+        ctx: Z3 Context for the puzzle (see Puzzle).  None uses Z3's global context
         """
         self.__prefix = 'tents'
         self.width = len(columnCounts)
         self.height = len(rowCounts)
         self.columnCounts = columnCounts.copy()
         self.rowCounts = rowCounts.copy()
-        self.grid = Z3IntDict2D(self.width, self.height, self.__prefix)
-        self.neighbor = Z3IntDict2D(self.width, self.height, self.__prefix)
-        self.solver = Solver()
+        if len(treeGrid) != self.height or any(len(row) != self.width for row in treeGrid):
+            raise ValueError('Inconsistent dimensions')
+        self.trees = set((x, y) for y in range(self.height) for x in range(self.width) if treeGrid[y][x])
+        self.treeCount = len(self.trees)
+        self.__checkCounts()
+        self.encoding = MakeEncoding(encoding or Tents.DEFAULT_ENCODING, Tents.EMPTY, Tents.TREE, ctx)
+        self.grid = Z3EncodedDict2D(self.width, self.height, self.__prefix, self.encoding)
+        # A Bool for each (tree, tent) pair of orthogonally adjacent cells that is
+        # true when that tent belongs to that tree
+        self.edges = {}
+        self.solver = self._newSolver()
         self.__addValueConstraints()
-        self.__addTreeConstraints(treeGrid)
-        #self.__addNeighborConstraints()
-
-    def Solution(self):
-        """Solves the grid and returns a 2D array of the values"""
-        self.solver.check()
-        m = self.solver.model()
-        answer = [[0] * self.width for i in range(self.height)]
-        for y in range(self.height):
-            for x in range(self.width):
-                answer[y][x] = int(str(m[self.grid[(x,y)]]))
-        return answer
+        self.__addTreeConstraints()
+        self.__addMatchingConstraints()
+        self.__addAdjacencyConstraints()
+        self.__addCountConstraints()
+
+    @classmethod
+    def FromGameId(cls, gameId, encoding=None, ctx=None):
+        """Creates a puzzle from a Tents game ID (see gameid.ParseTents)"""
+        (treeGrid, columnCounts, rowCounts) = ParseTents(gameId)
+        return cls(treeGrid, columnCounts, rowCounts, encoding, ctx)
+
+    def _extractSolution(self, m):
+        """Returns a 2D array of the values in the model"""
+        return [[self.encoding.Decode(m, g) for g in self.grid.Row(y)] for y in range(self.height)]
+
+    def _cells(self):
+        return list(self.grid.values())
+
+    def _givenCells(self):
+        return set(self.trees)
 
     def PrintSolution(self):
         """Returns a printable version of the solution."""
@@ -58,54 +76,75 @@ class Tents:
             sol = sol + '\n'
         return sol
 
+    def __isTent(self, cell):
+        """Returns a condition for the cell holding a tent"""
+        return self.encoding.Equals(self.grid[cell], Tents.TENT)
+
+    def __checkCounts(self):
+        """
+        Raises ValueError for counts that no grid can meet.  Tents never touch,
+        so a line of n cells holds at most (n+1)//2 of them, and there is one
+        tent per tree, so fully counted rows or columns must add up to the
+        number of trees.
+        """
+        for (name, counts, length) in [('row', self.rowCounts, self.width), ('column', self.columnCounts, self.height)]:
+            for (i, n) in enumerate(counts):
+                if n is not None and not 0 <= n <= (length + 1) // 2:
+                    raise ValueError('Invalid count for {} {}: {}'.format(name, i, n))
+            if None not in counts and sum(counts) != self.treeCount:
+                raise ValueError('The {} counts add up to {} tents but there are {} trees'.format(
+                    name, sum(counts), self.treeCount))
+
     def __addValueConstraints(self):
-        """Adds constraints that the number of tents in each row and column match the expected total"""
-        for x in range(self.width):
-            for y in range(self.height):
-                g = self.grid[(x,y)]
-                n = self.neighbor[(x,y)]
-                self.solver.add(Or([g == 0, g == 1, g == 2]))
-                self.solver.add(Or([
-                    And([g == 0, n == 0]),
-                    And([g != 0, n != 0])]))
-
-    def __addTreeConstraints(self, treeGrid):
+        """Adds constraints that each cell is empty, a tent or a tree"""
+        for g in self.grid.values():
+            self.solver.add(self.encoding.DomainConstraint(g))
+
+    def __addTreeConstraints(self):
         """Adds constraints that trees are located where the grid specifics (and only there)"""
-        nextNeighbor = 1
-        for x in range(self.width):
-            for y in range(self.height):
-                g = self.grid[(x,y)]
-                n = self.neighbor[(x,y)]   
-                if treeGrid[y][x]:
-                    # This space is a tree
-                    self.solver.add(g == 2)
-                    # TODO: The next two lines, if either is uncommented, cause UnSAT and I cannot understand why
-                    #AddIntEqualComparisonConstraint(self.solver, n, nextNeighbor)
-                    #self.solver.add(n == 1)
-                    nextNeighbor = nextNeighbor + 1
-                else:
-                    # This space is not a tree
-                    self.solver.add(g != 2)
-
-        self.treeCount = nextNeighbor - 1
-
-    def __addNeighborConstraints(self):
-        """Adds constraints that there is a 1:1 neighbor relationship between trees/tents"""
-        for x in range(self.width):
-            for y in range(self.height):
-                g = self.grid[(x,y)]
-                gLeft = self.grid[(x-1, y)]
-                gRight = self.grid[(x+1, y)]
-                gUp = self.grid[(x, y-1)]
-                gDown = self.grid[(x, y+1)]
-                n = self.neighbor[(x,y)]
-                nLeft = self.neighbor[(x-1, y)]
-                nRight = self.neighbor[(x+1, y)]
-                nUp = self.neighbor[(x, y-1)]
-                nDown = self.neighbor[(x, y+1)]
-                isEmpty = (g == 0)
-                adjacentCount = If(And([n == nLeft, g != gLeft]), 1, 0) \
-                    + If(And([n == nRight, g != gRight]), 1, 0) \
-                    + If(And([n == nUp, g != gUp]), 1, 0) \
-                    + If(And([n == nDown, g != gDown]), 1, 0)
-                self.solver.add(Or([isEmpty, adjacentCount == 1]))
+        for (cell, g) in self.grid.items():
+            isTree = self.encoding.Equals(g, Tents.TREE)
+            self.solver.add(isTree if cell in self.trees else Not(isTree))
+
+    def __addMatchingConstraints(self):
+        """
+        Adds constraints that trees and tents are matched one to one: every tree
+        owns exactly one adjacent tent and every tent belongs to exactly one
+        adjacent tree
+        """
+        incoming = dict((cell, []) for cell in self.grid.keys() if cell not in self.trees)
+        for tree in sorted(self.trees):
+            owned = []
+            for cell in self.grid.Neighbors(tree):
+                if cell not in self.trees:
+                    e = Bool('{}-edge-{}-{}-{}-{}'.format(self.__prefix, *(tree + cell)), self.ctx)
+                    self.edges[(tree, cell)] = e
+                    owned.append(e)
+                    incoming[cell].append(e)
+            self._addClue(ExactlyCount(owned, 1, self.ctx), 'treeGrid[{}][{}]'.format(tree[1], tree[0]))
+        for (cell, edges) in incoming.items():
+            isTent = self.__isTent(cell)
+            if edges:
+                self.solver.add(Implies(isTent, ExactlyCount(edges, 1, self.ctx)))
+                self.solver.add(Implies(Not(isTent), Not(Or(edges))))
+            else:
+                self.solver.add(Not(isTent))
+
+    def __addAdjacencyConstraints(self):
+        """Adds constraints that no two tents touch, even diagonally"""
+        for cell in self.grid.keys():
+            if cell in self.trees:
+                continue
+            for other in self.grid.Neighbors(cell, diagonal=True):
+                if other > cell and other not in self.trees:
+                    self.solver.add(Not(And(self.__isTent(cell), self.__isTent(other))))
+
+    def __addCountConstraints(self):
+        """Adds constraints that the number of tents in each row and column match the expected total"""
+        lines = [('rowCounts', y, self.rowCounts[y], [(x, y) for x in range(self.width)]) for y in range(self.height)]
+        lines += [('columnCounts', x, self.columnCounts[x], [(x, y) for y in range(self.height)]) for x in range(self.width)]
+        for (name, index, target, cells) in lines:
+            if target is None:
+                continue
+            tents = [self.__isTent(c) for c in cells if c not in self.trees]
+            self._addClue(ExactlyCount(tents, target, self.ctx), '{}[{}] = {}'.format(name, index, target))
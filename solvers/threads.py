@@ -0,0 +1,72 @@
+"""
+Solves batches of puzzles on a thread pool.  Each worker thread builds its
+puzzles in its own Z3 Context (see Puzzle), and Z3 releases the GIL while it
+searches, so the threads run on separate cores without the pickling and
+start-up costs of a process pool.
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+import os
+import threading
+
+from z3 import Context
+
+from .sudoku import Sudoku
+
+
+def SolveThreaded(items, build=None, workers=None, ordered=True):
+    """
+    Solves a stream of puzzles across a thread pool, yielding (index,
+    solution) pairs.  The solution is None if the puzzle is malformed or has
+    no solution; any other exception is raised to the caller.
+
+    The input is consumed lazily and at most a couple of puzzles per worker
+    are in flight at once, so memory stays bounded however long the stream is.
+
+    items: Iterable of puzzle descriptions, such as puzzle strings
+    build: Callable taking (item, ctx) and returning a puzzle created in the
+        Z3 Context ctx, for example
+        lambda gameId, ctx: KenKen.FromGameId(gameId, ctx=ctx).  Defaults to
+        building a Sudoku from a puzzle string (see Sudoku.FromString)
+    workers: Number of worker threads.  Defaults to the CPU count
+    ordered: If True, results are yielded in input order, otherwise in
+        completion order
+    """
+    if build is None:
+        build = lambda puzzle, ctx: Sudoku.FromString(puzzle, ctx=ctx)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError('Invalid workers: ' + str(workers))
+    # A Context must only be used by one thread at a time, so each worker
+    # thread keeps its own for all of the puzzles it solves
+    local = threading.local()
+
+    def solve(index, item):
+        if not hasattr(local, 'ctx'):
+            local.ctx = Context()
+        try:
+            return (index, build(item, local.ctx).Solution())
+        except ValueError:
+            return (index, None)
+
+    maxPending = 2 * workers
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if ordered:
+            pending = deque()
+            for (index, item) in enumerate(items):
+                pending.append(pool.submit(solve, index, item))
+                if len(pending) >= maxPending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        else:
+            pending = set()
+            for (index, item) in enumerate(items):
+                pending.add(pool.submit(solve, index, item))
+                if len(pending) >= maxPending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
@@ -1,5 +1,5 @@
 """Reusable helper functions for Z3 python wrappers"""
-from collections import defaultdict
+from functools import lru_cache
 from z3 import *
 
 def IsOdd(i):
@@ -17,35 +17,329 @@ def NumberFromDigits(*args):
         num = (10 * num) + arg
     return num
 
-def Z3IntArray(size, prefix):
-    """Creates an array of new Z3 Int objects.  They will be named prefix0-prefix[size-1]"""
+def Z3IntArray(size, prefix, ctx=None):
+    """
+    Creates an array of new Z3 Int objects.  They will be named prefix0-prefix[size-1]
+
+    ctx: Z3 Context to create the Ints in.  None uses Z3's global context
+    """
     arr = []
     fmt = prefix + '{num:02d}'
     for i in range(size):
-        arr.append(Int(fmt.format(num=i)))
+        arr.append(Int(fmt.format(num=i), ctx))
     return arr
 
-def Z3IntDict2D(width, height, prefix):
+class Grid2D:
+    """
+    A width x height grid of values stored in a flat list in reading order, so
+    that (x,y) is at index y*width+x.  The upper-left corner is (0,0) and the
+    grid proceeds down and right from there.
+
+    Cells are read with grid[(x,y)] as from a dict, and keys(), values() and
+    items() run in reading order.  Coordinates outside the grid raise
+    IndexError.  Row(), Column() and Box() return GridViews onto the grid
+    rather than copies.
+    """
+    __slots__ = ('width', 'height', 'cells')
+
+    def __init__(self, width, height, cells):
+        """
+        width: Width of the grid (int)
+        height: Height of the grid (int)
+        cells: List of the width*height values in reading order
+        """
+        if len(cells) != width * height:
+            raise ValueError('Expected {} cells, got {}'.format(width * height, len(cells)))
+        self.width = width
+        self.height = height
+        self.cells = cells
+
+    def Index(self, cell):
+        """Returns the position of the (x,y) cell in cells"""
+        (x, y) = cell
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError('Cell outside the grid: ' + str(cell))
+        return y * self.width + x
+
+    def __getitem__(self, cell):
+        return self.cells[self.Index(cell)]
+
+    def __setitem__(self, cell, value):
+        self.cells[self.Index(cell)] = value
+
+    def __contains__(self, cell):
+        (x, y) = cell
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return self.keys()
+
+    def keys(self):
+        """Iterates over the (x,y) coordinates in reading order"""
+        return ((x, y) for y in range(self.height) for x in range(self.width))
+
+    def values(self):
+        """Returns the values in reading order"""
+        return self.cells
+
+    def items(self):
+        """Iterates over ((x,y), value) pairs in reading order"""
+        return zip(self.keys(), self.cells)
+
+    def Row(self, y):
+        """Returns a view of row y, left to right"""
+        start = self.Index((0, y))
+        return GridView(self.cells, range(start, start + self.width))
+
+    def Column(self, x):
+        """Returns a view of column x, top to bottom"""
+        return GridView(self.cells, range(self.Index((x, 0)), len(self.cells), self.width))
+
+    def Box(self, left, top, width, height):
+        """Returns a view of the width x height box whose upper-left cell is (left, top), in reading order"""
+        if not (0 <= left and 0 <= top and 0 < width <= self.width - left and 0 < height <= self.height - top):
+            raise IndexError('Box outside the grid: ' + str((left, top, width, height)))
+        return GridView(self.cells, _boxIndices(self.width, left, top, width, height))
+
+    def Neighbors(self, cell, diagonal=False):
+        """Returns the in-bounds (x,y) cells orthogonally (and optionally diagonally) adjacent to cell"""
+        (x, y) = cell
+        offsets = _DIAGONAL_OFFSETS if diagonal else _ORTHOGONAL_OFFSETS
+        return [(x + dx, y + dy) for (dx, dy) in offsets
+                if 0 <= x + dx < self.width and 0 <= y + dy < self.height]
+
+    def __repr__(self):
+        return 'Grid2D({}, {}, {!r})'.format(self.width, self.height, self.cells)
+
+class GridView:
+    """A read-only sequence of some of the cells of a Grid2D, such as a row"""
+    __slots__ = ('cells', 'indices')
+
+    def __init__(self, cells, indices):
+        self.cells = cells
+        self.indices = indices
+
+    def __getitem__(self, i):
+        return self.cells[self.indices[i]]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        return map(self.cells.__getitem__, self.indices)
+
+_ORTHOGONAL_OFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+_DIAGONAL_OFFSETS = _ORTHOGONAL_OFFSETS + ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+@lru_cache(maxsize=None)
+def _boxIndices(gridWidth, left, top, width, height):
+    """Returns the flat indices of a box, shared by every grid of the same width"""
+    return tuple((top + y) * gridWidth + left + x for y in range(height) for x in range(width))
+
+def Z3IntDict2D(width, height, prefix, ctx=None):
     """
-    Returns a dict keyed on (X,Y) tuples of new Z3 Int objects.  They will be named
-    prefix-X-Y.  The upper-left corner is (0,0) and the grid proceeds down and right
-    from there.
+    Returns a Grid2D of new Z3 Int objects, read with grid[(X,Y)].  They will be
+    named prefix-X-Y.  The upper-left corner is (0,0) and the grid proceeds down
+    and right from there.
 
     width: Width of the grid (int)
     height: Height of the grid (int)
     prefix: Unique string prefix to identify the Z3 variables
+    ctx: Z3 Context to create the Ints in.  None uses Z3's global context
     """
-    d = defaultdict(lambda: None)
-    for x in range(width):
-        for y in range(height):
-            d[(x,y)] = Int(Z3IntDictKey(x,y,prefix))
-    return d
+    return Grid2D(width, height, [Int(Z3IntDictKey(x,y,prefix), ctx) for y in range(height) for x in range(width)])
 
 def Z3IntDictKey(x, y, prefix):
     """Returns the Z3 variable name for a grid space created by Z3IntDict2D"""
     fmt = prefix + '-{}-{}'
     return fmt.format(x,y)
 
+"""
+Names of the variable encodings accepted by MakeEncoding and the puzzle classes.
+The bitvec and onehot encodings keep small finite domains out of Z3's
+arithmetic theory and are typically several times faster on larger grids, but
+cells are then BitVecs or tuples of Bools rather than Ints.
+"""
+INT_ENCODING = 'int'
+BITVEC_ENCODING = 'bitvec'
+ONEHOT_ENCODING = 'onehot'
+
+class IntEncoding:
+    """Backs each cell with an unbounded Z3 Int restricted to the range [low, high]"""
+    name = INT_ENCODING
+
+    def __init__(self, low, high, ctx=None):
+        self.low = low
+        self.high = high
+        # Z3 Context the cells are created in
+        self.ctx = ctx if ctx is not None else main_ctx()
+
+    def NewCell(self, name):
+        """Creates the Z3 variable(s) for a single cell"""
+        return Int(name, self.ctx)
+
+    def DomainConstraint(self, cell, values=None):
+        """Returns a constraint that the cell takes one of values (default: the whole range)"""
+        if values is None:
+            values = range(self.low, self.high + 1)
+        return Or([cell == v for v in values], self.ctx)
+
+    def Equals(self, cell, value):
+        """Returns a condition for the cell holding a constant value"""
+        return cell == value
+
+    def SameValue(self, first, second):
+        """Returns a condition for two cells holding the same value"""
+        return first == second
+
+    def AllDifferent(self, cells):
+        """Returns a constraint that all of the cells hold different values"""
+        return Distinct(cells)
+
+    def Term(self, cell, maxValue=None):
+        """
+        Returns an arithmetic term for the cell's value.  maxValue is the largest
+        intermediate value the caller will compute with the term, so that
+        fixed-width encodings can be widened to avoid overflow.
+        """
+        return cell
+
+    def Decode(self, model, cell):
+        """Returns the value of a cell in a model as a Python int"""
+        return model.eval(cell, model_completion=True).as_long()
+
+class BitVecEncoding(IntEncoding):
+    """
+    Backs each cell with the smallest BitVec that holds the range plus a sign
+    bit, so that Z3 bit-blasts the domain instead of using arithmetic.
+    """
+    name = BITVEC_ENCODING
+
+    def __init__(self, low, high, ctx=None):
+        if low < 0:
+            raise ValueError('BitVec encoding requires a non-negative range')
+        super().__init__(low, high, ctx)
+        self.bits = high.bit_length() + 1
+
+    def NewCell(self, name):
+        return BitVec(name, self.bits, self.ctx)
+
+    def DomainConstraint(self, cell, values=None):
+        if values is None:
+            return And(UGE(cell, self.low), ULE(cell, self.high))
+        return Or([cell == v for v in values], self.ctx)
+
+    def Term(self, cell, maxValue=None):
+        if maxValue is None:
+            return cell
+        bits = maxValue.bit_length() + 1
+        if bits <= self.bits:
+            return cell
+        return ZeroExt(bits - self.bits, cell)
+
+class OneHotEncoding(IntEncoding):
+    """
+    Backs each cell with one Bool per value in the range and an exactly-one
+    constraint, which keeps domain, equality and distinctness reasoning in
+    Z3's SAT core.
+    """
+    name = ONEHOT_ENCODING
+
+    def NewCell(self, name):
+        return tuple(Bool('{}={}'.format(name, v), self.ctx) for v in range(self.low, self.high + 1))
+
+    def DomainConstraint(self, cell, values=None):
+        if values is None:
+            return ExactlyCount(cell, 1)
+        allowed = set(values)
+        excluded = [Not(self.Equals(cell, v)) for v in range(self.low, self.high + 1) if v not in allowed]
+        return And([ExactlyCount(cell, 1)] + excluded)
+
+    def Equals(self, cell, value):
+        if value < self.low or value > self.high:
+            return BoolVal(False, self.ctx)
+        return cell[value - self.low]
+
+    def SameValue(self, first, second):
+        return Or([And(a, b) for (a, b) in zip(first, second)])
+
+    def AllDifferent(self, cells):
+        values = range(len(cells[0])) if cells else []
+        if len(cells) == len(values):
+            # A full permutation: every value is used exactly once
+            return And([ExactlyCount([c[i] for c in cells], 1) for i in values])
+        return And([AtMostCount([c[i] for c in cells], 1) for i in values])
+
+    def Term(self, cell, maxValue=None):
+        return Sum([If(b, v, 0) for (b, v) in zip(cell, range(self.low, self.high + 1))])
+
+    def Decode(self, model, cell):
+        for (b, v) in zip(cell, range(self.low, self.high + 1)):
+            if is_true(model.eval(b, model_completion=True)):
+                return v
+        raise ValueError('No value assigned to one-hot cell')
+
+_ENCODINGS = {
+    INT_ENCODING: IntEncoding,
+    BITVEC_ENCODING: BitVecEncoding,
+    ONEHOT_ENCODING: OneHotEncoding,
+}
+
+def MakeEncoding(encoding, low, high, ctx=None):
+    """
+    Returns an encoding object for cells holding values in [low, high].
+
+    encoding: One of INT_ENCODING, BITVEC_ENCODING or ONEHOT_ENCODING
+    ctx: Z3 Context to create the cells in.  None uses Z3's global context
+    """
+    if encoding not in _ENCODINGS:
+        raise ValueError('Invalid encoding: ' + str(encoding))
+    return _ENCODINGS[encoding](low, high, ctx)
+
+def Z3EncodedDict2D(width, height, prefix, encoding):
+    """
+    Like Z3IntDict2D, but each cell is created by an encoding object from
+    MakeEncoding.  For INT_ENCODING the result matches Z3IntDict2D.
+    """
+    return Grid2D(width, height, [encoding.NewCell(Z3IntDictKey(x,y,prefix)) for y in range(height) for x in range(width)])
+
+def ExactlyCount(conditions, target, ctx=None):
+    """
+    Returns a pseudo-boolean constraint that exactly target of the Bool
+    conditions hold.  Unlike a sum of If terms this stays in Z3's SAT core.
+
+    ctx: Z3 Context of the result when there are no conditions to take it from
+    """
+    conditions = list(conditions)
+    if not conditions or target < 0 or target > len(conditions):
+        return BoolVal(target == 0 and not conditions, _contextOf(conditions, ctx))
+    return PbEq([(c, 1) for c in conditions], target)
+
+def AtMostCount(conditions, target, ctx=None):
+    """Returns a pseudo-boolean constraint that at most target of the Bool conditions hold"""
+    conditions = list(conditions)
+    if target >= len(conditions):
+        return BoolVal(True, _contextOf(conditions, ctx))
+    if target < 0:
+        return BoolVal(False, _contextOf(conditions, ctx))
+    return AtMost(*(conditions + [target]))
+
+def AtLeastCount(conditions, target, ctx=None):
+    """Returns a pseudo-boolean constraint that at least target of the Bool conditions hold"""
+    conditions = list(conditions)
+    if target <= 0:
+        return BoolVal(True, _contextOf(conditions, ctx))
+    if target > len(conditions):
+        return BoolVal(False, _contextOf(conditions, ctx))
+    return AtLeast(*(conditions + [target]))
+
+def _contextOf(conditions, ctx):
+    """Returns the Context of the first condition, or ctx if there are none"""
+    return conditions[0].ctx if conditions else ctx
+
 """If you have to increase this number, you must add more entries to AddIntEqualComparisonConstraint"""
 MAX_INT_CONSTRAINT = 50
 
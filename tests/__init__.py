@@ -1,4 +1,13 @@
 from .test_alphametic import AlphameticTest
+from .test_bench import BenchTest
+from .test_cache import CacheTest
+from .test_cli import CliTest
+from .test_gameid import GameIdTest
+from .test_generator import GeneratorTest
 from .test_kenken import KenKenTest
 from .test_magnets import MagnetsTest
+from .test_server import ServerTest
+from .test_sudoku import SudokuTest
 from .test_tents import TentsTest
+from .test_threads import ThreadsTest
+from .test_z3util import Z3UtilTest
@@ -1,5 +1,7 @@
 from .context import solvers
-from solvers import Alphametic
+from solvers import Alphametic, NoSolutionError, SolveTimeoutError
+import asyncio
+import time
 import unittest
 
 class AlphameticTest(unittest.TestCase):
@@ -27,3 +29,124 @@ class AlphameticTest(unittest.TestCase):
         a.AddKnownLetter("Y", 2)
         expectedSolution = {"A":3, "O":1, "B":9, "T":0, "L":7, "K":6, "E":4, "C":5, "Y":2, "N":8}
         self.assertEqual(a.Solution(), expectedSolution)
+        self.assertTrue(a.IsUnique())
+
+    def testCountSolutions(self):
+        a = Alphametic()
+        a.AddSum(initial_value="A", addition="B", result="C")
+        a.AddKnownLetter("C", 3)
+        # 0+3, 3+0, 1+2 and 2+1, but A and B must differ from C
+        self.assertEqual(a.CountSolutions(), 2)
+        self.assertEqual(a.CountSolutions(limit=1), 1)
+        self.assertFalse(a.IsUnique())
+
+    def testEquation(self):
+        a = Alphametic()
+        a.AddEquation(["SEND", "MORE"], "MONEY")
+        expectedSolution = {"S":9, "E":5, "N":6, "D":7, "M":1, "O":0, "R":8, "Y":2}
+        self.assertEqual(a.Solution(), expectedSolution)
+        self.assertTrue(a.IsUnique())
+
+    def testEquationConstants(self):
+        a = Alphametic()
+        a.AddEquation(["AB", 7], 42)
+        self.assertEqual(a.Solution(), {"A":3, "B":5})
+
+    def testManyAddends(self):
+        a = Alphametic()
+        words = ("SO+MANY+MORE+MEN+SEEM+TO+SAY+THAT+THEY+MAY+SOON+TRY+TO+STAY+AT+HOME+SO+AS+TO+SEE+OR+HEAR+"
+                 "THE+SAME+ONE+MAN+TRY+TO+MEET+THE+TEAM+ON+THE+MOON+AS+HE+HAS+AT+THE+OTHER+TEN")
+        a.AddEquation(words.split("+"), "TESTS")
+        expectedSolution = {"O":1, "S":3, "Y":4, "N":6, "A":7, "M":2, "E":0, "R":8, "T":9, "H":5}
+        self.assertEqual(a.Solution(), expectedSolution)
+        self.assertTrue(a.IsUnique())
+
+    def testEngines(self):
+        for engine in [Alphametic.ENGINE_Z3, Alphametic.ENGINE_NUMPY]:
+            with self.subTest(engine=engine):
+                a = Alphametic(engine=engine)
+                a.AddSum(initial_value="CEYLON", addition="BLACK", result="KETTLE")
+                a.AddKnownLetter("N", 8)
+                a.AddKnownLetter("Y", 2)
+                expectedSolution = {"A":3, "O":1, "B":9, "T":0, "L":7, "K":6, "E":4, "C":5, "Y":2, "N":8}
+                self.assertEqual(a.Solution(), expectedSolution)
+                self.assertEqual(a.lastReport.engine, engine)
+                self.assertTrue(a.IsUnique())
+
+    def testSolutions(self):
+        expected = [{"A":1, "B":2, "C":3}, {"A":2, "B":1, "C":3}]
+        for engine in [Alphametic.ENGINE_Z3, Alphametic.ENGINE_NUMPY]:
+            with self.subTest(engine=engine):
+                a = Alphametic(engine=engine)
+                a.AddEquation(["A", "B"], "C")
+                a.AddKnownLetter("C", 3)
+                solutions = a.Solutions()
+                self.assertEqual(sorted(solutions, key=lambda s: s["A"]), expected)
+                self.assertEqual(len(a.Solutions(limit=1)), 1)
+                self.assertEqual(a.CountSolutions(), 2)
+
+    def testLargeBase(self):
+        # Digits above 127 no longer fit the int8 arrays of the numpy engine
+        for engine in [Alphametic.ENGINE_AUTO, Alphametic.ENGINE_Z3, Alphametic.ENGINE_NUMPY]:
+            with self.subTest(engine=engine):
+                a = Alphametic(base=200, engine=engine)
+                a.AddSum(result="B", initial_value="A", addition=5)
+                a.AddKnownLetter("A", 140)
+                self.assertEqual(a.Solution(), {"A":140, "B":145})
+
+    def testEnginesAgree(self):
+        solutions = {}
+        for engine in [Alphametic.ENGINE_Z3, Alphametic.ENGINE_NUMPY]:
+            a = Alphametic(engine=engine)
+            a.AddDivision(dividend="AB", divisor="C", quotient="D", remainder=1)
+            a.AddProduct(result="EF", initial_value="D", multiplier=3)
+            a.AddKnownLetter("C", 4)
+            solutions[engine] = sorted(tuple(sorted(s.items())) for s in a.Solutions())
+        self.assertEqual(solutions[Alphametic.ENGINE_Z3], solutions[Alphametic.ENGINE_NUMPY])
+        self.assertTrue(solutions[Alphametic.ENGINE_Z3])
+
+    def testSolveAsync(self):
+        a = Alphametic(engine=Alphametic.ENGINE_Z3)
+        a.AddEquation(["SEND", "MORE"], "MONEY")
+        expectedSolution = {"S":9, "E":5, "N":6, "D":7, "M":1, "O":0, "R":8, "Y":2}
+        self.assertEqual(asyncio.run(a.SolveAsync(timeout=30)), expectedSolution)
+
+    def testSolveAsyncTimeout(self):
+        # 26 distinct letters and a long product are far beyond what Z3 solves in a fraction of a second
+        a = Alphametic(base=26, engine=Alphametic.ENGINE_Z3)
+        a.AddProduct(result="ABCDEFGHIJKLM", initial_value="NOPQRST", multiplier="UVWXYZ")
+        a.AddSum(result="ZYXWVUTS", initial_value="RQPONMLK", addition="JIHGFEDC")
+        with self.assertRaises(SolveTimeoutError):
+            asyncio.run(a.SolveAsync(timeout=0.2))
+        # The interrupted check finishes in the background and records an unknown result
+        deadline = time.time() + 10
+        while a.lastReport is None and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(a.lastReport.result, 'unknown')
+
+    def testNoSolution(self):
+        for engine in [Alphametic.ENGINE_Z3, Alphametic.ENGINE_NUMPY]:
+            with self.subTest(engine=engine):
+                a = Alphametic(engine=engine)
+                a.AddEquation(["A", "A"], "A")
+                a.AddEquation(["B", "B"], "C")
+                a.AddKnownLetter("A", 1)
+                with self.assertRaises(NoSolutionError) as raised:
+                    a.Solution()
+                self.assertEqual(a.lastReport.engine, engine)
+                self.assertEqual(a.lastReport.result, 'unsat')
+                self.assertEqual(raised.exception.clues, ["AddEquation(['A', 'A'], 'A')", "AddKnownLetter('A', 1)"])
+
+    def testTooManyLetters(self):
+        a = Alphametic(base=4)
+        a.AddEquation(["AB"], "C")
+        with self.assertRaisesRegex(ValueError, 'More than 4 distinct letters found: ABCDE'):
+            a.AddEquation(["D"], "E")
+        self.assertEqual(list(a.letters), ['A', 'B', 'C'])
+        self.assertEqual(len(a._recipe), 1)
+
+    def testNoGridHints(self):
+        # ForcedCells and NextHint are only offered by the grid puzzles
+        a = Alphametic()
+        self.assertFalse(hasattr(a, 'ForcedCells'))
+        self.assertFalse(hasattr(a, 'NextHint'))
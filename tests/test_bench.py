@@ -0,0 +1,26 @@
+from .context import solvers
+from solvers import bench
+import unittest
+
+class BenchTest(unittest.TestCase):
+    """Tests for the benchmark suite"""
+
+    def testSmallSuite(self):
+        sizes = {'sudoku': [2], 'sudoku-native': [2], 'kenken': [4], 'kenken-table': [4], 'magnets': [4], 'tents': [5], 'alphametic': [3]}
+        results = bench.RunSuite(encodings=['int'], sizes=sizes, timeout=30)
+        self.assertEqual(len(results), 7)
+        for r in results:
+            self.assertEqual(r['result'], 'sat', r['puzzle'])
+            self.assertAlmostEqual(r['total'], r['construct'] + r['check'] + r['extract'])
+
+    def testCompare(self):
+        case = {'puzzle': 'kenken', 'size': 4, 'encoding': 'int', 'seed': 0, 'result': 'sat', 'total': 1.0}
+        slower = dict(case, total=2.0)
+        unknown = dict(case, result='unknown')
+        self.assertEqual(bench.Compare([case], [case]), [])
+        self.assertEqual(bench.Compare([slower], [case]), [(slower, case)])
+        self.assertEqual(bench.Compare([unknown], [case]), [(unknown, case)])
+        self.assertEqual(bench.Compare([case], [slower]), [])
+
+if __name__ == '__main__':
+    unittest.main()
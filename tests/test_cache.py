@@ -0,0 +1,88 @@
+from .context import solvers
+from solvers import Alphametic, KenKen, SolutionCache, Sudoku, ONEHOT_ENCODING
+from .test_sudoku import PUZZLE, SOLUTION
+import os
+import tempfile
+import unittest
+
+# Swaps the first two bands, the last two rows of the last band, the first and last stacks and relabels the digits
+ROWS = [3, 4, 5, 0, 1, 2, 6, 8, 7]
+COLUMNS = [6, 7, 8, 3, 4, 5, 0, 1, 2]
+DIGITS = {1: 4, 2: 7, 3: 1, 4: 9, 5: 2, 6: 3, 7: 8, 8: 6, 9: 5}
+
+def transform(rows):
+    return [[rows[y][x] for x in COLUMNS] for y in ROWS]
+
+class CacheTest(unittest.TestCase):
+    """Tests for the solution cache"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SolutionCache(os.path.join(self.directory.name, 'cache.db'), maxBytes=1024)
+
+    def tearDown(self):
+        self.cache.Close()
+        self.directory.cleanup()
+
+    def testEviction(self):
+        path = os.path.join(self.directory.name, 'small.db')
+        cache = SolutionCache(path, maxBytes=12)
+        # Each entry takes the bytes of its key and JSON solution: 4 and 8 here
+        cache.Put('a', [1])
+        cache.Put('b', {'B': 2})
+        self.assertEqual(cache.StoredBytes(), 12)
+        self.assertEqual(cache.Get('a'), [1])
+        cache.Put('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.StoredBytes(), 6)
+        self.assertIsNone(cache.Get('b'))
+        self.assertEqual(cache.Get('a'), [1])
+        self.assertEqual(cache.Get('c'), 3)
+        # Replacing an entry updates the total, and a large entry evicts as many as it needs
+        cache.Put('a', [1, 2])
+        self.assertEqual(cache.StoredBytes(), 8)
+        cache.Put('d', 'x' * 7)
+        self.assertEqual(cache.StoredBytes(), 10)
+        self.assertEqual(len(cache), 1)
+        cache.Close()
+        # The total is stored with the entries, so another connection shares it
+        cache = SolutionCache(path, maxBytes=12)
+        self.assertEqual(cache.StoredBytes(), 10)
+        self.assertEqual(cache.Get('d'), 'x' * 7)
+        cache.Clear()
+        self.assertEqual(cache.StoredBytes(), 0)
+        cache.Close()
+        with self.assertRaises(ValueError):
+            SolutionCache(path, maxBytes=0)
+
+    def testSudokuSymmetries(self):
+        s = Sudoku.FromString(''.join(PUZZLE))
+        self.assertEqual(s.Solution(cache=self.cache), SOLUTION)
+        self.assertEqual(s.lastReport.engine, Sudoku.ENGINE_NATIVE)
+        puzzle = [''.join(c if c == '.' else str(DIGITS[int(c)]) for c in row) for row in transform(PUZZLE)]
+        t = Sudoku.FromString(''.join(puzzle), engine=Sudoku.ENGINE_Z3, encoding=ONEHOT_ENCODING)
+        expectedSolution = [[DIGITS[v] for v in row] for row in transform(SOLUTION)]
+        self.assertEqual(t.Solution(cache=self.cache), expectedSolution)
+        self.assertEqual(t.lastReport.engine, 'cache')
+        self.assertEqual(len(self.cache), 1)
+
+    def testRecipe(self):
+        first = KenKen(2)
+        first.AddSum(1, (0,1))
+        first.AddCage('-', 1, [(1,0), (1,1)])
+        first.AddProduct(2, (0,0))
+        self.assertEqual(first.Solution(cache=self.cache), [[2, 1], [1, 2]])
+        # The same cages in another order and with another cage encoding
+        second = KenKen(2, cages=KenKen.CAGES_TABLE)
+        second.AddProduct(2, (0,0))
+        second.AddSum(1, (0,1))
+        second.AddCage('-', 1, [(1,0), (1,1)])
+        self.assertEqual(second.Solution(cache=self.cache), [[2, 1], [1, 2]])
+        self.assertEqual(second.lastReport.engine, 'cache')
+        a = Alphametic()
+        a.AddEquation(["SEND", "MORE"], "MONEY")
+        solution = a.Solution(cache=self.cache)
+        b = Alphametic(engine=Alphametic.ENGINE_Z3)
+        b.AddEquation(["SEND", "MORE"], "MONEY")
+        self.assertEqual(b.Solution(cache=self.cache), solution)
+        self.assertEqual(b.lastReport.engine, 'cache')
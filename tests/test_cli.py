@@ -0,0 +1,65 @@
+from .context import solvers
+from solvers import cli
+from .test_sudoku import PUZZLE, SOLUTION
+from .test_gameid import KEEN
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+class CliTest(unittest.TestCase):
+    """Tests for the JSON Lines command-line solver"""
+
+    def testSolveLines(self):
+        lines = [
+            json.dumps({'type': 'sudoku', 'puzzle': ''.join(PUZZLE), 'id': 'a'}),
+            '',
+            json.dumps({'type': 'kenken', 'arguments': {'size': 2},
+                        'recipe': [['AddCage', ['+', 1, [[0,1]]]], ['AddCage', ['-', 1, [[1,0], [1,1]]]],
+                                   ['AddProduct', [2, [0,0]]]]}),
+            json.dumps({'type': 'kenken', 'gameId': KEEN}),
+            'not json',
+            json.dumps({'type': 'tents', 'puzzle': '...'}),
+            json.dumps({'type': 'kenken', 'arguments': {'size': 2}, 'recipe': [['_solve']]}),
+        ]
+        outputs = list(cli.SolveLines(lines, report=True))
+        self.assertEqual([o['id'] for o in outputs], ['a', 3, 4, 5, 6, 7])
+        self.assertEqual(outputs[0]['solution'], SOLUTION)
+        self.assertEqual(outputs[0]['engine'], 'native')
+        self.assertEqual(outputs[1]['solution'], [[2, 1], [1, 2]])
+        self.assertEqual(outputs[1]['report']['result'], 'sat')
+        self.assertEqual(len(outputs[2]['solution']), 5)
+        self.assertTrue(all('error' in o for o in outputs[3:]))
+
+    def testMain(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'puzzles.jsonl')
+            with open(path, 'w') as f:
+                f.write(json.dumps({'type': 'alphametic', 'recipe': [['AddEquation', [['SEND', 'MORE'], 'MONEY']]]}) + '\n')
+            stdout = io.StringIO()
+            with contextlib.redirect_stdout(stdout):
+                status = cli.main(['--cache', os.path.join(directory, 'cache.db'), path, path])
+            self.assertEqual(status, 0)
+            outputs = [json.loads(l) for l in stdout.getvalue().splitlines()]
+            self.assertEqual(outputs[0]['solution']['M'], 1)
+            self.assertEqual(outputs[1]['engine'], 'cache')
+
+    def testLazyImports(self):
+        code = ('import sys, solvers; solvers.Sudoku; '
+                'print("z3" in sys.modules, "solvers.alphametic" in sys.modules, "multiprocessing" in sys.modules)')
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['True', 'False', 'False'])
+        code = 'import sys, solvers; print("z3" in sys.modules)'
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['False'])
+        code = 'from solvers import *; print(Sudoku.__name__, Grid2D.__name__, ONEHOT_ENCODING)'
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['Sudoku', 'Grid2D', 'onehot'])
+
+if __name__ == '__main__':
+    unittest.main()
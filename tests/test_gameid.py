@@ -0,0 +1,87 @@
+from .context import solvers
+from solvers import KenKen, Magnets, Sudoku, Tents, gameid
+from .test_sudoku import PUZZLE, SOLUTION
+import os
+import random
+import tempfile
+import unittest
+
+KEEN = '5:_a__a_4a__b_ba__a__c__a_3,d2s3s2a5m12m12d2a9m5d2s1a5'
+TENTS = '8x8:_ebc_didefajc,2,2,1,1,2,1,1,2,2,1,2,1,3,1,2,0'
+MAGNETS = '5x6:3...1,22..1.,...0.,.2..2.,LRTLRTTBLRBBLRTTTLRBBBLRTLRLRB'
+
+def tentsGameId(treeGrid, columnCounts, rowCounts):
+    """Encodes a Tents game ID as Tents does: runs of up to 25 empty squares, each followed by a tree"""
+    cells = [tree for row in treeGrid for tree in row] + [True]
+    desc = ''
+    run = 0
+    for tree in cells:
+        if tree:
+            desc += chr(ord('a') + run - 1) if run else '_'
+            run = 0
+        else:
+            run += 1
+            if run > 25:
+                desc += 'z'
+                run -= 25
+    counts = ','.join(map(str, columnCounts + rowCounts))
+    return '{}x{}:{},{}'.format(len(treeGrid[0]), len(treeGrid), desc, counts)
+
+class GameIdTest(unittest.TestCase):
+    """Tests for the game ID parsers and puzzle file readers"""
+
+    def testKeen(self):
+        (size, cages) = gameid.ParseKeen(KEEN)
+        self.assertEqual(size, 5)
+        self.assertEqual(cages[:4], [('/', 2, [(0,0), (0,1)]), ('-', 3, [(1,0), (2,0)]),
+                                     ('-', 2, [(3,0), (3,1)]), ('+', 5, [(4,0), (4,1)])])
+        self.assertEqual(cages[7], ('+', 9, [(2,2), (2,3), (2,4)]))
+        k = KenKen.FromGameId(KEEN, cages=KenKen.CAGES_TABLE)
+        self.assertEqual(k.Solution(), [[1,5,2,3,4],[2,3,4,5,1],[4,2,3,1,5],[3,1,5,4,2],[5,4,1,2,3]])
+
+    def testTents(self):
+        (treeGrid, columnCounts, rowCounts) = gameid.ParseTents(TENTS)
+        self.assertEqual([x for x in range(8) if treeGrid[1][x]], [1, 5, 6])
+        self.assertEqual(rowCounts, [2,1,2,1,3,1,2,0])
+        self.assertEqual(Tents.FromGameId(TENTS).Solution()[0], [Tents.TREE, Tents.TENT] + [Tents.EMPTY] * 4 + [Tents.TREE, Tents.TENT])
+
+    def testTentsLongRuns(self):
+        (treeGrid, columnCounts, rowCounts) = gameid.ParseTents('6x5:z_d,0,1,0,0,0,0,0,0,0,1,0')
+        self.assertEqual([(x, y) for y in range(5) for x in range(6) if treeGrid[y][x]], [(1, 4)])
+        rng = random.Random(1)
+        for density in [0.0, 0.02, 0.1]:
+            treeGrid = [[rng.random() < density for x in range(12)] for y in range(9)]
+            gameId = tentsGameId(treeGrid, list(range(12)), list(range(9)))
+            self.assertEqual(gameid.ParseTents(gameId), (treeGrid, list(range(12)), list(range(9))), gameId)
+
+    def testMagnets(self):
+        (columnPlus, columnMinus, rowPlus, rowMinus, pairs, blanks) = gameid.ParseMagnets(MAGNETS)
+        self.assertEqual(columnPlus, [3, None, None, None, 1])
+        self.assertEqual(rowMinus, [None, 2, None, None, 2, None])
+        self.assertEqual(len(pairs), 15)
+        self.assertIn(((2,0), (2,1)), pairs)
+        self.assertEqual(Magnets.FromGameId(MAGNETS).Solution()[0], [1, 2, 1, 0, 0])
+        blank = gameid.ParseMagnets('3x1:...,.,...,.,LR*')
+        self.assertEqual((blank[4], blank[5]), ([((0,0), (1,0))], [(2,0)]))
+        self.assertEqual(Magnets.FromGameId('3x1:1..,.,...,1,LR*').Solution(), [[1, 2, 0]])
+
+    def testInvalid(self):
+        for (parse, gameId) in [(gameid.ParseKeen, '5#1234'), (gameid.ParseKeen, KEEN[:-3]),
+                                (gameid.ParseKeen, KEEN.replace('_3', '_4')), (gameid.ParseTents, TENTS + ',1'),
+                                (gameid.ParseTents, TENTS.replace('j', 'k')), (gameid.ParseMagnets, MAGNETS[:-1]),
+                                (gameid.ParseMagnets, MAGNETS.replace('LRT', 'RLT'))]:
+            with self.assertRaises(ValueError, msg=gameId):
+                parse(gameId)
+
+    def testReadPuzzles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'puzzles.txt')
+            with open(path, 'w', newline='') as f:
+                f.write('# Sudoku corpus\r\n' + ''.join(PUZZLE) + '\r\n\n' + '.' * 81 + '\n' + ''.join(PUZZLE))
+            self.assertEqual(list(gameid.ReadLines(path, chunkSize=7)), [''.join(PUZZLE), '.' * 81, ''.join(PUZZLE)])
+            puzzles = list(gameid.ReadPuzzles(path, Sudoku.FromString))
+            self.assertEqual(len(puzzles), 3)
+            self.assertEqual(puzzles[2].Solution(), SOLUTION)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+from .context import solvers
+from solvers import KenKen, KenKenGenerator, Sudoku, SudokuGenerator
+import unittest
+
+class GeneratorTest(unittest.TestCase):
+    """Tests for the puzzle generators"""
+
+    def testSudoku(self):
+        generator = SudokuGenerator(seed=0)
+        puzzles = [generator.Generate() for i in range(3)]
+        self.assertEqual(len(set(p for (p, solution) in puzzles)), 3)
+        for (puzzle, solution) in puzzles:
+            s = Sudoku.FromString(puzzle)
+            self.assertEqual(s.CountSolutions(limit=2), 1)
+            self.assertEqual(s.Solution(), solution)
+            # Every remaining clue is needed
+            for i in [i for (i, c) in enumerate(puzzle) if c != '.'][:5]:
+                self.assertEqual(Sudoku.FromString(puzzle[:i] + '.' + puzzle[i+1:]).CountSolutions(limit=2), 2)
+
+    def testSudokuEncodings(self):
+        for encoding in ['int', 'bitvec']:
+            (puzzle, solution) = SudokuGenerator(2, encoding, seed=1).Generate()
+            self.assertEqual(Sudoku.FromString(puzzle).CountSolutions(limit=2), 1, encoding)
+
+    def testKenKen(self):
+        for cages in [KenKen.CAGES_TABLE, KenKen.CAGES_ARITHMETIC]:
+            generator = KenKenGenerator(5, cages=cages, seed=0)
+            for i in range(2):
+                (puzzleCages, solution) = generator.Generate()
+                self.assertEqual(sorted(c for (op, target, cells) in puzzleCages for c in cells),
+                                 sorted((x, y) for x in range(5) for y in range(5)))
+                self.assertTrue(all(len(cells) <= generator.maxCage for (op, target, cells) in puzzleCages))
+                k = KenKen(5)
+                for (operation, target, cells) in puzzleCages:
+                    k.AddCage(operation, target, cells)
+                self.assertEqual(k.CountSolutions(limit=2), 1)
+                self.assertEqual(k.Solution(), solution)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,23 @@
 from .context import solvers
-from solvers import KenKen
+from solvers import AddSolveHook, KenKen, KenKenSession, NoSolutionError, RemoveSolveHook, BITVEC_ENCODING, INT_ENCODING, ONEHOT_ENCODING
 import unittest
 
 class KenKenTest(unittest.TestCase):
     """Tests for the Keen solver"""
 
     def test5x5(self):
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            with self.subTest(encoding=encoding):
+                self.check5x5(encoding)
+
+    def testTableCages(self):
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            with self.subTest(encoding=encoding):
+                self.check5x5(encoding, KenKen.CAGES_TABLE)
+
+    def check5x5(self, encoding, cages=None):
         # Create a 5x5 puzzle
-        k = KenKen(5)
+        k = KenKen(5, encoding=encoding, cages=cages)
         k.AddDivision(2, (0,0), (0,1))
         k.AddDivision(2, (1,2), (1,3))
         k.AddDivision(2, (3,3), (4,3))
@@ -21,7 +31,140 @@ class KenKenTest(unittest.TestCase):
         k.AddSum(9, (2,2), (2,3), (2,4))
         k.AddSum(5, (3,4), (4,4))
         expectedSolution = [[1,5,2,3,4],[2,3,4,5,1],[4,2,3,1,5],[3,1,5,4,2],[5,4,1,2,3]]
+        reports = []
+        AddSolveHook(reports.append)
+        try:
+            self.assertEqual(k.Solution(), expectedSolution)
+        finally:
+            RemoveSolveHook(reports.append)
+        self.assertTrue(k.IsUnique())
+        self.assertEqual(reports, [k.lastReport])
+        self.assertEqual(k.lastReport.puzzle, 'KenKen')
+        self.assertEqual(k.lastReport.result, 'sat')
+        self.assertGreater(k.lastReport.check, 0)
+        self.assertGreater(k.lastReport.assertions, 0)
+        self.assertEqual(k.lastReport.variables, 25 * (5 if encoding == ONEHOT_ENCODING else 1))
+        self.assertIn('memory', k.lastReport.statistics)
+
+    def testSession(self):
+        cages = [
+            ('/', 2, [(0,0), (0,1)]),
+            ('/', 2, [(1,2), (1,3)]),
+            ('/', 2, [(3,3), (4,3)]),
+            ('*', 12, [(1,1), (2,1)]),
+            ('*', 5, [(3,2), (4,2)]),
+            ('*', 12, [(0,2), (0,3)]),
+            ('-', 3, [(1,0), (2,0)]),
+            ('-', 2, [(3,0), (3,1)]),
+            ('-', 1, [(0,4), (1,4)]),
+            ('+', 5, [(4,0), (4,1)]),
+            ('+', 9, [(2,2), (2,3), (2,4)]),
+            ('+', 5, [(3,4), (4,4)])]
+        expectedSolution = [[1,5,2,3,4],[2,3,4,5,1],[4,2,3,1,5],[3,1,5,4,2],[5,4,1,2,3]]
+        session = KenKenSession(5)
+        self.assertEqual(session.Solve(cages), expectedSolution)
+        with self.assertRaises(ValueError):
+            session.Solve([('+', 3, [(0,0), (1,0)]), ('+', 3, [(0,1), (1,1)]), ('+', 3, [(0,2), (1,2)])])
+        # Dropping the cages is a change to the clues too, which ForcedCells()
+        # results are keyed on, even though the recipe is back to its old length
+        changes = session.puzzle._clueChanges
+        self.assertEqual(session.Solve(cages), expectedSolution)
+        self.assertEqual(session.puzzle._clueChanges, changes + len(cages) + 1)
+
+    def testForcedCells(self):
+        cages = [
+            ('/', 2, [(0,0), (0,1)]), ('/', 2, [(1,2), (1,3)]), ('/', 2, [(3,3), (4,3)]),
+            ('*', 12, [(1,1), (2,1)]), ('*', 5, [(3,2), (4,2)]), ('*', 12, [(0,2), (0,3)]),
+            ('-', 3, [(1,0), (2,0)]), ('-', 2, [(3,0), (3,1)]), ('-', 1, [(0,4), (1,4)]),
+            ('+', 5, [(4,0), (4,1)]), ('+', 9, [(2,2), (2,3), (2,4)]), ('+', 5, [(3,4), (4,4)])]
+        expectedSolution = [[1,5,2,3,4],[2,3,4,5,1],[4,2,3,1,5],[3,1,5,4,2],[5,4,1,2,3]]
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            with self.subTest(encoding=encoding):
+                k = KenKen(5, encoding)
+                for (operation, target, cells) in cages:
+                    k.AddCage(operation, target, cells)
+                forced = k.ForcedCells()
+                self.assertEqual(forced, dict(((x, y), expectedSolution[y][x]) for y in range(5) for x in range(5)))
+                self.assertEqual(k.NextHint(), ((0, 0), 1))
+                self.assertEqual(k.ForcedCells({(0, 0): 1}), dict((c, v) for (c, v) in forced.items() if c != (0, 0)))
+                with self.assertRaises(NoSolutionError):
+                    k.ForcedCells({(0, 0): 2})
+
+    def testPortfolio(self):
+        k = KenKen(5)
+        k.AddCage('/', 2, [(0,0), (0,1)])
+        k.AddDivision(2, (1,2), (1,3))
+        k.AddDivision(2, (3,3), (4,3))
+        k.AddProduct(12, (1,1), (2,1))
+        k.AddProduct(5, (3,2), (4,2))
+        k.AddProduct(12, (0,2), (0,3))
+        k.AddDifference(3, (1,0), (2,0))
+        k.AddDifference(2, (3,0), (3,1))
+        k.AddDifference(1, (0,4), (1,4))
+        k.AddSum(5, (4,0), (4,1))
+        k.AddSum(9, (2,2), (2,3), (2,4))
+        k.AddCage('+', 5, [(3,4), (4,4)])
+        portfolio = [
+            {'encoding': ONEHOT_ENCODING, 'logic': 'QF_FD'},
+            {'cages': KenKen.CAGES_TABLE, 'seed': 7},
+            {}]
+        expectedSolution = [[1,5,2,3,4],[2,3,4,5,1],[4,2,3,1,5],[3,1,5,4,2],[5,4,1,2,3]]
+        self.assertEqual(k.Solution(portfolio=portfolio, workers=2), expectedSolution)
+        self.assertEqual(k.lastReport.engine, 'portfolio')
+        self.assertEqual(k.lastReport.result, 'sat')
+        self.assertIn(k.lastReport.configuration, portfolio)
+        # The puzzle itself is untouched and still solves in this process
         self.assertEqual(k.Solution(), expectedSolution)
 
+    def testPortfolioNoSolution(self):
+        k = KenKen(2)
+        k.AddSum(3, (0,0), (1,0))
+        k.AddSum(4, (0,1), (1,1))
+        with self.assertRaises(NoSolutionError) as raised:
+            k.Solution(portfolio=[{}, {'encoding': BITVEC_ENCODING}])
+        self.assertEqual(k.lastReport.result, 'unsat')
+        self.assertEqual(raised.exception.clues, ['AddSum(4, (0, 1), (1, 1))'])
+
+    def testCageLayout(self):
+        k = KenKen(3)
+        k.AddSum(3, (0,0), (1,0))
+        with self.assertRaises(ValueError):
+            k.AddCage('+', 4, [(1,0), (2,0)])
+        with self.assertRaises(ValueError):
+            k.AddCage('+', 4, [(2,0), (2,0)])
+        with self.assertRaises(ValueError):
+            k.AddCage('+', 4, [(2,0), (3,0)])
+        self.assertEqual(len(k._recipe), 1)
+        with self.assertRaisesRegex(ValueError, r'Cells not in any cage: \(2, 0\), \(0, 1\)'):
+            k.Solution()
+        self.assertIsNone(k.lastReport)
+
+    def testConflictingCages(self):
+        for cages in [KenKen.CAGES_ARITHMETIC, KenKen.CAGES_TABLE]:
+            with self.subTest(cages=cages):
+                k = KenKen(2, cages=cages)
+                k.AddProduct(2, (0,0))
+                k.AddCage('-', 1, [(0,1), (1,1)])
+                k.AddSum(2, (1,0))
+                with self.assertRaises(NoSolutionError) as raised:
+                    k.Solution()
+                self.assertEqual(raised.exception.clues, ['AddProduct(2, (0, 0))', 'AddSum(2, (1, 0))'])
+        session = KenKenSession(2)
+        with self.assertRaises(NoSolutionError) as raised:
+            session.Solve([('*', 2, [(0,0)]), ('-', 1, [(0,1), (1,1)]), ('+', 2, [(1,0)])])
+        self.assertEqual(raised.exception.clues, ["AddCage('*', 2, [(0, 0)])", "AddCage('+', 2, [(1, 0)])"])
+        self.assertEqual(session.Solve([('*', 2, [(0,0)]), ('-', 1, [(0,1), (1,1)]), ('+', 1, [(1,0)])]),
+                         [[2, 1], [1, 2]])
+
+    def testCageTuples(self):
+        # An L-shaped cage: the corner shares a row and a column with the other two
+        self.assertEqual(solvers.kenken._cageTuples('+', 5, 3, ((0,0), (0,1), (1,0))),
+                         ((1,2,2), (3,1,1)))
+        self.assertEqual(solvers.kenken._cageTuples('*', 6, 4, ((0,0), (1,0))),
+                         ((2,3), (3,2)))
+        self.assertEqual(solvers.kenken._cageTuples('/', 2, 4, ((0,0), (0,1))),
+                         ((1,2), (2,1), (2,4), (4,2)))
+        self.assertEqual(solvers.kenken._cageTuples('-', 5, 4, ((0,0), (0,1))), ())
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,5 @@
 from .context import solvers
-from solvers import Magnets
+from solvers import Magnets, NoSolutionError, BITVEC_ENCODING, INT_ENCODING, ONEHOT_ENCODING
 import unittest
 
 
@@ -7,9 +7,14 @@ class MagnetsTest(unittest.TestCase):
     """Tests for the Keen solver"""
 
     def test6x5(self):
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            with self.subTest(encoding=encoding):
+                self.check6x5(encoding)
+
+    def check6x5(self, encoding):
         # Create a 5x5 puzzle
         m = Magnets([3, None, None, None, 1], [None, None, None, 0, None],
-                    [2, 2, None, None, 1, None], [None, 2, None, None, 2, None])
+                    [2, 2, None, None, 1, None], [None, 2, None, None, 2, None], encoding)
         m.AddPair((0, 0), (1, 0))
         m.AddPair((3, 0), (4, 0))
         m.AddPair((3, 1), (4, 1))
@@ -35,6 +40,36 @@ class MagnetsTest(unittest.TestCase):
             [1, 2, 0, 0, 0],
         ]
         self.assertEqual(m.Solution(), expectedSolution)
+        self.assertTrue(m.IsUnique())
+        forced = m.ForcedCells()
+        self.assertEqual(forced, dict(((x, y), expectedSolution[y][x]) for y in range(6) for x in range(5)))
+        self.assertEqual(m.NextHint(), ((0, 0), expectedSolution[0][0]))
+        with self.assertRaises(NoSolutionError):
+            m.ForcedCells({(0, 0): 0})
+
+    def testForcedCells(self):
+        m = Magnets([None, None], [None, None], [None, None], [None, None])
+        m.AddPair((0, 0), (0, 1))
+        self.assertEqual(m.ForcedCells(), {})
+        self.assertEqual(m.ForcedCells({(0, 0): Magnets.PLUS}), {(0, 1): Magnets.MINUS})
+        # A new clue replaces the result kept for the same assignment
+        m.AddBlank((0, 0))
+        self.assertEqual(m.ForcedCells(), {(0, 0): Magnets.EMPTY, (0, 1): Magnets.EMPTY})
+
+    def testInvalidCounts(self):
+        # Three plus signs by column but four by row
+        with self.assertRaises(ValueError):
+            Magnets([1, 2], [None, None], [2, 2], [None, None])
+        # Three signs in a row of two cells
+        with self.assertRaises(ValueError):
+            Magnets([None, None], [None, None], [2, None], [1, None])
+        m = Magnets([None, None], [None, None], [1, None], [1, None])
+        m.AddPair((0, 0), (0, 1))
+        m.AddBlank((1, 0))
+        with self.assertRaises(NoSolutionError) as raised:
+            m.Solution()
+        self.assertEqual(raised.exception.clues,
+                         ['rowPlusCounts[0] = 1', 'rowMinusCounts[0] = 1', 'AddBlank((1, 0))'])
 
 
 if __name__ == '__main__':
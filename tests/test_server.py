@@ -0,0 +1,73 @@
+from .context import solvers
+from solvers import SolveTimeoutError
+from solvers.server import Serve, SolvePool
+from .test_sudoku import PUZZLE, SOLUTION
+from .test_gameid import KEEN, TENTS
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+class ServerTest(unittest.TestCase):
+    """Tests for the solve server and its worker pool"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = SolvePool(workers=1, warm=[('kenken', 5)], maxSolves=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.Close()
+
+    def testPool(self):
+        kenken = self.pool.Submit({'type': 'kenken', 'gameId': KEEN, 'id': 'k'})
+        self.assertEqual(kenken['id'], 'k')
+        self.assertEqual(kenken['engine'], 'z3')
+        self.assertEqual(self.pool.Submit({'type': 'sudoku', 'puzzle': ''.join(PUZZLE)})['solution'], SOLUTION)
+        self.assertIn('error', self.pool.Submit({'type': 'sudoku', 'puzzle': '11' + '.' * 14}))
+        self.assertEqual(self.pool.Submit({'type': 'kenken', 'gameId': KEEN})['solution'], kenken['solution'])
+        with self.assertRaises(SolveTimeoutError):
+            self.pool.Submit({'type': 'tents', 'gameId': TENTS, 'timeout': 0.001})
+        self.assertEqual(len(self.pool.Submit({'type': 'tents', 'gameId': TENTS})['solution']), 8)
+        stats = self.pool.Stats()
+        self.assertGreaterEqual(stats['recycled'], 1)
+        self.assertGreaterEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['busy'], 0)
+        self.assertEqual(stats['queued'], 0)
+
+    def testBadJobs(self):
+        for timeout in ['5', None, 0, -1, float('inf'), float('nan'), True]:
+            with self.assertRaises(ValueError, msg=repr(timeout)):
+                self.pool.Submit({'type': 'sudoku', 'puzzle': '.' * 81, 'timeout': timeout})
+        # A job the dispatcher cannot send fails on its own and the pool carries on
+        with self.assertRaises(Exception):
+            self.pool.Submit({'type': 'sudoku', 'puzzle': '.' * 81, 'id': lambda: None})
+        self.assertEqual(self.pool.Submit({'type': 'sudoku', 'puzzle': ''.join(PUZZLE), 'timeout': 30})['solution'],
+                         SOLUTION)
+        self.assertEqual(self.pool.Stats()['busy'], 0)
+
+    def testHttp(self):
+        server = Serve(self.pool, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+        try:
+            body = json.dumps({'type': 'kenken', 'gameId': KEEN}).encode('utf-8')
+            with urllib.request.urlopen(url + 'solve', body) as response:
+                self.assertEqual(len(json.load(response)['solution']), 5)
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(url + 'solve', b'[1')
+            self.assertEqual(raised.exception.code, 400)
+            body = json.dumps({'type': 'sudoku', 'puzzle': '.' * 81, 'timeout': '5'}).encode('utf-8')
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(url + 'solve', body)
+            self.assertEqual(raised.exception.code, 400)
+            with urllib.request.urlopen(url + 'stats') as response:
+                self.assertGreaterEqual(json.load(response)['solved'], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
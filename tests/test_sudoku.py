@@ -0,0 +1,320 @@
+from .context import solvers
+from solvers import NoSolutionError, SolveTimeoutError, Sudoku, SudokuSession, BITVEC_ENCODING, INT_ENCODING, ONEHOT_ENCODING
+from solvers import sudoku
+from solvers.sudoku import SolveMany
+from solvers.bitmask import Deduce
+from solvers.bench import SudokuGrid
+import random
+import time
+import unittest
+
+PUZZLE = [
+    "53..7....",
+    "6..195...",
+    ".98....6.",
+    "8...6...3",
+    "4..8.3..1",
+    "7...2...6",
+    ".6....28.",
+    "...419..5",
+    "....8..79"]
+
+SOLUTION = [
+    [5, 3, 4, 6, 7, 8, 9, 1, 2],
+    [6, 7, 2, 1, 9, 5, 3, 4, 8],
+    [1, 9, 8, 3, 4, 2, 5, 6, 7],
+    [8, 5, 9, 7, 6, 1, 4, 2, 3],
+    [4, 2, 6, 8, 5, 3, 7, 9, 1],
+    [7, 1, 3, 9, 2, 4, 8, 5, 6],
+    [9, 6, 1, 5, 3, 7, 2, 8, 4],
+    [2, 8, 7, 4, 1, 9, 6, 3, 5],
+    [3, 4, 5, 2, 8, 6, 1, 7, 9]]
+
+def addClues(s, rows):
+    for y, row in enumerate(rows):
+        for x, c in enumerate(row):
+            if c != '.':
+                s.AddSquare(x, y, int(c))
+
+class SudokuTest(unittest.TestCase):
+    """Tests for the Sudoku solver"""
+
+    def testNativeEngine(self):
+        s = Sudoku(engine=Sudoku.ENGINE_NATIVE)
+        addClues(s, PUZZLE)
+        self.assertEqual(s.Solution(), SOLUTION)
+        self.assertEqual(s.lastReport.engine, Sudoku.ENGINE_NATIVE)
+        self.assertEqual(s.lastReport.result, 'sat')
+
+    def testZ3Engine(self):
+        s = Sudoku(engine=Sudoku.ENGINE_Z3)
+        addClues(s, PUZZLE)
+        self.assertEqual(s.Solution(), SOLUTION)
+
+    def testEncodings(self):
+        for encoding in [BITVEC_ENCODING, ONEHOT_ENCODING]:
+            with self.subTest(encoding=encoding):
+                s = Sudoku(engine=Sudoku.ENGINE_Z3, encoding=encoding)
+                addClues(s, PUZZLE)
+                self.assertEqual(s.Solution(), SOLUTION)
+                t = Sudoku(dimension=2, encoding=encoding)
+                t.AddThermometer([(0,0), (1,0), (2,0), (3,0)])
+                self.assertEqual(t.Solution()[0], [1, 2, 3, 4])
+
+    def testNativeEngineRejectsThermometers(self):
+        s = Sudoku(engine=Sudoku.ENGINE_NATIVE)
+        with self.assertRaises(ValueError):
+            s.AddThermometer([(0,0), (1,0)])
+
+    def testNativeEngineNoSolution(self):
+        s = Sudoku(engine=Sudoku.ENGINE_NATIVE)
+        s.AddSquare(0, 0, 1)
+        s.AddSquare(1, 0, 1)
+        with self.assertRaises(ValueError):
+            s.Solution()
+
+    def testInvalidSquares(self):
+        # Squares off the grid are a mistake by the caller, not an unsolvable puzzle
+        for engine in [Sudoku.ENGINE_NATIVE, Sudoku.ENGINE_Z3]:
+            s = Sudoku(2, engine=engine)
+            for (x, y, val) in [(4, 0, 2), (0, -1, 2), (0, 0, 5), (0, 0, 0)]:
+                with self.assertRaises(ValueError) as raised:
+                    s.AddSquare(x, y, val)
+                self.assertNotIsInstance(raised.exception, NoSolutionError)
+            self.assertEqual(s._recipe, [])
+            self.assertIsNotNone(s.Solution())
+        session = SudokuSession(2)
+        with self.assertRaises(ValueError) as raised:
+            session.Solve([(0, 0, 1), (4, 0, 2)])
+        self.assertNotIsInstance(raised.exception, NoSolutionError)
+
+    def testConflictingClues(self):
+        # Clues that repeat a value in a unit are rejected before either engine runs
+        for engine in [Sudoku.ENGINE_NATIVE, Sudoku.ENGINE_Z3]:
+            s = Sudoku(dimension=2, engine=engine)
+            s.AddSquare(0, 0, 1)
+            s.AddSquare(2, 1, 2)
+            s.AddSquare(1, 1, 1)
+            with self.assertRaises(NoSolutionError) as raised:
+                s.Solution()
+            self.assertEqual(raised.exception.clues, ['AddSquare(0, 0, 1)', 'AddSquare(1, 1, 1)'])
+            self.assertIsNone(s.lastReport)
+        # Z3 finds the clues behind a conflict that no single unit shows: the
+        # first row needs a 3 that its subsquare already has elsewhere
+        s = Sudoku(dimension=2, engine=Sudoku.ENGINE_Z3)
+        for (x, y, val) in [(0, 0, 1), (0, 3, 4), (1, 0, 2), (2, 1, 3), (3, 3, 1)]:
+            s.AddSquare(x, y, val)
+        with self.assertRaises(NoSolutionError) as raised:
+            s.Solution()
+        self.assertEqual(raised.exception.clues, ['AddSquare(0, 0, 1)', 'AddSquare(1, 0, 2)', 'AddSquare(2, 1, 3)'])
+        self.assertEqual(s.lastReport.result, 'unsat')
+        s = Sudoku(dimension=2)
+        s.AddSquare(0, 0, 1)
+        s.AddCage(8, [(0,0), (1,0)])
+        with self.assertRaises(NoSolutionError) as raised:
+            s.Solution()
+        self.assertEqual(raised.exception.clues, ['AddCage(8, [(0, 0), (1, 0)])'])
+
+    def testThermometerUsesZ3(self):
+        s = Sudoku(dimension=2)
+        s.AddThermometer([(0,0), (1,0), (2,0), (3,0)])
+        self.assertEqual(s.Solution()[0], [1, 2, 3, 4])
+
+    def testCountSolutions(self):
+        for engine in [Sudoku.ENGINE_NATIVE, Sudoku.ENGINE_Z3]:
+            with self.subTest(engine=engine):
+                self.assertEqual(Sudoku(dimension=2, engine=engine).CountSolutions(), 288)
+                self.assertEqual(Sudoku(engine=engine).CountSolutions(limit=3), 3)
+                s = Sudoku(engine=engine)
+                addClues(s, PUZZLE)
+                self.assertTrue(s.IsUnique())
+                self.assertEqual(s.Solution(), SOLUTION)
+
+    def testSession(self):
+        swap = str.maketrans('12', '21')
+        puzzle = ''.join(PUZZLE)
+        solution = [[int(str(v).translate(swap)) for v in row] for row in SOLUTION]
+        for encoding in [INT_ENCODING, ONEHOT_ENCODING]:
+            with self.subTest(encoding=encoding):
+                session = SudokuSession(encoding=encoding)
+                self.assertEqual(session.Solve(puzzle), SOLUTION)
+                with self.assertRaises(ValueError):
+                    session.Solve([(0, 0, 1), (1, 0, 1)])
+                self.assertEqual(session.Solve(puzzle.translate(swap)), solution)
+                # Z3 finds the clues behind a conflict that no single unit shows
+                clues = [(x, 0, x + 1) for x in range(8)] + [(8, 5, 9)]
+                with self.assertRaises(NoSolutionError) as raised:
+                    session.Solve(clues + [(0, 8, 5)])
+                self.assertEqual(raised.exception.clues, ['AddSquare({}, {}, {})'.format(*clue) for clue in clues])
+                self.assertEqual(session.Solve(puzzle), SOLUTION)
+        # A check that stops without an answer is not reported as unsolvable
+        session = SudokuSession(4)
+        session.solver.set('timeout', 1)
+        with self.assertRaises(SolveTimeoutError):
+            session.Solve([(0, 0, 1)])
+
+    def testPreprocess(self):
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            s = Sudoku.FromString(''.join(PUZZLE), engine=Sudoku.ENGINE_Z3, encoding=encoding, preprocess=True)
+            self.assertEqual(s.Solution(), SOLUTION, encoding)
+            self.assertEqual(s.lastReport.resolved, 81 - 30)
+        # Deductions keep every digit of the solution of a sparse 16x16 grid
+        rng = random.Random(4)
+        grid = SudokuGrid(4, rng)
+        clues = [(x, y, grid[y][x]) for y in range(16) for x in range(16) if rng.random() < 0.4]
+        candidates = Deduce(4, clues)
+        self.assertTrue(all(candidates[y * 16 + x] >> (grid[y][x] - 1) & 1 for y in range(16) for x in range(16)))
+        self.assertIsNone(Deduce(3, [(0, 0, 1), (8, 0, 1)]))
+        s = Sudoku(2, preprocess=True)
+        s.AddSquare(0, 0, 1)
+        s.AddSquare(1, 1, 1)
+        self.assertRaises(ValueError, s.Solution)
+        # Deductions that rule the grid out still report the clues they came
+        # from: the first row leaves no room for the 9 in its last column
+        clues = [(x, 0, x + 1) for x in range(8)] + [(8, 5, 9)]
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            s = Sudoku(3, engine=Sudoku.ENGINE_Z3, encoding=encoding, preprocess=True)
+            for (x, y, val) in clues + [(0, 8, 5)]:
+                s.AddSquare(x, y, val)
+            with self.assertRaises(NoSolutionError) as raised:
+                s.Solution()
+            self.assertEqual(raised.exception.clues, ['AddSquare({}, {}, {})'.format(*clue) for clue in clues])
+        # Variant constraints still apply on top of the deductions
+        counts = []
+        for preprocess in [False, True]:
+            s = Sudoku(2, preprocess=preprocess)
+            s.AddSquare(0, 0, 1)
+            s.AddThermometer([(1, 0), (0, 1)])
+            s.AddSquare(3, 3, 1)
+            counts.append(s.CountSolutions())
+            self.assertLess(s.Solution()[0][1], s.Solution()[1][0])
+        self.assertEqual(counts[0], counts[1])
+
+    def testKillerCages(self):
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            s = Sudoku(2, encoding=encoding)
+            s.AddSquare(0, 0, 1)
+            for (total, cells) in [(3, [(0,0), (1,0)]), (7, [(2,0), (3,0)]), (5, [(0,1), (0,2)]), (5, [(1,1), (1,2)]),
+                                   (3, [(2,1), (3,1)]), (6, [(2,2), (2,3)]), (4, [(3,2), (3,3)]), (7, [(0,3), (1,3)])]:
+                s.AddCage(total, cells)
+            self.assertEqual(s.Solution(), [[1,2,3,4], [3,4,1,2], [2,1,4,3], [4,3,2,1]], encoding)
+            self.assertTrue(s.IsUnique())
+        self.assertEqual(sudoku._cageCombinations(10, 3, 9), ((1,2,7), (1,3,6), (1,4,5), (2,3,5)))
+        self.assertEqual(sudoku._cageCombinations(5, 3, 9), ())
+        s = Sudoku(2)
+        s.AddCage(8, [(0,0), (1,0)])
+        self.assertRaises(ValueError, s.Solution)
+
+    def testArrows(self):
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            s = Sudoku(2, encoding=encoding)
+            s.AddArrow((0,0), [(1,0), (0,1)])
+            s.AddArrow((3,3), [(3,1), (3,2)])
+            for solution in [s.Solution()]:
+                self.assertEqual(solution[0][0], solution[0][1] + solution[1][0])
+                self.assertEqual(solution[3][3], solution[1][3] + solution[2][3])
+        s = Sudoku(2)
+        s.AddArrow((0,0), [(1,0), (2,0), (3,0)])
+        self.assertRaises(ValueError, s.Solution)
+        # Digits along an arrow may repeat, unless its cells all see each other
+        self.assertEqual(sudoku._arrowTable(3, 4), {3: ((1, 1, 1),), 4: ((1, 1, 2),)})
+        self.assertEqual(sudoku._arrowTable(3, 9, True)[8], ((1, 2, 5), (1, 3, 4)))
+        self.assertNotIn(5, sudoku._arrowTable(3, 9, True))
+        # A small circle leaves only the digits of its own combinations
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            s = Sudoku(3, engine=Sudoku.ENGINE_Z3, encoding=encoding)
+            s.AddSquare(0, 0, 3)
+            s.AddArrow((0,0), [(1,1), (2,2)])
+            solution = s.Solution()
+            self.assertEqual(sorted([solution[1][1], solution[2][2]]), [1, 2])
+            s.AddSquare(1, 1, 4)
+            self.assertRaises(NoSolutionError, s.Solution)
+
+    def testThermometerDomains(self):
+        s = Sudoku(3)
+        s.AddThermometer([(0,0), (1,1), (2,2), (3,3), (4,4), (5,5), (6,6), (7,7)])
+        solution = s.Solution()
+        self.assertEqual([solution[i][i] for i in range(8)], sorted(solution[i][i] for i in range(8)))
+        self.assertLessEqual(solution[0][0], 2)
+        # Tightened domains alone rule out a thermometer longer than the grid
+        s = Sudoku(2)
+        s.AddMultiThermometer([[(0,0), (1,0), (2,0), (3,0), (3,1)]])
+        self.assertRaises(ValueError, s.Solution)
+
+    def testForcedCells(self):
+        empty = [(x, y) for y in range(9) for x in range(9) if PUZZLE[y][x] == '.']
+        for encoding in [INT_ENCODING, BITVEC_ENCODING, ONEHOT_ENCODING]:
+            with self.subTest(encoding=encoding):
+                s = Sudoku.FromString(''.join(PUZZLE), encoding=encoding)
+                self.assertEqual(s.ForcedCells(), dict(((x, y), SOLUTION[y][x]) for (x, y) in empty))
+                self.assertEqual(s.NextHint(), ((2, 0), SOLUTION[0][2]))
+                assignment = {(2, 0): SOLUTION[0][2], (3, 0): SOLUTION[0][3]}
+                self.assertEqual(len(s.ForcedCells(assignment)), len(empty) - 2)
+                self.assertEqual(s.NextHint(), ((5, 0), SOLUTION[0][5]))
+                # The hints are found on a copy, so the puzzle still solves natively
+                self.assertEqual(s.Solution(), SOLUTION)
+                self.assertEqual(s.lastReport.engine, Sudoku.ENGINE_NATIVE)
+                with self.assertRaises(NoSolutionError):
+                    s.ForcedCells({(2, 0): SOLUTION[0][3]})
+                with self.assertRaises(ValueError):
+                    s.ForcedCells({(2, 0): 10})
+        # A unique solution from the native engine forces every open cell, even
+        # on a puzzle that is hard for Z3 under the default encoding
+        hard = '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..'
+        s = Sudoku.FromString(hard)
+        started = time.perf_counter()
+        forced = s.ForcedCells()
+        self.assertLess(time.perf_counter() - started, 0.5)
+        solution = s.Solution()
+        self.assertEqual(forced, dict(((i % 9, i // 9), solution[i // 9][i % 9]) for i in range(81) if hard[i] == '.'))
+        self.assertEqual(s.lastReport.engine, Sudoku.ENGINE_NATIVE)
+        # The clues that rule out an entry or the whole puzzle are reported
+        s = Sudoku(2)
+        s.AddSquare(0, 0, 1)
+        with self.assertRaisesRegex(NoSolutionError, 'with this assignment') as raised:
+            s.ForcedCells({(1, 0): 1})
+        self.assertEqual(raised.exception.clues, ['AddSquare(0, 0, 1)'])
+        s.AddSquare(1, 1, 1)
+        with self.assertRaises(NoSolutionError) as raised:
+            s.ForcedCells()
+        self.assertEqual(raised.exception.clues, ['AddSquare(0, 0, 1)', 'AddSquare(1, 1, 1)'])
+        # Entries force only what follows from them on an empty grid, and a
+        # new clue replaces the result kept for the same entries
+        for engine in [Sudoku.ENGINE_NATIVE, Sudoku.ENGINE_Z3]:
+            with self.subTest(engine=engine):
+                s = Sudoku(2, engine=engine)
+                forced = s.ForcedCells({(0, 0): 1, (1, 0): 2, (0, 1): 3})
+                self.assertEqual(forced[(1, 1)], 4)
+                self.assertNotIn((0, 0), forced)
+                self.assertNotIn((3, 3), forced)
+                self.assertNotIn((3, 0), forced)
+                s.AddSquare(2, 0, 3)
+                forced = s.ForcedCells({(0, 0): 1, (1, 0): 2, (0, 1): 3})
+                self.assertEqual(forced[(3, 0)], 4)
+                self.assertNotIn((2, 0), forced)
+                self.assertEqual(s.NextHint(), ((3, 0), 4))
+
+    def testFromString(self):
+        s = Sudoku.FromString(''.join(PUZZLE))
+        self.assertEqual(s.SolutionString(), ''.join(''.join(map(str, row)) for row in SOLUTION))
+
+    def testPortfolio(self):
+        s = Sudoku.FromString(''.join(PUZZLE))
+        portfolio = [{'engine': Sudoku.ENGINE_NATIVE}, {'engine': Sudoku.ENGINE_Z3, 'encoding': ONEHOT_ENCODING}]
+        self.assertEqual(s.Solution(portfolio=portfolio), SOLUTION)
+        self.assertIn(s.lastReport.configuration, portfolio)
+        t = Sudoku(dimension=2)
+        t.AddThermometer([(0,0), (1,0), (2,0), (3,0)])
+        self.assertEqual(t.Solution(portfolio=[{'logic': 'QF_FD', 'seed': 1}])[0], [1, 2, 3, 4])
+
+    def testSolveMany(self):
+        puzzle = ''.join(PUZZLE)
+        solution = ''.join(''.join(map(str, row)) for row in SOLUTION)
+        puzzles = [puzzle, '', '11' + '.' * 79, puzzle.replace('.', '0')]
+        expected = [(0, solution), (1, None), (2, solution)]
+        self.assertEqual(list(SolveMany(iter(puzzles), workers=0)), expected)
+        self.assertEqual(list(SolveMany(iter(puzzles), workers=2, chunksize=1)), expected)
+        self.assertEqual(sorted(SolveMany(iter(puzzles), workers=2, ordered=False, chunksize=1)), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,58 @@
 from .context import solvers
-from solvers import Tents
+from solvers import NoSolutionError, Tents
+import random
+import time
 import unittest
 
+def isValidSolution(treeGrid, columnCounts, rowCounts, solution):
+    """Checks a Tents solution against the rules directly, independently of the solver"""
+    (width, height) = (len(columnCounts), len(rowCounts))
+    cells = [(x, y) for y in range(height) for x in range(width)]
+    if any((solution[y][x] == Tents.TREE) != treeGrid[y][x] for (x, y) in cells):
+        return False
+    tents = [(x, y) for (x, y) in cells if solution[y][x] == Tents.TENT]
+    if any(max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 for a in tents for b in tents):
+        return False
+    if any(n is not None and sum(solution[y][x] == Tents.TENT for y in range(height)) != n
+           for (x, n) in enumerate(columnCounts)):
+        return False
+    if any(n is not None and row.count(Tents.TENT) != n for (row, n) in zip(solution, rowCounts)):
+        return False
+    # Match tents to adjacent trees one to one with augmenting paths
+    owner = {}
+    def assign(tree, seen):
+        for tent in [(tree[0] - 1, tree[1]), (tree[0] + 1, tree[1]), (tree[0], tree[1] - 1), (tree[0], tree[1] + 1)]:
+            if tent in tents and tent not in seen:
+                seen.add(tent)
+                if tent not in owner or assign(owner[tent], seen):
+                    owner[tent] = tree
+                    return True
+        return False
+    trees = [(x, y) for (x, y) in cells if treeGrid[y][x]]
+    return len(trees) == len(tents) and all(assign(tree, set()) for tree in trees)
+
+def randomPuzzle(width, height, rng):
+    """Returns (treeGrid, columnCounts, rowCounts) for a solvable puzzle with tents placed at random"""
+    solution = [[Tents.EMPTY] * width for y in range(height)]
+    cells = [(x, y) for y in range(height) for x in range(width)]
+    rng.shuffle(cells)
+    for (x, y) in cells:
+        if solution[y][x] != Tents.EMPTY or any(solution[y + dy][x + dx] == Tents.TENT
+                for dy in (-1, 0, 1) for dx in (-1, 0, 1) if 0 <= x + dx < width and 0 <= y + dy < height):
+            continue
+        spots = [(x + dx, y + dy) for (dx, dy) in [(-1, 0), (1, 0), (0, -1), (0, 1)]
+                 if 0 <= x + dx < width and 0 <= y + dy < height and solution[y + dy][x + dx] == Tents.EMPTY]
+        if spots and rng.random() < 0.5:
+            (tx, ty) = rng.choice(spots)
+            solution[y][x] = Tents.TENT
+            solution[ty][tx] = Tents.TREE
+    treeGrid = [[v == Tents.TREE for v in row] for row in solution]
+    columnCounts = [sum(row[x] == Tents.TENT for row in solution) for x in range(width)]
+    rowCounts = [row.count(Tents.TENT) for row in solution]
+    return (treeGrid, columnCounts, rowCounts)
+
 class TentsTest(unittest.TestCase):
-    """Tests for the Keen solver"""
+    """Tests for the Tents solver"""
 
     def test8x8(self):
         # Create a 5x5 puzzle
@@ -33,6 +82,90 @@ class TentsTest(unittest.TestCase):
             [TENT, TREE, EMPTY, EMPTY, TENT, EMPTY, EMPTY, EMPTY],
             [EMPTY, EMPTY, EMPTY, EMPTY, TREE, EMPTY, EMPTY, EMPTY]]
         self.assertEqual(t.Solution(), expectedSolution)
+        forced = t.ForcedCells()
+        self.assertEqual(len(forced), 64 - t.treeCount)
+        self.assertTrue(all(expectedSolution[y][x] == v for ((x, y), v) in forced.items()))
+        self.assertEqual(t.NextHint(), ((1, 0), TENT))
+
+    def testInvalidCounts(self):
+        trees = [[True, False, False], [False, False, True]]
+        # Two trees, so two tents
+        with self.assertRaises(ValueError):
+            Tents(trees, [1, 1, 1], [None, None])
+        # Tents cannot touch, so three cells hold at most two
+        with self.assertRaises(ValueError):
+            Tents(trees, [None, None, None], [3, None])
+        with self.assertRaises(ValueError):
+            Tents(trees, [None, None], [None, None])
+        # With no tents in the top row, the trees' tents would touch
+        t = Tents(trees, [None, None, None], [0, None])
+        with self.assertRaises(NoSolutionError) as raised:
+            t.Solution()
+        self.assertEqual(raised.exception.clues, ['treeGrid[0][0]', 'treeGrid[1][2]', 'rowCounts[0] = 0'])
+        # Column counts are tracked the same way
+        t = Tents(trees, [0, None, None], [None, None])
+        with self.assertRaises(NoSolutionError) as raised:
+            t.Solution()
+        self.assertEqual(raised.exception.clues, ['treeGrid[0][0]', 'treeGrid[1][2]', 'columnCounts[0] = 0'])
+        with self.assertRaises(ValueError):
+            Tents(trees, [-1, None, None], [None, None])
+        # Half of a line, rounded up, is allowed
+        Tents([[True, False, False], [False, False, False], [False, True, False]], [None, None, None], [None, 2, None])
+
+    def testMatching(self):
+        TREE = Tents.TREE
+        TENT = Tents.TENT
+        EMPTY = Tents.EMPTY
+        # Two trees cannot share the tent between them
+        t = Tents([[True, False, True]], [None, None, None], [None])
+        with self.assertRaises(NoSolutionError) as raised:
+            t.Solution()
+        self.assertEqual(raised.exception.clues, ['treeGrid[0][0]', 'treeGrid[0][2]'])
+        # With room below, each tree gets its own tent, apart from the other
+        t = Tents([[True, False, True], [False, False, False]], [None, None, None], [None, None])
+        self.assertEqual(t.Solution(), [[TREE, EMPTY, TREE], [TENT, EMPTY, TENT]])
+        self.assertTrue(t.IsUnique())
+        # A tent can only stand next to a tree that owns it
+        t = Tents([[True, False, False, False]], [None, None, None, None], [None])
+        self.assertEqual(t.Solution(), [[TREE, TENT, EMPTY, EMPTY]])
+        self.assertTrue(t.IsUnique())
+
+    def testNoTouching(self):
+        # The only tents these trees could have touch diagonally
+        t = Tents([[True, False], [False, True]], [None, None], [None, None])
+        with self.assertRaises(NoSolutionError) as raised:
+            t.Solution()
+        self.assertEqual(raised.exception.clues, ['treeGrid[0][0]', 'treeGrid[1][1]'])
+        # Side by side tents touch too
+        t = Tents([[True, False, False, True]], [None, None, None, None], [None])
+        with self.assertRaises(NoSolutionError) as raised:
+            t.Solution()
+        self.assertEqual(raised.exception.clues, ['treeGrid[0][0]', 'treeGrid[0][3]'])
+        # Tents touching only each other's trees are fine
+        t = Tents([[True, False, True, False]], [None, None, None, None], [None])
+        self.assertEqual(t.Solution(), [[Tents.TREE, Tents.TENT, Tents.TREE, Tents.TENT]])
+        self.assertTrue(t.IsUnique())
+
+    def testGameId(self):
+        # The earlier encoding had no count or touching constraints and solved
+        # this with no tents at all
+        t = Tents.FromGameId('3x2:_d_,1,0,1,1,1')
+        solution = t.Solution()
+        self.assertEqual(solution, [[Tents.TREE, Tents.EMPTY, Tents.TENT], [Tents.TENT, Tents.EMPTY, Tents.TREE]])
+        self.assertTrue(isValidSolution([[True, False, False], [False, False, True]], [1, 0, 1], [1, 1], solution))
+        self.assertTrue(t.IsUnique())
+        self.assertFalse(isValidSolution([[True, False, False], [False, False, True]], [1, 0, 1], [1, 1],
+                                         [[Tents.TREE, Tents.EMPTY, Tents.EMPTY], [Tents.EMPTY, Tents.EMPTY, Tents.TREE]]))
+
+    def testLargeGrid(self):
+        rng = random.Random(8)
+        (treeGrid, columnCounts, rowCounts) = randomPuzzle(30, 30, rng)
+        self.assertGreater(sum(map(sum, treeGrid)), 100)
+        started = time.perf_counter()
+        t = Tents(treeGrid, columnCounts, rowCounts)
+        solution = t.Solution()
+        self.assertLess(time.perf_counter() - started, 15)
+        self.assertTrue(isValidSolution(treeGrid, columnCounts, rowCounts, solution))
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
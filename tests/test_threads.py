@@ -0,0 +1,40 @@
+from .context import solvers
+from solvers import KenKen, Sudoku, Tents
+from solvers.threads import SolveThreaded
+from .test_sudoku import PUZZLE, SOLUTION
+from .test_gameid import KEEN, TENTS
+from z3 import Context, main_ctx
+import unittest
+
+class ThreadsTest(unittest.TestCase):
+    """Tests for per-puzzle Z3 contexts and the thread pool"""
+
+    def testContext(self):
+        ctx = Context()
+        s = Sudoku.FromString(''.join(PUZZLE), engine=Sudoku.ENGINE_Z3, ctx=ctx)
+        self.assertEqual(s.Solution(), SOLUTION)
+        self.assertIs(s.solver.ctx, ctx)
+        self.assertIs(s.grid[(0,0)].ctx, ctx)
+        self.assertNotIn('ctx', s._arguments)
+        k = KenKen.FromGameId(KEEN, ctx=ctx)
+        self.assertEqual(k.Solution(), KenKen.FromGameId(KEEN).Solution())
+        self.assertIs(k.solver.ctx, ctx)
+        self.assertIs(Sudoku(2).solver.ctx, main_ctx())
+
+    def testSolveThreaded(self):
+        puzzle = ''.join(PUZZLE)
+        build = lambda p, ctx: Sudoku.FromString(p, engine=Sudoku.ENGINE_Z3, ctx=ctx)
+        puzzles = [puzzle, '11' + '.' * 79, puzzle] * 3
+        expected = [(i, None if i % 3 == 1 else SOLUTION) for i in range(len(puzzles))]
+        self.assertEqual(list(SolveThreaded(iter(puzzles), build, workers=2)), expected)
+        self.assertEqual(sorted(SolveThreaded(iter(puzzles), build, workers=3, ordered=False),
+                                key=lambda r: r[0]), expected)
+        self.assertEqual(list(SolveThreaded([puzzle], workers=1)), [(0, SOLUTION)])
+
+    def testSolveThreadedGameIds(self):
+        tents = Tents.FromGameId(TENTS).Solution()
+        build = lambda gameId, ctx: Tents.FromGameId(gameId, ctx=ctx)
+        self.assertEqual(list(SolveThreaded([TENTS] * 4, build, workers=4)), [(i, tents) for i in range(4)])
+
+if __name__ == '__main__':
+    unittest.main()
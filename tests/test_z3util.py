@@ -0,0 +1,44 @@
+from .context import solvers
+from solvers import Grid2D, Z3IntDict2D
+import unittest
+
+class Z3UtilTest(unittest.TestCase):
+    """Tests for the Z3 helpers"""
+
+    def testGrid2D(self):
+        grid = Grid2D(3, 2, list(range(6)))
+        self.assertEqual(grid[(2, 1)], 5)
+        self.assertEqual(list(grid.keys())[:4], [(0, 0), (1, 0), (2, 0), (0, 1)])
+        self.assertEqual(list(grid.items())[4], ((1, 1), 4))
+        self.assertEqual(list(grid.Row(1)), [3, 4, 5])
+        self.assertEqual(list(grid.Column(2)), [2, 5])
+        self.assertEqual(list(grid.Box(1, 0, 2, 2)), [1, 2, 4, 5])
+        self.assertEqual(grid.Column(1)[1], 4)
+        self.assertEqual(len(grid.Row(0)), 3)
+        grid[(0, 1)] = 9
+        self.assertEqual(list(grid.Column(0)), [0, 9])
+        self.assertIn((2, 1), grid)
+        self.assertNotIn((3, 0), grid)
+        for cell in [(3, 0), (0, 2), (-1, 0)]:
+            with self.assertRaises(IndexError):
+                grid[cell]
+        with self.assertRaises(IndexError):
+            grid.Box(2, 0, 2, 1)
+        with self.assertRaises(ValueError):
+            Grid2D(2, 2, [1])
+
+    def testNeighbors(self):
+        grid = Grid2D(3, 3, [None] * 9)
+        self.assertEqual(sorted(grid.Neighbors((0, 0))), [(0, 1), (1, 0)])
+        self.assertEqual(sorted(grid.Neighbors((0, 0), diagonal=True)), [(0, 1), (1, 0), (1, 1)])
+        self.assertEqual(len(grid.Neighbors((1, 1), diagonal=True)), 8)
+
+    def testZ3IntDict2D(self):
+        grid = Z3IntDict2D(2, 3, 'g')
+        self.assertEqual(len(grid), 6)
+        self.assertEqual(str(grid[(1, 2)]), 'g-1-2')
+        with self.assertRaises(IndexError):
+            grid[(2, 0)]
+
+if __name__ == '__main__':
+    unittest.main()